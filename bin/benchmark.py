@@ -0,0 +1,154 @@
+import argparse
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, datetime, timedelta
+from itertools import product
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from gainly.dtypes import DTYPES
+from gainly.loader import load_csv_files
+from gainly.portfolio import PortfolioPerformance
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+from gainly.validation import set_validation_mode
+
+STAGES = ('construct', 'daily_positions', 'daily_valuations', 'positions', 'get_irr', 'returns', 'load_csv')
+# The keys that identify a measurement across runs:
+KEYS = ('stage', 'engine', 'symbols', 'years', 'trades_per_day', 'brokers', 'seed', 'validation', 'dtypes')
+ANCHOR = date(2025, 1, 1)
+
+
+def anchor(seed: int) -> date:
+    """Returns the last day of the synthetic ledgers and quotes of a seed, so that runs on different days (or
+    commits) measure the same data."""
+    return ANCHOR + timedelta(days=seed)
+
+
+def measure(fn: Callable[[], object], repeat: int) -> dict:
+    """Returns the wall times of `repeat` runs and the peak traced memory of one additional run."""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': median(times), 'seconds_min': min(times), 'peak_bytes': peak}
+
+
+def stage(name: str, txns: pd.DataFrame, prices: pd.DataFrame, fetcher: SyntheticQuoteFetcher, engine: str,
+          workdir: Path, dtypes: str = 'object') -> Callable[[], object]:
+    """Returns a callable that runs the named stage from scratch."""
+    if name == 'construct':
+        return lambda: PortfolioPerformance(txns, fetcher, engine=engine, dtypes=dtypes)
+    if name == 'load_csv':
+        csv = workdir / 'ledger.csv'
+        txns.to_csv(csv, index=False, date_format='%Y-%m-%d %H:%M:%S')
+        return lambda: load_csv(csv, workdir / f'{perf_counter()}.db')
+
+    def run():
+        portfolio = PortfolioPerformance(txns, fetcher, engine=engine, dtypes=dtypes)
+        portfolio.eod_prices = prices
+        return getattr(portfolio, name)()
+    return run
+
+
+def load_csv(csv: Path, db: Path):
+    conn = sqlite3.connect(db)
+    try:
+        load_csv_files([str(csv)], conn)
+    finally:
+        conn.close()
+        db.unlink(missing_ok=True)
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit or None,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine()}
+
+
+def compare(results: list[dict], baseline: list[dict]):
+    """Prints the ratio of every result's median time and peak memory to the matching baseline result."""
+    base = {tuple(r.get(k) for k in KEYS): r for r in baseline}
+    for r in results:
+        if (b := base.get(tuple(r[k] for k in KEYS))) is not None:
+            print(f'{r["stage"]:>16} {r["engine"]:>6} {r["symbols"]:>5} symbols {r["years"]:>3} years: '
+                  f'time {r["seconds"] / b["seconds"]:6.2f}x  memory {r["peak_bytes"] / max(b["peak_bytes"], 1):6.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the valuation pipeline on synthetic ledgers.')
+    parser.add_argument('--symbols', default='10,100', help='comma separated numbers of symbols')
+    parser.add_argument('--years', default='1,5', help='comma separated numbers of years of history')
+    parser.add_argument('--trades-per-day', default='1,10', help='comma separated average trades per day')
+    parser.add_argument('--brokers', default='2', help='comma separated numbers of brokers')
+    parser.add_argument('--engine', default='pandas,numpy', help='comma separated valuation engines')
+    parser.add_argument('--stage', default=','.join(STAGES), help='comma separated stages to benchmark')
+    parser.add_argument('--validation', default='full', help='the validation mode')
+    parser.add_argument('--dtypes', default='object', choices=DTYPES, help='the representation of the frames')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the synthetic ledgers and quotes')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of timed runs per measurement')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='a json file of earlier results to compare against')
+    args = parser.parse_args()
+
+    set_validation_mode(args.validation)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for symbols, years, tpd, brokers in product(map(int, args.symbols.split(',')),
+                                                    map(float, args.years.split(',')),
+                                                    map(float, args.trades_per_day.split(',')),
+                                                    map(int, args.brokers.split(','))):
+            fetcher = SyntheticQuoteFetcher(args.seed)
+            end = anchor(args.seed)
+            txns = synthetic_ledger(symbols, years, tpd, brokers, seed=args.seed, quote_fetcher=fetcher,
+                                    start=end - timedelta(days=round(years * 365)))
+            # Up to the anchor rather than today, like the ledger:
+            prices = fetcher.get_eod_prices_many(txns['symbol'].unique(), txns['trade_date'].min().date(), end)
+            for name, engine in product(args.stage.split(','), args.engine.split(',')):
+                if name == 'load_csv' and engine != args.engine.split(',')[0]:
+                    continue    # independent of the engine
+                result = {'stage': name, 'engine': engine, 'symbols': symbols, 'years': years,
+                          'trades_per_day': tpd, 'brokers': brokers, 'seed': args.seed,
+                          'validation': args.validation, 'dtypes': args.dtypes,
+                          'trades': len(txns), 'quotes': len(prices),
+                          **measure(stage(name, txns, prices, fetcher, engine, Path(workdir), args.dtypes),
+                                     args.repeat)}
+                print(f'{name:>16} {engine:>6} {symbols:>5} symbols {years:>4} years {tpd:>5} trades/day: '
+                      f'{result["seconds"]:8.3f}s {result["peak_bytes"] / 2**20:9.1f}MiB', file=sys.stderr)
+                results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+
+
+if __name__ == '__main__':
+    main()
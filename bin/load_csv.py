@@ -1,25 +1,27 @@
 import argparse
+import glob
 import sqlite3
 
-import pandas as pd
-from pandera.typing.pandas import DataFrame
-
-from gainly.portfolio import TransactionSchema
+from gainly.loader import load_csv_files
 
 
 def main():
     parser = argparse.ArgumentParser(description='Load csv files contain trade reports into the database.')
     parser.add_argument('--db', help='the target sqlite3 database file', default='db/transactions.db')
-    parser.add_argument('csv', help='a local csv file')
+    parser.add_argument('--chunksize', type=int, default=100_000, help='the number of rows to load at a time')
+    parser.add_argument('--update', action='store_true',
+                        help='overwrite transactions that are already in the database instead of skipping them')
+    parser.add_argument('csv', nargs='+', help='local csv files or glob patterns')
     args = parser.parse_args()
 
-    # Load the csv file and validate its contents against the TransactionSchema:
-    df = (pd.read_csv(args.csv, parse_dates=['trade_date'], date_format='%Y-%m-%d %H:%M:%S')
-            .pipe(DataFrame[TransactionSchema]))
-
-    with sqlite3.connect(args.db) as conn:
-        num = df.to_sql('txn', conn, if_exists='append', index=False)
-        print(f'Inserted {num} rows.')
+    paths = [path for pattern in args.csv for path in (sorted(glob.glob(pattern)) or [pattern])]
+    conn = sqlite3.connect(args.db)
+    try:
+        stats = load_csv_files(paths, conn, args.chunksize, 'update' if args.update else 'skip')
+    finally:
+        conn.close()
+    print(f'Inserted {stats.inserted} rows, skipped {stats.skipped} existing rows, '
+          f'rejected {stats.rejected} invalid rows.')
 
 
 if __name__ == '__main__':
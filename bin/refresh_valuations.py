@@ -0,0 +1,42 @@
+import argparse
+import sqlite3
+from datetime import timedelta
+
+from gainly.cache import CachingQuoteFetcher
+from gainly.fx import QuoteFXFetcher
+from gainly.materialized import refresh_valuations
+from gainly.yahoo import YahooFinance
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bring the materialized daily valuations up to date with the ledger.')
+    parser.add_argument('--db', help='the sqlite3 database file with the ledger', default='db/transactions.db')
+    parser.add_argument('--engine', default='pandas', help='the valuation engine: pandas or numpy')
+    parser.add_argument('--currency', help='the base currency to value the portfolio in')
+    parser.add_argument('--no-eod', action='store_true', help='value positions at trade prices only')
+    parser.add_argument('--full', action='store_true', help='recompute all valuations instead of extending them')
+    parser.add_argument('--evict-days', type=int, default=90,
+                        help='drop the cached quotes of symbols that were not requested in this many days (0 to keep '
+                             'them)')
+    args = parser.parse_args()
+
+    # The quotes are cached in the same database:
+    quote_fetcher = CachingQuoteFetcher(YahooFinance(), args.db)
+    conn = sqlite3.connect(args.db)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        stats = refresh_valuations(conn, None if args.no_eod else quote_fetcher, args.engine, args.full,
+                                   args.currency, QuoteFXFetcher(quote_fetcher))
+    finally:
+        conn.close()
+    print(f'{"Rebuilt" if stats.full else "Extended"} the daily valuations with {stats.rows} rows, '
+          f'final up to {stats.as_of}.')
+
+    # The quotes of the ledger's symbols were just requested, unless --no-eod is set:
+    if args.evict_days and (evicted := quote_fetcher.evict(timedelta(days=args.evict_days))):
+        quote_fetcher.compact()
+        print(f'Evicted the cached quotes of {evicted} symbols.')
+
+
+if __name__ == '__main__':
+    main()
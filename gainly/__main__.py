@@ -0,0 +1,46 @@
+import argparse
+import logging
+import os
+import sys
+
+from gainly.cache import CachingQuoteFetcher
+from gainly.report import report, write
+from gainly.yahoo import YahooFinance
+
+
+def run_report(args: argparse.Namespace) -> int:
+    results = report(args.db, CachingQuoteFetcher(YahooFinance(), args.quotes), args.engine, args.currency,
+                     args.no_eod, args.workers or None)
+    files = write(results, args.output, args.format)
+
+    failed = results['irr']['error'].notna().sum()
+    print(f'Reported {len(args.db) - failed} of {len(args.db)} ledgers to {", ".join(map(str, files))}.')
+    return 1 if failed else 0
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='gainly', description='Portfolio performance of transaction ledgers.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_report = commands.add_parser(
+        'report', help='evaluate the positions, daily valuations and IRR of many ledger databases')
+    parser_report.add_argument('db', nargs='+', help='the sqlite3 database files with the ledgers')
+    parser_report.add_argument('--output', default='report', help='the directory to write the results to')
+    parser_report.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                               help='the file format of the results')
+    parser_report.add_argument('--quotes', default='db/quotes.db',
+                               help='the sqlite3 database file with the quote cache shared by all ledgers')
+    parser_report.add_argument('--engine', default='pandas', help='the valuation engine: pandas or numpy')
+    parser_report.add_argument('--currency', help='the base currency to value the ledgers in')
+    parser_report.add_argument('--no-eod', action='store_true', help='value positions at trade prices only')
+    parser_report.add_argument('--workers', type=int, default=os.cpu_count(),
+                               help='the number of processes to evaluate ledgers in (0 for none)')
+    parser_report.set_defaults(func=run_report)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
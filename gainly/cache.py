@@ -0,0 +1,298 @@
+import sqlite3
+import threading
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+import pandas as pd
+from pandera.typing.pandas import DataFrame
+
+from gainly.eod import QuoteFetcher, EODPriceSchema, concat_prices
+from gainly.profiling import span, profiled
+from gainly.validation import check_types
+
+
+class Span(NamedTuple):
+    """A contiguous range of dates for which the cache holds the upstream's quotes."""
+    date_from: date
+    date_to: date
+    fetched_at: datetime
+
+
+class CachingQuoteFetcher(QuoteFetcher):
+    """QuoteFetcher decorator that keeps end-of-day quotes in a local SQLite database.
+
+    For every symbol the cache remembers the date spans it has fetched from the upstream fetcher, so that a
+    request only goes upstream for the dates that are not covered yet (typically the tail since the last run).
+
+    Quotes for the last `refresh_days` days before a fetch are considered provisional (today's "close" is
+    really an intraday price and data providers tend to correct recent bars) and are fetched again once the
+    span they came from is older than `max_age`.
+    """
+
+    def __init__(self, upstream: QuoteFetcher, path: str = 'db/quotes.db',
+                 refresh_days: int = 5, max_age: timedelta = timedelta(hours=12)):
+        """
+        :param upstream:        the QuoteFetcher to fetch missing quotes from
+        :param path:            the sqlite3 database file to store quotes in
+        :param refresh_days:    the number of trailing days of a fetched span that are re-fetched once stale
+        :param max_age:         the age after which a span's provisional trailing days are stale
+        """
+        self.upstream = upstream
+        self.path = path
+        self.refresh_days = refresh_days
+        self.max_age = max_age
+        with self._connect() as conn:
+            conn.executescript(
+                '''
+                CREATE TABLE IF NOT EXISTS quote
+                (
+                    symbol  VARCHAR NOT NULL,
+                    date    DATE    NOT NULL,
+                    close   FLOAT,
+                    PRIMARY KEY (symbol, date)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS quote_span
+                (
+                    symbol      VARCHAR   NOT NULL,
+                    date_from   DATE      NOT NULL,
+                    date_to     DATE      NOT NULL,
+                    fetched_at  TIMESTAMP NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS quote_span_symbol ON quote_span (symbol);
+                CREATE TABLE IF NOT EXISTS quote_symbol
+                (
+                    symbol      VARCHAR   NOT NULL PRIMARY KEY,
+                    accessed_at TIMESTAMP NOT NULL
+                );
+                ''')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @check_types(boundary=True)
+    def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        return self.get_eod_prices_many([symbol], date_from, date_to)
+
+    @profiled('cache.get_eod_prices_many')
+    @check_types(boundary=True)
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        now = datetime.now()
+        symbols = list(symbols)
+
+        with span('cache.spans'), self._connect() as conn:
+            gaps = missing_many(((symbol, self._spans(conn, symbol)) for symbol in symbols), date_from, date_to, now,
+                                self.refresh_days, self.max_age)
+
+        for (gap_from, gap_to), group in gaps.items():
+            quotes = fetch_range(self.upstream, group, gap_from, gap_to, 'cache.upstream')
+            with span('cache.store') as s, self._connect() as conn:
+                s.rows = len(quotes)
+                for symbol in group:
+                    self._store(conn, symbol, Span(gap_from, gap_to, now), quotes[quotes['symbol'] == symbol])
+
+        with span('cache.read'), self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO quote_symbol (symbol, accessed_at) VALUES (?, ?)',
+                             ((symbol, now.isoformat(sep=' ')) for symbol in symbols))
+            df = pd.concat([pd.read_sql('SELECT date, symbol, close FROM quote '
+                                        'WHERE symbol = ? AND date BETWEEN ? AND ? ORDER BY date',
+                                        conn, params=(symbol, date_from.isoformat(), date_to.isoformat()))
+                            for symbol in symbols] or [pd.DataFrame(columns=['date', 'symbol', 'close'])],
+                           ignore_index=True)
+        return df.assign(date=pd.to_datetime(df['date']).dt.date).astype({'close': float})
+
+    @staticmethod
+    def _spans(conn: sqlite3.Connection, symbol: str) -> list[Span]:
+        return [Span(date.fromisoformat(df), date.fromisoformat(dt), datetime.fromisoformat(fa))
+                for df, dt, fa in conn.execute('SELECT date_from, date_to, fetched_at FROM quote_span '
+                                               'WHERE symbol = ? ORDER BY date_from', (symbol,))]
+
+    def _store(self, conn: sqlite3.Connection, symbol: str, span: Span, quotes: pd.DataFrame):
+        conn.execute('DELETE FROM quote WHERE symbol = ? AND date BETWEEN ? AND ?',
+                     (symbol, span.date_from.isoformat(), span.date_to.isoformat()))
+        conn.executemany('INSERT OR REPLACE INTO quote (symbol, date, close) VALUES (?, ?, ?)',
+                         ((symbol, d.isoformat(), None if pd.isna(c) else float(c))
+                          for d, c in zip(quotes['date'], quotes['close'])))
+        self._write_spans(conn, symbol, compact(self._spans(conn, symbol) + [span], self.refresh_days))
+
+    @staticmethod
+    def _write_spans(conn: sqlite3.Connection, symbol: str, spans: list[Span]):
+        conn.execute('DELETE FROM quote_span WHERE symbol = ?', (symbol,))
+        conn.executemany('INSERT INTO quote_span (symbol, date_from, date_to, fetched_at) VALUES (?, ?, ?, ?)',
+                         ((symbol, s.date_from.isoformat(), s.date_to.isoformat(), s.fetched_at.isoformat(sep=' '))
+                          for s in spans))
+
+    def evict(self, unused_for: timedelta = timedelta(days=90)) -> int:
+        """Drops all quotes for symbols that have not been requested in `unused_for`.
+
+        :return:    the number of evicted symbols
+        """
+        cutoff = (datetime.now() - unused_for).isoformat(sep=' ')
+        with self._connect() as conn:
+            symbols = [s for s, in conn.execute('SELECT symbol FROM quote_symbol WHERE accessed_at < ?', (cutoff,))]
+            for table in ('quote', 'quote_span', 'quote_symbol'):
+                conn.executemany(f'DELETE FROM {table} WHERE symbol = ?', ((s,) for s in symbols))
+        return len(symbols)
+
+    def compact(self):
+        """Merges adjacent spans for all symbols and reclaims unused space in the database file."""
+        with self._connect() as conn:
+            for symbol, in conn.execute('SELECT DISTINCT symbol FROM quote_span').fetchall():
+                self._write_spans(conn, symbol, compact(self._spans(conn, symbol), self.refresh_days))
+        conn = self._connect()
+        try:
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+
+
+class CoalescingQuoteFetcher(QuoteFetcher):
+    """Thread-safe QuoteFetcher decorator that keeps the quotes it fetched in memory and shares them between
+    overlapping requests.
+
+    For every symbol it remembers the date spans it fetched (or is fetching) along with their quotes, so a request
+    that overlaps or adjoins earlier ones is sliced from their results and only the dates that are not covered yet go
+    upstream, in one call for all symbols that miss the same range. Fetches in flight are shared through futures, so
+    concurrent callers that need the same dates wait for a single download rather than repeating it. Spans become
+    stale like those of CachingQuoteFetcher.
+    """
+
+    def __init__(self, upstream: QuoteFetcher, refresh_days: int = 5, max_age: timedelta = timedelta(hours=12)):
+        """
+        :param upstream:        the QuoteFetcher to fetch missing quotes from
+        :param refresh_days:    the number of trailing days of a fetched span that are re-fetched once stale
+        :param max_age:         the age after which a span's provisional trailing days are stale
+        """
+        self.upstream = upstream
+        self.refresh_days = refresh_days
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # Per symbol, the spans fetched in order along with the future of their quotes per symbol:
+        self._fetches: dict[str, list[tuple[Span, Future]]] = defaultdict(list)
+
+    @check_types(boundary=True)
+    def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        return self.get_eod_prices_many([symbol], date_from, date_to)
+
+    @profiled('coalesce.get_eod_prices_many')
+    @check_types(boundary=True)
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        now = datetime.now()
+        symbols = list(dict.fromkeys(symbols))
+
+        # Claim the missing ranges, so that concurrent requests wait for them instead of fetching them too:
+        with self._lock:
+            gaps = missing_many(((symbol, [s for s, _ in self._fetches[symbol]]) for symbol in symbols),
+                                date_from, date_to, now, self.refresh_days, self.max_age)
+            futures = {gap: Future() for gap in gaps}
+            for (gap_from, gap_to), group in gaps.items():
+                for symbol in group:
+                    # Earlier spans within the new one are superseded by it:
+                    self._fetches[symbol] = [(s, future) for s, future in self._fetches[symbol]
+                                             if not gap_from <= s.date_from <= s.date_to <= gap_to]
+                    self._fetches[symbol].append((Span(gap_from, gap_to, now), futures[gap_from, gap_to]))
+
+        for (gap_from, gap_to), group in gaps.items():
+            try:
+                quotes = fetch_range(self.upstream, group, gap_from, gap_to, 'coalesce.upstream')
+            except BaseException as e:
+                self._abandon(futures, e)
+                raise
+            futures.pop((gap_from, gap_to)).set_result(dict(tuple(quotes.groupby('symbol', sort=False))))
+
+        with self._lock:
+            fetches = {symbol: [(s, future) for s, future in self._fetches[symbol]
+                                if s.date_from <= date_to and s.date_to >= date_from] for symbol in symbols}
+        frames = []
+        with span('coalesce.slice') as s:
+            for symbol, overlapping in fetches.items():
+                parts = []
+                for fetched, future in overlapping:
+                    quotes = future.result().get(symbol)
+                    if quotes is not None:
+                        parts.append(quotes[(quotes['date'] >= max(date_from, fetched.date_from)) &
+                                            (quotes['date'] <= min(date_to, fetched.date_to))])
+                if parts:
+                    # Spans are kept in the order they were fetched, and the most recent fetch of a date wins:
+                    frames.append(pd.concat(parts[::-1]).drop_duplicates('date').sort_values('date', kind='stable'))
+            df = concat_prices(frames)
+            s.rows = len(df)
+        return df
+
+    def _abandon(self, futures: dict[tuple[date, date], Future], error: BaseException):
+        """Forgets the spans of fetches that will not complete, and fails the requests waiting for them."""
+        abandoned = set(futures.values())
+        with self._lock:
+            for symbol, fetches in list(self._fetches.items()):
+                self._fetches[symbol] = [(s, future) for s, future in fetches if future not in abandoned]
+        for future in futures.values():
+            future.set_exception(error)
+
+
+def trusted_until(span: Span, now: datetime, refresh_days: int, max_age: timedelta) -> date:
+    """Returns the last date of the span whose quotes do not need to be re-fetched."""
+    if now - span.fetched_at < max_age:
+        return span.date_to
+    return min(span.date_to, span.fetched_at.date() - timedelta(days=refresh_days))
+
+
+def missing(spans: list[Span], date_from: date, date_to: date, now: datetime,
+            refresh_days: int, max_age: timedelta) -> list[tuple[date, date]]:
+    """Returns the (inclusive) date ranges between `date_from` and `date_to` not covered by the given spans."""
+    gaps = []
+    cursor = date_from
+    for span in sorted(spans):
+        end = trusted_until(span, now, refresh_days, max_age)
+        if end < cursor or end < span.date_from:
+            continue
+        if span.date_from > date_to:
+            break
+        if span.date_from > cursor:
+            gaps.append((cursor, span.date_from - timedelta(days=1)))
+        cursor = end + timedelta(days=1)
+    if cursor <= date_to:
+        gaps.append((cursor, date_to))
+    return gaps
+
+
+def missing_many(spans: Iterable[tuple[str, list[Span]]], date_from: date, date_to: date, now: datetime,
+                 refresh_days: int, max_age: timedelta) -> dict[tuple[date, date], list[str]]:
+    """Returns the symbols that miss each (inclusive) date range, given the spans of every symbol, so that the
+    symbols that miss the same range can be fetched from the upstream together."""
+    gaps = defaultdict(list)
+    for symbol, symbol_spans in spans:
+        for gap in missing(symbol_spans, date_from, date_to, now, refresh_days, max_age):
+            gaps[gap].append(symbol)
+    return gaps
+
+
+def fetch_range(upstream: QuoteFetcher, symbols: list[str], date_from: date, date_to: date,
+                name: str) -> pd.DataFrame:
+    """Fetches the quotes of the symbols between two dates (inclusive) from the upstream, timed as span `name`."""
+    # Ask for one extra leading day, as upstreams like Yahoo treat the lower bound as exclusive:
+    with span(name, symbols=len(symbols), date_from=date_from, date_to=date_to) as s:
+        quotes = upstream.get_eod_prices_many(symbols, date_from - timedelta(days=1), date_to)
+        s.rows = len(quotes)
+    return quotes[(quotes['date'] >= date_from) & (quotes['date'] <= date_to)]
+
+
+def compact(spans: list[Span], refresh_days: int) -> list[Span]:
+    """Merges overlapping and adjacent spans without extending what is trusted in any of them.
+
+    A later span absorbs an earlier one if it starts no later than the day after the earlier one's permanently
+    trusted part (the part that is not provisional), so that the merged span can inherit the later fetch time.
+    """
+    merged: list[Span] = []
+    for span in sorted(spans):
+        if merged:
+            prev = merged[-1]
+            settled = min(prev.date_to, prev.fetched_at.date() - timedelta(days=refresh_days))
+            if span.date_to <= prev.date_to and span.fetched_at <= prev.fetched_at:
+                continue
+            if span.date_to >= prev.date_to and span.date_from <= settled + timedelta(days=1):
+                merged[-1] = Span(prev.date_from, span.date_to, span.fetched_at)
+                continue
+        merged.append(span)
+    return merged
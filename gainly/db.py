@@ -0,0 +1,104 @@
+import sqlite3
+
+TXN_DDL = '''
+    CREATE TABLE IF NOT EXISTS txn
+    (
+        trade_date TIMESTAMP NOT NULL,
+        symbol     VARCHAR   NOT NULL,
+        name       VARCHAR,
+        isin       VARCHAR,
+        quantity   FLOAT     NOT NULL,
+        price      FLOAT     NOT NULL,
+        broker     VARCHAR,
+        currency   VARCHAR,
+        PRIMARY KEY (trade_date, symbol, broker)
+    );
+    '''
+
+# Columns added after the txn table was first released, along with the DDL that adds them to existing databases:
+TXN_MIGRATIONS = {
+    'currency': 'ALTER TABLE txn ADD COLUMN currency VARCHAR',
+}
+
+VALUATION_DDL = '''
+    CREATE TABLE IF NOT EXISTS daily_valuation
+    (
+        date     DATE    NOT NULL,
+        symbol   VARCHAR NOT NULL,
+        price    FLOAT,
+        position FLOAT,
+        invested FLOAT,
+        close    FLOAT,
+        value    FLOAT,
+        pl       FLOAT,
+        PRIMARY KEY (date, symbol)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS daily_valuation_symbol ON daily_valuation (symbol, date);
+    CREATE TABLE IF NOT EXISTS valuation_meta
+    (
+        key   VARCHAR PRIMARY KEY,
+        value VARCHAR
+    );
+    '''
+
+# A counter that the writers of the txn table bump once per transaction (see `bump_version`), which unlike per-row
+# triggers costs bulk loads nothing:
+TXN_VERSION_DDL = [
+    'CREATE TABLE IF NOT EXISTS txn_version (version INTEGER NOT NULL)',
+    'INSERT INTO txn_version (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM txn_version)',
+    # the per-row triggers of earlier versions:
+    *(f'DROP TRIGGER IF EXISTS txn_{event}' for event in ('insert', 'update', 'delete')),
+]
+TXN_BUMP_SQL = 'UPDATE txn_version SET version = version + 1'
+
+# A cheap token that changes whenever rows are inserted or deleted, or a writer bumped the version:
+TXN_VERSION_SQL = 'SELECT count(*), max(rowid), (SELECT max(version) FROM txn_version) FROM txn'
+
+
+# The primary key treats every NULL broker as distinct, so transactions are identified by this unique index instead,
+# which `ON CONFLICT (TXN_KEY)` clauses target:
+TXN_KEY = "trade_date, symbol, coalesce(broker, '')"
+TXN_KEY_DDL = f'CREATE UNIQUE INDEX IF NOT EXISTS txn_key ON txn ({TXN_KEY})'
+TXN_KEY_EXISTS_SQL = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'txn_key'"
+# Databases created before the index may hold broker-less transactions with the same key. Those that are identical
+# in every column are dropped, but distinct ones can't be told apart by the index:
+TXN_CONFLICTS_SQL = f'''
+    SELECT trade_date, symbol, count(*) FROM (SELECT DISTINCT * FROM txn)
+    GROUP BY {TXN_KEY} HAVING count(*) > 1 ORDER BY trade_date, symbol'''
+TXN_DEDUPE_SQL = 'DELETE FROM txn WHERE rowid NOT IN (SELECT min(rowid) FROM txn GROUP BY {columns})'
+
+
+def init_db(conn: sqlite3.Connection):
+    """Creates the ledger table if it does not exist yet, or adds any columns and indexes it is missing.
+
+    :raises ValueError: when the ledger holds distinct broker-less transactions of the same symbol at the same time,
+                        which have to be told apart (e.g. by their broker) before the ledger can be used
+    """
+    conn.execute(TXN_DDL)
+    columns = table_columns(conn, 'txn')
+    for column, ddl in TXN_MIGRATIONS.items():
+        if column not in columns:
+            conn.execute(ddl)
+    if conn.execute(TXN_KEY_EXISTS_SQL).fetchone() is None:
+        if conflicts := conn.execute(TXN_CONFLICTS_SQL).fetchall():
+            raise ValueError(f'The ledger holds {sum(n for *_, n in conflicts)} different transactions without a '
+                             f'broker that share their symbol and trade date: ' +
+                             ', '.join(f'{symbol} on {trade_date}' for trade_date, symbol, _ in conflicts))
+        conn.execute(TXN_DEDUPE_SQL.format(columns=', '.join(table_columns(conn, 'txn'))))
+        conn.execute(TXN_KEY_DDL)
+    for ddl in TXN_VERSION_DDL:
+        conn.execute(ddl)
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def bump_version(conn: sqlite3.Connection):
+    """Changes the ledger version, which every transaction that updates (or otherwise modifies) txn rows does once."""
+    conn.execute(TXN_BUMP_SQL)
+
+
+def ledger_version(conn: sqlite3.Connection) -> tuple:
+    """Returns a token of the txn table's content that can be used as a cache key."""
+    return tuple(conn.execute(TXN_VERSION_SQL).fetchone())
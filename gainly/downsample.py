@@ -0,0 +1,69 @@
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Returns the indices of the points that Largest-Triangle-Three-Buckets keeps to draw the series with
+    `threshold` points.
+
+    The first and last points are always kept. Every bucket in between keeps the point that forms the largest
+    triangle with the point kept from the previous bucket and the average of the next bucket, which preserves the
+    visual shape (peaks and troughs) of the series much better than regular sampling.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        following = slice(end, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        avg_x, avg_y = x[following].mean(), y[following].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.nanargmax(area)) if np.isfinite(area).any() else start
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Returns the indices of the minimum and maximum of each of `threshold // 2` equally sized buckets, along with
+    the first and last point, so that no extreme is lost."""
+    n = len(y)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, threshold // 2 + 1).astype(int)
+    indices = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            indices += [start + int(np.nanargmin(y[start:end])), start + int(np.nanargmax(y[start:end]))] \
+                if np.isfinite(y[start:end]).any() else [start]
+    return np.unique(indices)
+
+
+def downsample(df: pd.DataFrame, x: str, columns: list[str], threshold: int = 1000,
+               method: Literal['lttb', 'minmax'] = 'lttb') -> pd.DataFrame:
+    """Returns the rows of a frame sorted by `x` that are needed to draw each of the columns at the resolution of
+    `threshold` points.
+
+    The points kept for each column are combined, so that all columns share their x values (as stacked charts
+    require), which can leave up to `threshold` points per column.
+    """
+    if len(df) <= threshold:
+        return df
+    xs = pd.to_numeric(df[x]) if not pd.api.types.is_object_dtype(df[x]) \
+        else pd.to_datetime(df[x]).astype('int64')
+    per_column = max(threshold // len(columns), 4)
+    indices = np.unique(np.concatenate([
+        lttb(xs.to_numpy(), df[col].to_numpy(), per_column) if method == 'lttb'
+        else minmax(df[col].to_numpy(), per_column)
+        for col in columns]))
+    return df.iloc[indices]
@@ -0,0 +1,97 @@
+"""Compact column representations for the long frames of the valuation pipeline.
+
+By default symbols and brokers are Python strings and dates are `datetime.date` objects, in object columns that cost
+a pointer plus a boxed object per cell, repeated across every row of the date x symbol grid. The dtypes are one of:
+
+- `object`:     the default representation
+- `compact`:    symbol, broker and currency columns are categoricals and dates are (midnight) datetime64[ns], with
+                identical numeric results
+- `compact32`:  like `compact`, but the prices, positions and amounts of quotes and valuations are also stored as
+                float32, which halves their size at the expense of precision (the running totals are still computed
+                from the float64 ledger)
+
+Pandas has no day resolution, so dates take 8 bytes as nanosecond datetimes rather than `datetime64[D]`.
+"""
+import copy
+from datetime import date
+from functools import cache
+from typing import Literal
+
+import pandas as pd
+import pandera.pandas as pa
+
+DTypes = Literal['object', 'compact', 'compact32']
+DTYPES = ('object', 'compact', 'compact32')
+
+CATEGORICAL = ('symbol', 'broker', 'currency')
+FLOAT32 = ('price', 'close', 'position', 'invested', 'value', 'pl')
+DATES = ('date',)
+
+FLOATING = pa.Check(lambda s: pd.api.types.is_float_dtype(s), element_wise=False, name='is_float')
+
+
+def check_dtypes(dtypes: DTypes | None) -> DTypes | None:
+    if dtypes is not None and dtypes not in DTYPES:
+        raise ValueError(f'Invalid dtypes {dtypes!r}, expected one of {", ".join(DTYPES)}')
+    return dtypes
+
+
+def is_compact(df: pd.DataFrame) -> bool:
+    """Returns whether a frame's symbols are categorical, which is how the engines recognize compact input."""
+    return isinstance(df['symbol'].dtype, pd.CategoricalDtype)
+
+
+def compact(df: pd.DataFrame, dtypes: DTypes, categories: pd.Index = None, float32: tuple[str] = FLOAT32):
+    """Returns the frame in the given representation.
+
+    :param categories:  the symbols to use as categories, so that frames can be merged on their symbol without
+                        falling back to object columns; defaults to the frame's own symbols
+    :param float32:     the columns stored as float32 in `compact32` mode
+    """
+    if dtypes is None or dtypes == 'object':
+        return df
+    columns = {}
+    for col in df.columns:
+        if col == 'symbol' and categories is not None:
+            columns[col] = pd.CategoricalDtype(categories)
+        elif col in CATEGORICAL and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            columns[col] = 'category'
+        elif dtypes == 'compact32' and col in float32 and df[col].dtype != 'float32':
+            columns[col] = 'float32'
+    df = df.astype(columns) if columns else df
+    dates = {col: pd.to_datetime(df[col]) for col in DATES
+             if col in df.columns and not pd.api.types.is_datetime64_dtype(df[col])}
+    return df.assign(**dates) if dates else df
+
+
+def to_days(timestamps: pd.Series, compact: bool) -> pd.Series:
+    """Truncates timestamps to dates, as datetime64 in compact frames or `datetime.date` objects otherwise."""
+    return timestamps.dt.normalize() if compact else timestamps.dt.date
+
+
+def as_day(day: date, like: pd.Series) -> date | pd.Timestamp:
+    """Returns a date in a form that can be compared with the given date column."""
+    return pd.Timestamp(day) if pd.api.types.is_datetime64_dtype(like) else day
+
+
+@cache
+def compact_schema(model: type[pa.DataFrameModel], dtypes: DTypes) -> pa.DataFrameSchema | type[pa.DataFrameModel]:
+    """Returns the variant of a schema that accepts (and coerces to) the given representation."""
+    if dtypes is None or dtypes == 'object':
+        return model
+    schema = model.to_schema()
+    updates = {}
+    for name, column in schema.columns.items():
+        if name in CATEGORICAL:
+            updates[name] = {'dtype': 'category'}
+        elif str(column.dtype) == 'date':
+            updates[name] = {'dtype': 'datetime64[ns]'}
+        elif dtypes == 'compact32' and name in FLOAT32:
+            # Float columns are accepted at either width, as the ledger's prices remain float64:
+            updates[name] = {'dtype': None, 'checks': [*column.checks, FLOATING]}
+    schema = schema.update_columns(updates)
+    if schema.index is not None and str(schema.index.dtype) == 'str':
+        schema = copy.deepcopy(schema)
+        schema.index = pa.Index('category', checks=schema.index.checks, nullable=schema.index.nullable,
+                                name=schema.index.name, coerce=True)
+    return schema
@@ -0,0 +1,258 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+from gainly.dtypes import is_compact
+from gainly.profiling import span
+
+
+class ValuationEngine(ABC):
+    """Computes the date x symbol grid of positions and valuations from a ledger and end-of-day prices.
+
+    Both methods return long frames with a row for every combination of date and symbol, sorted by date and
+    symbol, where the dates are the union of all trade dates and all end-of-day quote dates. When the ledger's
+    symbols are categorical (see `gainly.dtypes`), so are the output's and its dates are datetime64 instead of
+    `datetime.date` objects.
+
+    With a `freq` like 'W' or 'M', the trades and quotes are reduced to one row per period before the grid is built.
+    Every period is labelled by its last date (of all trade and quote dates) and its position, invested amount, value
+    and pl are exactly those of that date in the daily grid. Its price and close are the last trade price and the last
+    close within the period.
+    """
+
+    @abstractmethod
+    def daily_positions(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None) -> pd.DataFrame:
+        """Returns the date, symbol, price, position, invested and close columns."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def daily_valuations(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None) -> pd.DataFrame:
+        """Returns the daily positions along with their value and pl columns."""
+        raise NotImplementedError
+
+
+class PandasEngine(ValuationEngine):
+    """Builds the grid by merging long frames and forward filling per symbol."""
+
+    def daily_positions(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None) -> pd.DataFrame:
+        return self._positions(txns, eod_prices, freq).drop(columns='mark', errors='ignore')
+
+    def _positions(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None) -> pd.DataFrame:
+        """Returns the daily positions, with the price that values each period in a `mark` column when resampled."""
+        with span('pandas.running_totals') as s:
+            df = txns.copy().set_index('trade_date').sort_index()
+            df['position'] = (df.groupby('symbol', observed=True)['quantity']
+                                .cumsum())
+            df['invested'] = (df.assign(invested=df['price'] * df['quantity'])
+                                .groupby('symbol', observed=True)['invested']
+                                .cumsum())
+
+            # Convert datetime index to date
+            df.index = df.index.normalize() if is_compact(txns) else df.index.date
+
+            # Get end-of-day positions, price and total invested amount per symbol
+            daily_positions = (df[['symbol', 'price', 'position', 'invested']]
+                               .groupby([df.index, 'symbol'], observed=True)
+                               .last()
+                               .reset_index(names=['date', 'symbol']))
+            s.rows = len(daily_positions)
+
+        with span('pandas.merge_quotes') as s:
+            # Merge the eod prices with the daily positions:
+            daily_positions = daily_positions.merge(eod_prices, how='outer', on=['date', 'symbol'])
+            s.rows = len(daily_positions)
+
+        if is_resampled(freq):
+            with span('pandas.resample', freq=freq) as s:
+                daily_positions = resample(daily_positions, freq)
+                s.rows = len(daily_positions)
+
+        with span('pandas.grid') as s:
+            # Create the cartesian product grid of all trade dates and symbols:
+            grid = (pd.MultiIndex
+                    .from_product([daily_positions['date'].unique(), daily_positions['symbol'].unique()],
+                                  names=['date', 'symbol'])
+                    .to_frame(index=False))
+            # Merge grid with positions data so that we can generate a position for each day and symbol
+            daily_positions = daily_positions.merge(grid, how='outer')
+            s.rows = len(daily_positions)
+
+        with span('pandas.ffill'):
+            # On dates where we don't have a trade for all symbols, fill the position with the previous day's
+            # position for each symbol:
+            daily_positions['position'] = daily_positions.groupby('symbol', observed=True)['position'].ffill()
+            daily_positions['invested'] = daily_positions.groupby('symbol', observed=True)['invested'].ffill()
+        return daily_positions
+
+    def daily_valuations(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None) -> pd.DataFrame:
+        daily_positions = self._positions(txns, eod_prices, freq)
+
+        with span('pandas.value'):
+            # Now that we have a position for each symbol on each day, we can calculate the total value of the
+            # portfolio by multiplying the position by "price", or "close":
+            mark = (daily_positions.pop('mark') if 'mark' in daily_positions.columns else
+                    daily_positions['price'].combine_first(daily_positions['close']))
+            daily_positions['value'] = daily_positions['position'] * mark
+            daily_positions['pl'] = daily_positions['value'] - daily_positions['invested']
+
+            # For days when we can't calculate the value of a symbol's position due to lack of both a trade price and
+            # an EOD price, carry forward the previous day's value for that symbol:
+            daily_positions['value'] = daily_positions.groupby('symbol', observed=True)['value'].ffill()
+            daily_positions['pl'] = daily_positions.groupby('symbol', observed=True)['pl'].ffill()
+        return daily_positions
+
+
+class NumpyEngine(ValuationEngine):
+    """Represents prices, positions and invested amounts as dense date x symbol arrays.
+
+    The running totals are computed on the (small) ledger, scattered into the arrays and forward filled along
+    the date axis in a single vectorized pass. The long frame is only built on output.
+    """
+
+    def daily_positions(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None) -> pd.DataFrame:
+        with span('numpy.grid'):
+            grid = WideGrid(txns, eod_prices, freq)
+        with span('numpy.to_frame') as s:
+            df = grid.to_frame(price=grid.price, position=grid.position, invested=grid.invested, close=grid.close)
+            s.rows = len(df)
+        return df
+
+    def daily_valuations(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None) -> pd.DataFrame:
+        with span('numpy.grid'):
+            grid = WideGrid(txns, eod_prices, freq)
+        with span('numpy.value'):
+            value, pl = grid.valuations()
+        with span('numpy.to_frame') as s:
+            df = grid.to_frame(price=grid.price, position=grid.position, invested=grid.invested, close=grid.close,
+                               value=value, pl=pl)
+            s.rows = len(df)
+        return df
+
+
+class WideGrid(object):
+    """Dense date x symbol arrays for a ledger and its end-of-day prices, with a row per day or per period."""
+
+    def __init__(self, txns: pd.DataFrame, eod_prices: pd.DataFrame, freq: str = None):
+        self.compact = is_compact(txns)
+        df = txns.sort_values('trade_date', kind='stable')
+        trade_days = df['trade_date'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+        eod_days = pd.to_datetime(eod_prices['date']).to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+
+        # Hash based de-duplication first, so that only the distinct values need sorting:
+        self.days = np.sort(pd.unique(np.concatenate([trade_days, eod_days])))
+        self.resampled = is_resampled(freq)
+        if self.resampled:
+            # The row of every day is that of the last day of its period:
+            self.rows, last = period_ends(self.days, freq)
+            self.dates = self.days[last]
+            # Periods take their last close, so closes must be scattered in date order and missing ones skipped:
+            order = np.argsort(eod_days, kind='stable')
+            order = order[eod_prices['close'].notna().to_numpy()[order]]
+            eod_prices, eod_days = eod_prices.iloc[order], eod_days[order]
+        else:
+            self.rows = np.arange(len(self.days))
+            self.dates = self.days
+        self.symbols = np.sort(pd.unique(np.concatenate([df['symbol'].to_numpy(dtype=object),
+                                                         eod_prices['symbol'].to_numpy(dtype=object)])))
+        shape = (len(self.dates), len(self.symbols))
+
+        # Running totals per symbol, in ledger order, of which the last one of each day is scattered into the grid:
+        position = df.groupby('symbol', observed=True)['quantity'].cumsum().to_numpy(dtype=float)
+        invested = (df['price'] * df['quantity']).groupby(df['symbol'], observed=True).cumsum().to_numpy(dtype=float)
+        rows, cols = self._cells(trade_days, df['symbol'])
+        self.price = scatter_last(shape, rows, cols, df['price'].to_numpy(dtype=float))
+        self.position = ffill(scatter_last(shape, rows, cols, position))
+        self.invested = ffill(scatter_last(shape, rows, cols, invested))
+
+        if self.resampled:
+            traded = scatter_last(shape, rows, cols, trade_days.astype(float))
+
+        rows, cols = self._cells(eod_days, eod_prices['symbol'])
+        self.close = scatter_last(shape, rows, cols, eod_prices['close'].to_numpy(dtype=float))
+
+        if self.resampled:
+            # A period is valued at its last trade price or its last close, whichever is later (on the same day, the
+            # trade price), just like its last day would be in the daily grid:
+            quoted = scatter_last(shape, rows, cols, eod_days.astype(float))
+            self.mark = np.where(np.isnan(quoted) | (traded >= quoted), self.price, self.close)
+
+    def _cells(self, days: np.ndarray, symbols: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+        return (self.rows[np.searchsorted(self.days, days)],
+                pd.Index(self.symbols).get_indexer(symbols.to_numpy(dtype=object)))
+
+    def valuations(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the value and pl arrays, carrying forward the last known value where there is no price."""
+        mark = self.mark if self.resampled else np.where(np.isnan(self.price), self.close, self.price)
+        value = self.position * mark
+        pl = value - self.invested
+        return ffill(value), ffill(pl)
+
+    def to_frame(self, **columns: np.ndarray) -> pd.DataFrame:
+        """Converts the given date x symbol arrays to a long frame, sorted by date and symbol."""
+        if self.compact:
+            dates = np.repeat(self.dates.astype('datetime64[ns]'), len(self.symbols))
+            symbols = pd.Categorical.from_codes(np.tile(np.arange(len(self.symbols)), len(self.dates)),
+                                                categories=self.symbols)
+        else:
+            dates = np.repeat(self.dates.astype(object), len(self.symbols))
+            symbols = np.tile(self.symbols, len(self.dates))
+        return pd.DataFrame({'date': dates, 'symbol': symbols, **{name: arr.ravel() for name, arr in columns.items()}})
+
+
+def is_resampled(freq: str | None) -> bool:
+    """Returns whether a period alias like 'W' or 'M' asks for fewer rows than days, raising a ValueError for
+    unknown ones."""
+    if freq is None:
+        return False
+    return pd.PeriodDtype(freq) != pd.PeriodDtype('D')
+
+
+def resample(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Reduces a long frame of running totals and quotes, sorted by date, to a row per period and symbol.
+
+    Every period is labelled by its last date. The running totals take their last value in the period, as do the
+    price and close, skipping missing ones, and the `mark` column holds the last of either (the price on a trade day).
+    """
+    codes, days = pd.factorize(df['date'], sort=True)
+    periods, last = period_ends(pd.to_datetime(days).to_numpy(dtype='datetime64[D]'), freq)
+    df = (df
+          .drop(columns='date')
+          .assign(mark=df['price'].combine_first(df['close']))
+          .groupby([periods[codes], 'symbol'], observed=True, sort=True)
+          .last()
+          .reset_index(names=['period', 'symbol']))
+    df.insert(0, 'date', days[last].take(df.pop('period')))
+    return df
+
+
+def period_ends(days: np.ndarray, freq: str) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the period number of each of the sorted distinct days, along with the index of each period's last
+    day."""
+    periods = pd.PeriodIndex(days, freq=freq).asi8
+    last = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+    return np.repeat(np.arange(len(last)), np.diff(last, prepend=-1)), last
+
+
+def scatter_last(shape: tuple[int, int], rows: np.ndarray, cols: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Returns a NaN array of the given shape with the values at their cells, keeping the last value of duplicate
+    cells."""
+    arr = np.full(shape, np.nan)
+    flat = rows * shape[1] + cols
+    _, last = np.unique(flat[::-1], return_index=True)
+    last = len(flat) - 1 - last
+    arr.flat[flat[last]] = values[last]
+    return arr
+
+
+def ffill(arr: np.ndarray) -> np.ndarray:
+    """Forward fills NaN values along the first (date) axis."""
+    idx = np.where(np.isnan(arr), 0, np.arange(arr.shape[0])[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return arr[idx, np.arange(arr.shape[1])]
+
+
+ENGINES = {
+    'pandas': PandasEngine,
+    'numpy': NumpyEngine,
+}
@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable
 from datetime import date
 
+import pandas as pd
 import pandera.pandas as pa
 from pandera.typing.pandas import DataFrame
 
+from gainly.validation import check_types, ValidationMode
+
 
 class EODPriceSchema(pa.DataFrameModel):
     date: date = pa.Field(coerce=True)
@@ -12,12 +16,59 @@ class EODPriceSchema(pa.DataFrameModel):
 
 
 class QuoteFetcher(ABC):
+    validation: ValidationMode | None = None    # overrides the global validation mode for this fetcher
+
     @abstractmethod
     def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
         raise NotImplementedError
 
+    @check_types(boundary=True)
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        """Returns the end-of-day prices for all given symbols in a single frame.
+
+        The default implementation fetches one symbol at a time. Implementations that can do better (concurrent
+        requests, bulk reads) should override this.
+        """
+        frames = [self.get_oed_prices(symbol, date_from, date_to) for symbol in symbols]
+        return concat_prices(frames)
+
 
 class NullQuoteFetcher(QuoteFetcher):
-    @pa.check_types
+    @check_types(boundary=True)
     def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
-        return DataFrame[EODPriceSchema](columns=['date', 'symbol', 'close'])
+        return empty_prices()
+
+    @check_types(boundary=True)
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        return empty_prices()
+
+
+class FrameQuoteFetcher(QuoteFetcher):
+    """Serves end-of-day prices from a frame in memory, like quotes that were fetched in bulk beforehand."""
+
+    def __init__(self, prices: DataFrame[EODPriceSchema]):
+        self.prices = prices
+
+    @check_types(boundary=True)
+    def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        return self.get_eod_prices_many([symbol], date_from, date_to)
+
+    @check_types(boundary=True)
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        df = self.prices
+        return df[df['symbol'].isin(list(symbols)) &
+                  (df['date'] >= date_from) & (df['date'] <= date_to)].reset_index(drop=True)
+
+
+def concat_prices(frames: list[pd.DataFrame]) -> DataFrame[EODPriceSchema]:
+    """Concatenates per-symbol price frames in a single pass."""
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return empty_prices()
+    return pd.concat(frames, ignore_index=True)
+
+
+def empty_prices() -> DataFrame[EODPriceSchema]:
+    return pd.DataFrame({'date': pd.Series(dtype=object),
+                         'symbol': pd.Series(dtype=object),
+                         'close': pd.Series(dtype=float)})
@@ -0,0 +1,84 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pandera.pandas as pa
+from pandera.typing.pandas import DataFrame
+
+from gainly.eod import QuoteFetcher
+from gainly.validation import check_types, ValidationMode
+
+
+class FXRateSchema(pa.DataFrameModel):
+    date: date = pa.Field(coerce=True)
+    currency: str = pa.Field(coerce=True)
+    rate: float = pa.Field(nullable=True, coerce=True)     # the amount of base currency per unit of `currency`
+
+
+class FXFetcher(ABC):
+    validation: ValidationMode | None = None    # overrides the global validation mode for this fetcher
+
+    @abstractmethod
+    def get_rates(self, currencies: Iterable[str], base: str, date_from: date, date_to: date) \
+            -> DataFrame[FXRateSchema]:
+        """Returns the daily exchange rates from each of the currencies to the base currency."""
+        raise NotImplementedError
+
+
+class QuoteFXFetcher(FXFetcher):
+    """Reads exchange rates as the end-of-day closes of currency pair tickers, like Yahoo's EURUSD=X.
+
+    All pairs are fetched in one batch through the QuoteFetcher, so a CachingQuoteFetcher keeps them locally just
+    like stock quotes.
+    """
+
+    def __init__(self, quote_fetcher: QuoteFetcher, ticker: str = '{currency}{base}=X'):
+        """
+        :param quote_fetcher:   the source of the currency pairs' quotes
+        :param ticker:          the format of a currency pair's ticker, in terms of `currency` and `base`
+        """
+        self.quote_fetcher = quote_fetcher
+        self.ticker = ticker
+
+    @check_types(boundary=True)
+    def get_rates(self, currencies: Iterable[str], base: str, date_from: date, date_to: date) \
+            -> DataFrame[FXRateSchema]:
+        tickers = {self.ticker.format(currency=currency, base=base): currency
+                   for currency in currencies if currency != base}
+        quotes = self.quote_fetcher.get_eod_prices_many(list(tickers), date_from, date_to)
+        return (quotes
+                .assign(currency=quotes['symbol'].map(tickers).astype(object))
+                .rename(columns={'close': 'rate'})[['date', 'currency', 'rate']]
+                .reset_index(drop=True))
+
+
+def convert(amounts: pd.Series, dates: pd.Series, currencies: pd.Series, base: str, rates: pd.DataFrame) \
+        -> np.ndarray:
+    """Converts amounts to the base currency, at the last rate on or before each amount's date.
+
+    This is an as-of join done with one vectorized lookup per currency. Amounts dated before a currency's first rate
+    use that first rate and amounts without a currency are taken to be in the base currency already.
+
+    :param amounts:     the amounts to convert
+    :param dates:       the date of every amount
+    :param currencies:  the currency of every amount
+    :param base:        the currency to convert to
+    :param rates:       exchange rates adhering to the FXRateSchema
+    """
+    result = amounts.to_numpy(dtype=float, copy=True)
+    days = pd.to_datetime(dates).to_numpy().astype('datetime64[D]')
+    currencies = currencies.to_numpy()
+    rates = rates.dropna(subset=['rate'])
+    pairs = dict(iter(rates.groupby('currency')))
+
+    for currency in pd.unique(currencies[pd.notna(currencies) & (currencies != base)]):
+        rows = np.flatnonzero(currencies == currency)
+        if currency not in pairs:
+            raise ValueError(f'No exchange rates from {currency} to {base}')
+        pair = pairs[currency].sort_values('date')
+        rate_days = pd.to_datetime(pair['date']).to_numpy().astype('datetime64[D]')
+        idx = np.searchsorted(rate_days, days[rows], side='right') - 1
+        result[rows] *= pair['rate'].to_numpy()[idx.clip(0)]
+    return result
@@ -0,0 +1,207 @@
+from collections.abc import Iterable
+from datetime import date
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+from pandera.typing.pandas import DataFrame
+from pyxirr import xirr
+
+from gainly.engine import ValuationEngine
+from gainly.eod import QuoteFetcher, FrameQuoteFetcher, EODPriceSchema, empty_prices
+from gainly.fx import FXFetcher
+from gainly.portfolio import PortfolioPerformance, TransactionSchema, memoized
+from gainly.validation import check_types, check_mode, ValidationMode
+
+SEP = '\x1f'
+
+
+class KeyedQuoteFetcher(QuoteFetcher):
+    """Serves the quotes of the underlying symbols under the composite (group, symbol) keys that refer to them.
+
+    Every underlying symbol is fetched once, no matter in how many groups it appears.
+    """
+
+    def __init__(self, upstream: QuoteFetcher, keys: pd.DataFrame):
+        """
+        :param keys:    a frame indexed by composite key, with the underlying symbol in its `symbol` column
+        """
+        self.upstream = upstream
+        self.keys = keys
+
+    def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        return self.get_eod_prices_many([symbol], date_from, date_to)
+
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        keys = self.keys.loc[list(symbols), ['symbol']].rename_axis('key').reset_index()
+        quotes = self.upstream.get_eod_prices_many(keys['symbol'].unique(), date_from, date_to)
+        if quotes.empty:
+            return empty_prices()
+        return (quotes
+                .merge(keys, on='symbol')
+                .drop(columns='symbol')
+                .rename(columns={'key': 'symbol'})[['date', 'symbol', 'close']])
+
+
+def trade_prices(transactions: pd.DataFrame) -> DataFrame[EODPriceSchema]:
+    """Returns the last trade price of every symbol on every day it was traded, as its close."""
+    txns = transactions.sort_values('trade_date', kind='stable')
+    return (txns
+            .assign(date=txns['trade_date'].dt.date)
+            .groupby(['date', 'symbol'])['price']
+            .last()
+            .rename('close')
+            .reset_index())
+
+
+class GroupedPortfolioPerformance(object):
+    """Calculates the performance of every group of a ledger (e.g. per broker) in a single pass.
+
+    All groups are evaluated together by one PortfolioPerformance in which every symbol is replaced by a composite
+    (group, symbol) key, sharing the quotes of the underlying symbols. Any combination of groups can then be looked
+    up through `select()` without recomputing anything.
+
+    Without a quote fetcher, a PortfolioPerformance values a symbol at its last trade price, whichever group traded it.
+    The groups therefore share the trade prices of the underlying symbols as their closes, and are valued at those
+    only.
+    """
+
+    @check_types(boundary=True)
+    def __init__(self, transactions: DataFrame[TransactionSchema], quote_fetcher: QuoteFetcher = None,
+                 by: str | list[str] = 'broker', engine: str | ValuationEngine = 'pandas', *,
+                 validation: ValidationMode = None, base_currency: str = None, fx_fetcher: FXFetcher = None):
+        """
+        :param transactions:    a DataFrame of transactions, with columns:
+                                trade_date, symbol, price, quantity, broker
+        :param quote_fetcher:   a QuoteFetcher instance for historical end-of-day price data
+        :param by:              the transaction column(s) to group by
+        :param engine:          the ValuationEngine, or the name of one
+        :param validation:      the validation mode for this instance
+        :param base_currency:   the currency to value the portfolio in
+        :param fx_fetcher:      the source of exchange rates, needed when converting to the base currency
+        """
+        self.validation = check_mode(validation)
+        self.by = [by] if isinstance(by, str) else list(by)
+        self.quoted = quote_fetcher is not None
+        self._memo = {}
+
+        key = reduce(lambda a, b: a + SEP + b, (transactions[col].astype(str) for col in self.index))
+        self.txns = transactions.assign(key=key)
+        self.keys = self.txns.drop_duplicates('key').set_index('key')[self.index]
+        self.portfolio = PortfolioPerformance(self.txns.assign(symbol=key).drop(columns='key'),
+                                              KeyedQuoteFetcher(quote_fetcher or FrameQuoteFetcher(
+                                                  trade_prices(transactions)), self.keys),
+                                              engine, validation=validation, base_currency=base_currency,
+                                              fx_fetcher=fx_fetcher)
+
+    @property
+    def index(self) -> list[str]:
+        """The group columns followed by `symbol`."""
+        return [col for col in self.by if col != 'symbol'] + ['symbol']
+
+    @property
+    def ledger(self) -> pd.DataFrame:
+        """The transactions with their prices in the base currency."""
+        return self.txns.drop(columns='key').assign(price=self.portfolio.ledger['price'].to_numpy())
+
+    def _unkey(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Replaces the composite key in the `symbol` column with the group columns and the underlying symbol."""
+        pos = df.columns.get_loc('symbol')
+        df = df.reset_index(drop=True)
+        return pd.concat([df.iloc[:, :pos], self.keys.reindex(df['symbol']).reset_index(drop=True),
+                          df.iloc[:, pos + 1:]], axis=1)
+
+    @memoized
+    def _valuations(self, freq: str = None) -> pd.DataFrame:
+        """Returns the valuations of the composite keys, which are those of the trade prices as closes only when there
+        are no quotes."""
+        df = self.portfolio.daily_valuations(freq)
+        if self.quoted:
+            return df
+        value = (df['position'] * df['close']).groupby(df['symbol']).ffill()
+        return df.assign(close=np.nan, value=value, pl=value - df['invested'])
+
+    @memoized
+    def daily_valuations(self, freq: str = None) -> pd.DataFrame:
+        """Returns the daily (or per period) valuations of every (group, symbol), with the group columns before
+        `symbol`."""
+        return self._unkey(self._valuations(freq))
+
+    @memoized
+    def positions(self) -> pd.DataFrame:
+        """Returns the current positions, indexed by the group columns and the symbol."""
+        positions = self._valuations().groupby('symbol')[['position', 'value', 'invested', 'pl']].last()
+        return self._unkey(positions.reset_index()).set_index(self.index)
+
+    @memoized
+    def cashflows(self) -> pd.DataFrame:
+        """Returns the cashflows of every (group, symbol) with its current value as the final inflow."""
+        ledger = self.portfolio.ledger
+        trades = (ledger
+                  .assign(key=ledger['symbol'],
+                          date=ledger['trade_date'].dt.date,
+                          cf=ledger['price'] * ledger['quantity'] * -1)[['key', 'date', 'cf']])
+        remaining_value = (self
+                           ._valuations()
+                           .groupby('symbol')[['date', 'value']]
+                           .last()
+                           .rename(columns={'value': 'cf'})
+                           .rename_axis('key')
+                           .reset_index()
+                           .pipe(lambda df: df[df['cf'] > 0]))
+        return (pd.concat([trades, remaining_value])
+                .rename(columns={'key': 'symbol'})
+                .pipe(self._unkey)
+                .reset_index(drop=True))
+
+    @memoized
+    def get_irr(self) -> pd.Series:
+        """Returns the xirr of every group."""
+        return (self.cashflows()
+                .groupby(self.by, dropna=False)
+                .apply(lambda df: xirr(df.groupby('date')['cf'].sum().reset_index()), include_groups=False)
+                .rename('irr'))
+
+    def select(self, **values) -> 'PortfolioSlice':
+        """Returns the combined performance of the groups and symbols with the given values.
+
+        Arguments that are None select everything, e.g. `select(broker='broker1', symbol=None)`.
+        """
+        return PortfolioSlice(self, {col: value for col, value in values.items() if value is not None})
+
+
+class PortfolioSlice(object):
+    """The combined performance of a selection of a GroupedPortfolioPerformance's groups.
+
+    Positions and IRR are the same as those of a PortfolioPerformance over just the selected transactions. With
+    quotes, on days that a symbol is traded its holding in every group is valued at that group's own trade price, so
+    daily values of a symbol held in several groups can differ slightly on those days.
+    """
+
+    def __init__(self, grouped: GroupedPortfolioPerformance, values: dict):
+        self.grouped = grouped
+        self.values = values
+
+    def _filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        mask = pd.Series(True, index=df.index)
+        for col, value in self.values.items():
+            mask &= (df.index.get_level_values(col) if col in df.index.names else df[col]) == value
+        return df[mask]
+
+    @property
+    def txns(self) -> pd.DataFrame:
+        return self._filter(self.grouped.txns).drop(columns='key')
+
+    def daily_valuations(self, freq: str = None) -> pd.DataFrame:
+        """Returns the daily (or per period) valuations of the selected (group, symbol)s."""
+        return self._filter(self.grouped.daily_valuations(freq)).reset_index(drop=True)
+
+    def positions(self) -> pd.DataFrame:
+        """Returns the current positions per symbol, summed over the selected groups."""
+        return (self._filter(self.grouped.positions())
+                .groupby('symbol')[['position', 'value', 'invested', 'pl']]
+                .sum())
+
+    def get_irr(self) -> float:
+        """Returns the xirr of the selection."""
+        return xirr(self._filter(self.grouped.cashflows()).groupby('date')['cf'].sum().reset_index())
@@ -1,13 +1,24 @@
 from datetime import date
+from functools import partial
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 import streamlit as st
 from sqlalchemy.sql import text
 from streamlit_extras.bottom_container import bottom
 
-from gainly.lit.util import row_selector, align
-from gainly.portfolio import PortfolioPerformance
+from gainly.cache import CachingQuoteFetcher, CoalescingQuoteFetcher
+from gainly.db import TXN_VERSION_SQL, init_db
+from gainly.downsample import downsample
+from gainly.fx import QuoteFXFetcher
+from gainly.grouped import GroupedPortfolioPerformance
+from gainly.lit.util import row_selector, align, money_format, CURRENCY_SYMBOLS
+from gainly.lots import LotTracker
+from gainly.materialized import (MATERIALIZED_SQL, META_SQL, BOUNDS_SQL, TOTALS_SQL, TRADE_DATES_SQL, POSITIONS_SQL,
+                                 irr)
+from gainly.profiling import Recorder
 from gainly.yahoo import YahooFinance
 
 
@@ -15,21 +26,9 @@ conn = st.connection('transactions', type='sql', ttl=0)
 with conn.session as session:
     # Initialize database:
     session.execute(text('''PRAGMA foreign_keys = ON'''))
-    session.execute(text(
-        '''
-        CREATE TABLE IF NOT EXISTS txn
-        (
-            trade_date TIMESTAMP NOT NULL,
-            symbol     VARCHAR   NOT NULL,
-            name       VARCHAR,
-            isin       VARCHAR,
-            quantity   FLOAT     NOT NULL,
-            price      FLOAT     NOT NULL,
-            broker     VARCHAR,
-            PRIMARY KEY (trade_date, symbol, broker)
-        );
-        '''))
+    init_db(session.connection().connection.dbapi_connection)
     session.commit()
+    materialized = session.execute(text(MATERIALIZED_SQL)).scalar() is not None
 
 
 st.set_page_config(page_title='Cap gains tracker', page_icon=':chart_with_upwards_trend:', layout="wide")
@@ -43,62 +42,206 @@ if 'hide_amounts' not in st.session_state:
 with st.popover('Options'):
     st.checkbox('Hide amounts in graphs', key='hide_amounts')
     st.checkbox('No end-of-day quotes', key='no_eod')
+    st.selectbox('Currency', list(CURRENCY_SYMBOLS), key='currency')
+    st.checkbox('Precomputed valuations', key='materialized', disabled=not materialized,
+                help='Read the valuations maintained by bin/refresh_valuations.py instead of computing them')
+    st.checkbox('Profile', key='profile', help='Time the stages of this run and show them at the bottom of the page')
 
+# Records the stages of this rerun only, as the spans of cached results are not repeated:
+recorder = Recorder().start() if st.session_state['profile'] else None
 
-@st.cache_data
-def get_eod_prices(symbol: str, date_from: date, date_to: date) -> pd.DataFrame:
-    return YahooFinance().get_oed_prices(symbol, date_from, date_to)
+materialized = materialized and st.session_state['materialized']
+meta = dict(conn.query(META_SQL, ttl=0).itertuples(index=False)) if materialized else {}
+currency = meta.get('currency') or st.session_state['currency']
+currency_symbol = CURRENCY_SYMBOLS.get(currency, currency)
+money = st.column_config.NumberColumn(format=money_format(currency))
 
-txns = conn.query('''SELECT * FROM TXN ORDER BY trade_date ASC''', ttl=0)
-txns['trade_date'] = pd.to_datetime(txns['trade_date'])
-txns = row_selector(txns, st_cols=st.columns(2), key='txns', df_cols=['symbol', 'broker'])(txns)
+CHART_POINTS = 1500     # about the horizontal resolution of a wide chart
+
+
+@st.cache_resource
+def get_quote_fetcher() -> CoalescingQuoteFetcher:
+    """Returns the quote source shared by all sessions, which merges their overlapping requests in memory."""
+    return CoalescingQuoteFetcher(CachingQuoteFetcher(YahooFinance()))
+
+
+@st.cache_data(max_entries=4)
+def load_ledger(version: tuple) -> pd.DataFrame:
+    """Returns the ledger. The `version` token makes any change to the txn table load it again."""
+    df = conn.query('''SELECT * FROM TXN ORDER BY trade_date ASC''', ttl=0)
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    return df
+
+
+@st.cache_resource(max_entries=4, ttl=3600)
+def load_portfolio(version: tuple, no_eod: bool, currency: str) \
+        -> tuple[GroupedPortfolioPerformance, LotTracker | ValueError]:
+    """Returns the grouped portfolio and its lots, shared across reruns until the ledger or the settings change.
+
+    Results are memoized by the instances themselves, so cosmetic reruns don't recompute anything. The ttl picks up
+    new end-of-day quotes.
+
+    Lots are matched per broker, unless shares are sold at another broker than the one they were bought at (i.e.
+    transferred), in which case they are matched per symbol. A ledger that sells more than it holds has no lots, but
+    the error instead.
+    """
+    quote_fetcher = get_quote_fetcher()
+    grouped = GroupedPortfolioPerformance(load_ledger(version), None if no_eod else quote_fetcher,
+                                          base_currency=currency, fx_fetcher=QuoteFXFetcher(quote_fetcher))
+    try:
+        return grouped, LotTracker(grouped.ledger, by=['symbol', 'broker'])
+    except ValueError:
+        try:
+            return grouped, LotTracker(grouped.ledger, by='symbol')
+        except ValueError as e:
+            return grouped, e
+
+
+version = tuple(conn.query(TXN_VERSION_SQL, ttl=0).iloc[0])
+all_txns = load_ledger(version)
+txns = row_selector(all_txns, st_cols=st.columns(2), key='txns', df_cols=['symbol', 'broker'])(all_txns)
 
 metric = st.container()
 chart = st.container()
 pos = st.container()
+brokers = st.container()
 trades = st.container()
 
-portfolio = PortfolioPerformance(txns, None if st.session_state['no_eod'] else YahooFinance())
-valuations = portfolio.daily_valuations()
-positions = portfolio.positions().reset_index()
+grouped, lots = load_portfolio(version, st.session_state['no_eod'], meta.get('currency') or currency)
+selection = {col: None if st.session_state[f'txns {col}'] == 'All' else st.session_state[f'txns {col}']
+             for col in ('symbol', 'broker')}
+
+if materialized:
+    # Indexed range queries over the daily_valuation table:
+    if selection['broker'] is not None:
+        st.caption('Precomputed valuations cover all brokers.')
+    params = {'symbol': selection['symbol']}
+
+    def between(sql: str, date_from: date, date_to: date) -> pd.DataFrame:
+        df = conn.query(sql, params={**params, 'date_from': date_from.isoformat(), 'date_to': date_to.isoformat()},
+                        ttl=0)
+        return df.assign(date=pd.to_datetime(df['date']).dt.date)
+
+    first, last = (pd.to_datetime(conn.query(BOUNDS_SQL, params=params, ttl=0).iloc[0]).dt.date
+                   if not all_txns.empty else (date.today(), date.today()))
+    totals_between = partial(between, TOTALS_SQL)
+
+    def trade_dates_between(date_from: date, date_to: date) -> np.ndarray:
+        return between(TRADE_DATES_SQL, date_from, date_to)['date'].to_numpy()
+
+    positions = conn.query(POSITIONS_SQL, params=params, ttl=0)
+    ledger = grouped.ledger
+    portfolio_irr = irr(ledger[ledger['symbol'] == selection['symbol']] if selection['symbol'] else ledger,
+                        positions, last)
+else:
+    portfolio = grouped.select(**selection)
+    valuations = portfolio.daily_valuations()
+    totals = (valuations[['date', 'invested', 'pl']]
+              .rename(columns={'pl': 'returns'})
+              .groupby('date')
+              .sum()
+              .reset_index())
+    first, last = totals['date'].min(), totals['date'].max()
+    trade_dates = valuations.loc[valuations['price'] > 0, 'date'].unique()
+
+    def totals_between(date_from: date, date_to: date) -> pd.DataFrame:
+        return totals[totals['date'].between(date_from, date_to)]
+
+    def trade_dates_between(date_from: date, date_to: date) -> np.ndarray:
+        return trade_dates[(trade_dates >= date_from) & (trade_dates <= date_to)]
+
+    positions = portfolio.positions().reset_index()
+    portfolio_irr = portfolio.get_irr()
+
+if isinstance(lots, LotTracker):
+    positions = positions.merge(lots.cost_basis()
+                                .merge(txns[lots.by].drop_duplicates())
+                                .groupby('symbol')['cost']
+                                .sum()
+                                .reset_index(), how='left')
+    if 'broker' not in lots.by and selection['broker'] is not None:
+        st.caption('Cost bases cover all brokers, as shares were transferred between them.')
+else:
+    st.warning(f'Cost bases and realized gains are unavailable: {lots}')
+    positions = positions.assign(cost=np.nan)
 pl = positions['pl'].sum()
 
 
 with metric:
     st.metric('Portfolio value',
-              f"€{positions['value'].sum():,.2f}",
-              f"{portfolio.get_irr() * 100:.2f}% | €{pl:,.2f}",
+              f"{currency_symbol}{positions['value'].sum():,.2f}",
+              f"{portfolio_irr * 100:.2f}% | {currency_symbol}{pl:,.2f}",
               border=True, width='content')
 
 with pos, st.expander('Positions'):
-    st.dataframe(positions[['symbol', 'position', 'value', 'pl']],
+    st.dataframe(positions[['symbol', 'position', 'value', 'cost', 'pl']],
                  use_container_width=False, hide_index=True,
                  column_config={
                      'position': st.column_config.NumberColumn(format='localized'),
-                     'value': st.column_config.NumberColumn(format='euro'),
-                     'pl': st.column_config.NumberColumn(format='euro'),
+                     'value': money,
+                     'cost': money,
+                     'pl': money,
                  })
 
+with brokers:
+    if not materialized:
+        with st.expander('Brokers'):
+            st.dataframe(grouped.positions()
+                         .groupby('broker')[['value', 'pl']]
+                         .sum()
+                         .join(grouped.get_irr())
+                         .reset_index(),
+                         use_container_width=False, hide_index=True,
+                         column_config={
+                             'value': money,
+                             'pl': money,
+                             'irr': st.column_config.NumberColumn(format='percent'),
+                         })
+
 with chart:
     returns_only = st.toggle('Returns only', key='show_returns')
-    df = (valuations[['date'] + ([] if returns_only else ['invested']) + ['pl']]
-          .rename(columns={'pl': 'returns'})
-          .groupby('date')
-          .sum()
-          .reset_index()
+    columns = ([] if returns_only else ['invested']) + ['returns']
+
+    # Streamlit doesn't report plotly zoom events, so zooming in is done by narrowing the period, which then draws
+    # the days in it at full resolution (up to the viewport's resolution):
+    period = st.slider('Period', first, last, (first, last), format='D MMM YYYY', key='period',
+                       label_visibility='collapsed') if first < last else (first, last)
+    totals = totals_between(*period)
+    df = (downsample(totals, 'date', columns, threshold=CHART_POINTS)[['date'] + columns]
           .melt(id_vars=['date'], var_name='type', value_name='value'))
 
     fig = px.area(df, x="date", y="value", color="type", line_group='type',
                   color_discrete_map={'invested': '#1f77b4', 'returns': '#2ca02c'})
-    for dt in valuations[valuations['price'] > 0]['date'].unique():
-        fig.add_vline(x=dt, line_dash="dot", line_color="black")
+
+    # All trade markers in a single trace of vertical line segments separated by gaps:
+    trade_dates = trade_dates_between(*period)
+    stacked = totals[columns].sum(axis=1)
+    low, high = min(0, stacked.min(), totals['returns'].min()), max(0, stacked.max())
+    fig.add_trace(go.Scatter(x=np.repeat(trade_dates, 3), y=np.tile([low, high, None], len(trade_dates)),
+                             mode='lines', line=dict(dash='dot', color='black', width=1),
+                             hoverinfo='skip', showlegend=False))
     fig.update_layout(
         xaxis=dict(showgrid=True, tickformat="%d %b %Y", tickangle=45, title=''),
-        yaxis=dict(title='€', showticklabels=not st.session_state['hide_amounts']))
+        yaxis=dict(title=currency_symbol.strip(), showticklabels=not st.session_state['hide_amounts']))
     st.plotly_chart(fig, use_container_width=True)
 
 with trades, st.expander('Trade history'):
-    st.dataframe(txns, use_container_width=True)
+    st.dataframe(txns.merge(lots.realized_gains()[['trade_date', 'symbol', 'broker', 'gain']],
+                            on=['trade_date', 'symbol', 'broker'], how='left')
+                 if isinstance(lots, LotTracker) else txns.assign(gain=np.nan),
+                 use_container_width=True,
+                 column_config={'gain': money})
+
+if recorder is not None:
+    recorder.stop()
+    with st.expander('Profile', expanded=True):
+        st.dataframe(recorder.totals(), use_container_width=True,
+                     column_config={'seconds': st.column_config.NumberColumn(format='%.3f'),
+                                    'self_seconds': st.column_config.NumberColumn(format='%.3f')})
+        st.dataframe(recorder.summary()[['name', 'depth', 'start', 'seconds', 'self_seconds', 'rows']]
+                     .assign(name=lambda df: df['depth'].map(lambda d: '\u2003' * d) + df['name']),
+                     use_container_width=True, hide_index=True)
+        st.download_button('Download', recorder.to_json(indent=2), file_name='profile.json', mime='application/json')
 
 with bottom():
     align('<a href="https://github.com/erikvanzijst/gainly">'
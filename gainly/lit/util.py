@@ -19,6 +19,14 @@ def row_selector(reps: pd.DataFrame, st_cols: list, df_cols: list[str], allow_al
         lambda df: df)
 
 
+CURRENCY_SYMBOLS = {'EUR': '€', 'USD': '$', 'GBP': '£', 'JPY': '¥', 'CHF': 'CHF '}
+
+
+def money_format(currency: str) -> str:
+    """Returns the st.column_config.NumberColumn format for amounts in the given currency."""
+    return {'EUR': 'euro', 'USD': 'dollar', 'JPY': 'yen'}.get(currency, f'{CURRENCY_SYMBOLS.get(currency, currency)}%.2f')
+
+
 def align(content: str, direction: Literal['right', 'center'], nowrap=False, unsafe_allow_html=False):
     st.markdown(f'<div style="text-align: {direction}; width: 100%; {"white-space: nowrap;" if nowrap else ""}">'
                 f'{content if unsafe_allow_html else html.escape(content)}</div>',
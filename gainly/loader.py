@@ -0,0 +1,91 @@
+import sqlite3
+from collections.abc import Iterable
+from typing import Literal, NamedTuple
+
+import pandas as pd
+import pandera.errors
+
+from gainly.db import init_db, table_columns, bump_version, TXN_KEY
+from gainly.portfolio import TransactionSchema
+from gainly.profiling import span, profiled
+
+
+class LoadStats(NamedTuple):
+    inserted: int = 0   # new rows, or in `update` mode: new and updated rows
+    skipped: int = 0    # valid rows that were already in the database
+    rejected: int = 0   # rows that failed validation against the TransactionSchema
+
+    def __add__(self, other: 'LoadStats') -> 'LoadStats':
+        return LoadStats(*(a + b for a, b in zip(self, other)))
+
+
+def validate_chunk(chunk: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """Validates a chunk of transactions, dropping the rows that fail validation.
+
+    :return:    the validated (coerced) rows and the number of rejected rows
+    """
+    rejected = 0
+    while True:
+        try:
+            return TransactionSchema.validate(chunk, lazy=True), rejected
+        except pandera.errors.SchemaErrors as e:
+            bad = e.failure_cases['index'].dropna().unique()
+            if len(bad) == 0:
+                # Not a problem with individual rows, like a missing column:
+                return chunk.iloc[:0], rejected + len(chunk)
+            chunk = chunk.drop(index=bad)
+            rejected += len(bad)
+
+
+@profiled('loader.load_csv_files')
+def load_csv_files(paths: Iterable[str], conn: sqlite3.Connection, chunksize: int = 100_000,
+                   on_conflict: Literal['skip', 'update'] = 'skip') -> LoadStats:
+    """Streams csv files of transactions into the ledger table, in a single transaction.
+
+    Files are read and validated in chunks. Rows that fail validation are rejected without aborting the load. Rows
+    whose (trade_date, symbol, broker) key is already in the database, where an empty broker matches an empty broker,
+    are either skipped or updated, so that overlapping exports can be re-imported.
+
+    :param paths:       the csv files to load
+    :param conn:        the sqlite3 database connection
+    :param chunksize:   the number of rows read, validated and inserted at a time
+    :param on_conflict: whether to `skip` or `update` rows that are already in the database
+    """
+    conn.execute('PRAGMA journal_mode = WAL')
+    init_db(conn)
+    columns = table_columns(conn, 'txn')
+    stats = LoadStats()
+
+    with conn:
+        for path in paths:
+            chunks = pd.read_csv(path, chunksize=chunksize, parse_dates=['trade_date'],
+                                 date_format='%Y-%m-%d %H:%M:%S')
+            while True:
+                with span('loader.read_csv', path=path) as s:
+                    chunk = next(chunks, None)
+                    s.rows = None if chunk is None else len(chunk)
+                if chunk is None:
+                    break
+                with span('loader.validate') as s:
+                    df, rejected = validate_chunk(chunk)
+                    s.rows = len(df)
+                stats += LoadStats(rejected=rejected)
+                if df.empty:
+                    continue
+
+                cols = [c for c in df.columns if c in columns]
+                df = (df[cols]
+                      .assign(trade_date=df['trade_date'].dt.strftime('%Y-%m-%d %H:%M:%S'))
+                      .astype(object)
+                      .where(df[cols].notna(), None))
+                sql = (f'INSERT INTO txn ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))}) '
+                       f'ON CONFLICT ({TXN_KEY}) DO ' +
+                       ('NOTHING' if on_conflict == 'skip' else
+                        'UPDATE SET ' + ', '.join(f'{c} = excluded.{c}' for c in cols)))
+
+                with span('loader.insert') as s:
+                    inserted = s.rows = conn.executemany(sql, df.itertuples(index=False, name=None)).rowcount
+                stats += LoadStats(inserted=inserted, skipped=len(df) - inserted)
+        if stats.inserted:
+            bump_version(conn)
+    return stats
@@ -0,0 +1,144 @@
+from collections import deque
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+import pandera.pandas as pa
+from pandera.typing.pandas import DataFrame
+
+from gainly.portfolio import TransactionSchema
+from gainly.validation import check_types, check_mode, ValidationMode
+
+LotMethod = Literal['fifo', 'lifo', 'average']
+METHODS = ('fifo', 'lifo', 'average')
+
+EPSILON = 1e-9      # positions smaller than this are considered closed
+
+
+class RealizedGainSchema(TransactionSchema):
+    proceeds: float = pa.Field(coerce=True)
+    cost: float = pa.Field(coerce=True)
+    gain: float = pa.Field(coerce=True)
+
+
+class CostBasisSchema(pa.DataFrameModel):
+    symbol: str = pa.Field(coerce=True)
+    position: float = pa.Field(ge=0, coerce=True)
+    cost: float = pa.Field(coerce=True)
+    average_price: float = pa.Field(coerce=True)
+
+
+class LotTracker(object):
+    """Matches sells against the open lots they close to compute realized capital gains and cost bases.
+
+    Every (symbol, broker) combination (or just every symbol, see `by`) keeps a queue of open lots of
+    [quantity, price]. Buys append a lot, sells consume lots from the front (fifo) or the back (lifo), so that
+    matching a whole ledger is linear in the number of trades. With the average cost method a position is a single
+    lot whose price is the average price paid.
+
+    Transactions can be appended later on, which only processes the new trades, unless any of them is back-dated
+    before the last trade seen so far, in which case all lots are rebuilt.
+    """
+
+    @check_types(boundary=True)
+    def __init__(self, transactions: DataFrame[TransactionSchema] = None, method: LotMethod = 'fifo',
+                 by: str | list[str] = 'symbol', *, validation: ValidationMode = None):
+        """
+        :param transactions:    a DataFrame of transactions, with columns:
+                                trade_date, symbol, price, quantity, broker
+        :param method:          how sells are matched against open lots: fifo, lifo or average
+        :param by:              the column(s) that identify a position, e.g. ['symbol', 'broker']
+        :param validation:      the validation mode for this instance
+        """
+        if method not in METHODS:
+            raise ValueError(f'Unknown lot matching method: {method} (expected one of {", ".join(METHODS)})')
+        self.validation = check_mode(validation)
+        self.method = method
+        self.by = [by] if isinstance(by, str) else list(by)
+        self.txns = pd.DataFrame(columns=TransactionSchema.to_schema().columns.keys())
+        self._reset()
+        if transactions is not None:
+            self.append(transactions)
+
+    def _reset(self):
+        self._lots: dict[tuple, deque] = {}
+        self._sells: list[int] = []     # the positions in self.txns of the sell transactions
+        self._costs: list[float] = []   # the cost basis of the quantity sold by each sell transaction
+
+    @check_types(boundary=True)
+    def append(self, transactions: DataFrame[TransactionSchema]) -> None:
+        """Adds transactions to the ledger and matches them against the open lots."""
+        transactions = transactions.sort_values('trade_date', kind='stable')
+        if transactions.empty:
+            return
+        if self.txns.empty:
+            self.txns = transactions.reset_index(drop=True)
+            self._match(0)
+        elif transactions['trade_date'].iloc[0] < self.txns['trade_date'].iloc[-1]:
+            # Back-dated trades change the order in which lots were opened and closed:
+            self.txns = (pd.concat([self.txns, transactions], ignore_index=True)
+                         .sort_values('trade_date', kind='stable')
+                         .reset_index(drop=True))
+            self._reset()
+            self._match(0)
+        else:
+            start = len(self.txns)
+            self.txns = pd.concat([self.txns, transactions], ignore_index=True)
+            self._match(start)
+
+    def _match(self, start: int):
+        """Processes the transactions in self.txns from position `start` onwards."""
+        df = self.txns.iloc[start:]
+        keys = zip(*(df[col].tolist() for col in self.by))
+        fifo = self.method == 'fifo'
+        average = self.method == 'average'
+
+        for i, (key, trade_date, price, quantity) in enumerate(
+                zip(keys, df['trade_date'], df['price'].tolist(), df['quantity'].tolist()), start):
+            lots = self._lots.setdefault(key, deque())
+            if quantity >= 0:
+                if average and lots:
+                    lot = lots[0]
+                    total = lot[0] + quantity
+                    lot[1] = (lot[0] * lot[1] + quantity * price) / total if total > EPSILON else price
+                    lot[0] = total
+                else:
+                    lots.append([quantity, price])
+                continue
+
+            remaining = -quantity
+            cost = 0.
+            while remaining > EPSILON:
+                if not lots:
+                    raise ValueError(f'Selling {-quantity:g} {"/".join(map(str, key))} on {trade_date}, '
+                                     f'{remaining:g} more than the open position')
+                lot = lots[0] if fifo or average else lots[-1]
+                matched = min(lot[0], remaining)
+                cost += matched * lot[1]
+                lot[0] -= matched
+                remaining -= matched
+                if lot[0] <= EPSILON:
+                    lots.popleft() if fifo or average else lots.pop()
+            self._sells.append(i)
+            self._costs.append(cost)
+
+    @check_types
+    def realized_gains(self) -> DataFrame[RealizedGainSchema]:
+        """Returns every sell transaction with its proceeds, the cost basis of the lots it closed and the gain."""
+        sells = self.txns.iloc[self._sells]
+        proceeds = sells['price'] * -sells['quantity']
+        cost = np.array(self._costs, dtype=float)
+        return (sells
+                .assign(proceeds=proceeds, cost=cost, gain=proceeds - cost)
+                .reset_index(drop=True))
+
+    @check_types
+    def cost_basis(self) -> DataFrame[CostBasisSchema]:
+        """Returns the quantity and total cost of the open lots of every position."""
+        rows = [(*key, sum(lot[0] for lot in lots), sum(lot[0] * lot[1] for lot in lots))
+                for key, lots in self._lots.items()]
+        df = pd.DataFrame(rows, columns=[*self.by, 'position', 'cost'])
+        return (df[df['position'] > EPSILON]
+                .assign(average_price=lambda df: df['cost'] / df['position'])
+                .sort_values(self.by)
+                .reset_index(drop=True))
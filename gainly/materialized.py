@@ -0,0 +1,133 @@
+import sqlite3
+from datetime import date
+from typing import NamedTuple
+
+import pandas as pd
+from pyxirr import xirr
+
+from gainly.db import VALUATION_DDL, init_db
+from gainly.engine import ValuationEngine
+from gainly.eod import QuoteFetcher
+from gainly.fx import FXFetcher
+from gainly.portfolio import PortfolioPerformance, ValuationCheckpoint
+
+COLUMNS = ['date', 'symbol', 'price', 'position', 'invested', 'close', 'value', 'pl']
+
+# Queries for reading the materialized valuations. The named parameters work with both sqlite3 and SQLAlchemy.
+VALUATIONS_SQL = f'''
+    SELECT {", ".join(COLUMNS)} FROM daily_valuation
+    WHERE date BETWEEN :date_from AND :date_to AND (:symbol IS NULL OR symbol = :symbol)
+    ORDER BY date, symbol'''
+POSITIONS_SQL = '''
+    SELECT symbol, position, value, invested, pl FROM daily_valuation
+    WHERE date = (SELECT max(date) FROM daily_valuation) AND (:symbol IS NULL OR symbol = :symbol)
+    ORDER BY symbol'''
+TOTALS_SQL = '''
+    SELECT date, total(invested) AS invested, total(pl) AS returns FROM daily_valuation
+    WHERE date BETWEEN :date_from AND :date_to AND (:symbol IS NULL OR symbol = :symbol)
+    GROUP BY date ORDER BY date'''
+TRADE_DATES_SQL = '''
+    SELECT DISTINCT date FROM daily_valuation
+    WHERE date BETWEEN :date_from AND :date_to AND (:symbol IS NULL OR symbol = :symbol) AND price > 0
+    ORDER BY date'''
+BOUNDS_SQL = '''
+    SELECT min(date) AS first, max(date) AS last FROM daily_valuation WHERE (:symbol IS NULL OR symbol = :symbol)'''
+META_SQL = 'SELECT key, value FROM valuation_meta'
+MATERIALIZED_SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'valuation_meta'"
+
+
+class RefreshStats(NamedTuple):
+    as_of: date | None  # the date up to which the valuations are final
+    rows: int           # the number of rows written
+    full: bool          # whether everything was recomputed
+
+
+def init_valuation_db(conn: sqlite3.Connection):
+    """Creates the ledger and valuation tables if they do not exist yet."""
+    init_db(conn)
+    conn.executescript(VALUATION_DDL)
+
+
+def read_meta(conn: sqlite3.Connection) -> dict[str, str]:
+    return dict(conn.execute(META_SQL).fetchall())
+
+
+def read_checkpoint(conn: sqlite3.Connection) -> ValuationCheckpoint | None:
+    """Returns the checkpoint of the materialized valuations, with only the rows of its last day."""
+    meta = read_meta(conn)
+    if 'as_of' not in meta:
+        return None
+    as_of = date.fromisoformat(meta['as_of'])
+    rows = read_valuations(conn, as_of, as_of)
+    return ValuationCheckpoint(as_of, rows, int(meta['txn_count']), int(meta['txn_digest']))
+
+
+def read_valuations(conn: sqlite3.Connection, date_from: date = date.min, date_to: date = date.max,
+                    symbol: str = None) -> pd.DataFrame:
+    """Returns the materialized daily valuations between two dates (inclusive), optionally of one symbol."""
+    df = pd.read_sql(VALUATIONS_SQL, conn, params={'date_from': date_from.isoformat(),
+                                                   'date_to': date_to.isoformat(),
+                                                   'symbol': symbol})
+    return df.assign(date=pd.to_datetime(df['date']).dt.date).astype({col: float for col in COLUMNS[2:]})
+
+
+def read_positions(conn: sqlite3.Connection, symbol: str = None) -> pd.DataFrame:
+    """Returns the positions on the last materialized day, like `PortfolioPerformance.positions()`."""
+    return pd.read_sql(POSITIONS_SQL, conn, params={'symbol': symbol}).set_index('symbol')
+
+
+def irr(txns: pd.DataFrame, positions: pd.DataFrame, as_of: date) -> float:
+    """Returns the xirr of the transactions, with the value of the positions on `as_of` as the final inflow."""
+    cashflows = pd.concat([pd.DataFrame({'date': txns['trade_date'].dt.date, 'cf': -txns['price'] * txns['quantity']}),
+                           pd.DataFrame({'date': [as_of], 'cf': [positions['value'].clip(lower=0).sum()]})])
+    return xirr(cashflows.groupby('date')['cf'].sum().reset_index())
+
+
+def refresh_valuations(conn: sqlite3.Connection, quote_fetcher: QuoteFetcher = None,
+                       engine: str | ValuationEngine = 'pandas', full: bool = False,
+                       base_currency: str = None, fx_fetcher: FXFetcher = None) -> RefreshStats:
+    """Brings the daily_valuation table up to date with the txn table, in a single transaction.
+
+    The valuations are extended from the last materialized checkpoint, so only the quotes and trades after it are
+    processed, unless the ledger changed before the checkpoint, the base currency or the source of the closes
+    (quotes or trade prices only) changed, or `full` is set, in which case the table is rebuilt.
+    """
+    init_valuation_db(conn)
+    txns = pd.read_sql('SELECT * FROM txn ORDER BY trade_date', conn)
+    txns['trade_date'] = pd.to_datetime(txns['trade_date'])
+
+    with conn:
+        if txns.empty:
+            conn.execute('DELETE FROM daily_valuation')
+            conn.execute('DELETE FROM valuation_meta')
+            return RefreshStats(None, 0, True)
+
+        portfolio = PortfolioPerformance(txns, quote_fetcher, engine,
+                                         base_currency=base_currency, fx_fetcher=fx_fetcher)
+        settings = {'currency': base_currency or '', 'quotes': 'none' if quote_fetcher is None else 'eod'}
+        checkpoint = None if full else read_checkpoint(conn)
+        meta = read_meta(conn)
+        resume = (checkpoint is not None and all(meta.get(key, '') == value for key, value in settings.items()) and
+                  portfolio.matches(checkpoint))
+        if resume:
+            valuations = portfolio.resume_from(checkpoint)
+            rows = valuations[valuations['date'] > checkpoint.as_of]
+            conn.execute('DELETE FROM daily_valuation WHERE date > ?', (checkpoint.as_of.isoformat(),))
+        else:
+            rows = portfolio.daily_valuations()
+            conn.execute('DELETE FROM daily_valuation')
+
+        conn.executemany(f'INSERT INTO daily_valuation ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})',
+                         rows[COLUMNS]
+                         .assign(date=pd.to_datetime(rows['date']).dt.strftime('%Y-%m-%d'))
+                         .astype(object)
+                         .where(rows[COLUMNS].notna(), None)
+                         .itertuples(index=False, name=None))
+
+        latest = portfolio.checkpoint()
+        conn.executemany('INSERT OR REPLACE INTO valuation_meta (key, value) VALUES (?, ?)',
+                         [('as_of', latest.as_of.isoformat()),
+                          ('txn_count', str(latest.txn_count)),
+                          ('txn_digest', str(latest.txn_digest)),
+                          *settings.items()])
+    return RefreshStats(latest.as_of, len(rows), not resume)
@@ -1,13 +1,21 @@
-from datetime import date, datetime
-from functools import reduce
-from itertools import product
+import inspect
+from datetime import date, datetime, timedelta
+from functools import wraps
+from typing import NamedTuple, Optional
 
 import pandas as pd
 import pandera.pandas as pa
 from pandera.typing.pandas import Index, DataFrame
 from pyxirr import xirr
 
-from gainly.eod import QuoteFetcher, NullQuoteFetcher
+from gainly.dtypes import DTypes, check_dtypes, compact, to_days, as_day
+from gainly.engine import ValuationEngine, ENGINES
+from gainly.eod import QuoteFetcher, NullQuoteFetcher, EODPriceSchema
+from gainly.fx import FXFetcher, FXRateSchema, convert
+from gainly.profiling import span, profiled
+from gainly.returns import return_series
+from gainly.snapshot import PositionIndex
+from gainly.validation import check_types, check_mode, ValidationMode
 
 
 class TransactionSchema(pa.DataFrameModel):
@@ -16,6 +24,7 @@ class TransactionSchema(pa.DataFrameModel):
     price: float = pa.Field(ge=0, coerce=True)
     quantity: float = pa.Field(coerce=True)
     broker: str = pa.Field(nullable=True, coerce=True)
+    currency: Optional[str] = pa.Field(nullable=True, coerce=True)     # the currency of the price
 
 
 class DailyPositionsSchema(pa.DataFrameModel):
@@ -40,101 +49,369 @@ class PositionsSchema(pa.DataFrameModel):
     pl: float = pa.Field(coerce=True)
 
 
+class SnapshotSchema(pa.DataFrameModel):
+    date: date = pa.Field(coerce=True)
+    symbol: str = pa.Field(coerce=True)
+    position: float = pa.Field(ge=0, coerce=True)
+    value: float = pa.Field(coerce=True)
+    invested: float = pa.Field(coerce=True)
+    pl: float = pa.Field(coerce=True)
+
+
+class ValuationCheckpoint(NamedTuple):
+    """The daily valuations of a ledger up to and including `as_of`, from which they can be extended later."""
+    as_of: date
+    valuations: DataFrame[DailyValuationSchema]
+    txn_count: int      # the number of transactions traded on or before `as_of`
+    txn_digest: int     # a content hash of those transactions
+
+
+def memo_key(name: str, *args, **kwargs) -> tuple:
+    return name, args, tuple(sorted(kwargs.items()))
+
+
+def memoized(method):
+    """Caches the result of a PortfolioPerformance method until the instance is invalidated.
+
+    Every caller receives its own copy of a cached DataFrame, so the cached result can't be mutated. Arguments are
+    keyed by name and left out when they equal their default, so that e.g. `daily_valuations()` and
+    `daily_valuations(freq=None)` share their result.
+    """
+    sig = inspect.signature(method)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        arguments = list(sig.bind(self, *args, **kwargs).arguments.items())[1:]
+        key = memo_key(method.__name__, **{name: value for name, value in arguments
+                                           if value != sig.parameters[name].default})
+        if key not in self._memo:
+            self._memo[key] = method(self, *args, **kwargs)
+        result = self._memo[key]
+        return result.copy() if isinstance(result, (pd.DataFrame, pd.Series)) else result
+    return wrapper
+
+
 class PortfolioPerformance(object):
     """Calculates portfolio performance."""
 
-    @pa.check_types
-    def __init__(self, transactions: DataFrame[TransactionSchema], quote_fetcher: QuoteFetcher = None):
+    @check_types(boundary=True)
+    def __init__(self, transactions: DataFrame[TransactionSchema], quote_fetcher: QuoteFetcher = None,
+                 engine: str | ValuationEngine = 'pandas', *, validation: ValidationMode = None,
+                 base_currency: str = None, fx_fetcher: FXFetcher = None, dtypes: DTypes = 'object'):
         """
         :param transactions:    a DataFrame of transactions, with columns:
-                                trade_date, symbol, price, quantity
+                                trade_date, symbol, price, quantity and optionally currency
         :param quote_fetcher:   a QuoteFetcher instance for historical end-of-day price data
+        :param engine:          the ValuationEngine (or the name of one: 'pandas' or 'numpy') that computes the
+                                daily positions and valuations
+        :param validation:      the validation mode for this instance (see `gainly.validation`), defaults to the
+                                global mode
+        :param base_currency:   the currency to value the portfolio in; when set, the prices and end-of-day quotes
+                                of transactions in other currencies are converted at the day's exchange rate
+        :param fx_fetcher:      the source of exchange rates, needed when converting to the base currency
+        :param dtypes:          the representation of the frames (see `gainly.dtypes`): `object`, or `compact` for
+                                categorical symbols and datetime64 dates, or `compact32` for float32 amounts as well
         """
+        self.validation = check_mode(validation)
+        self.dtypes = check_dtypes(dtypes)
+        self._memo = {}
+        self.quote_fetcher = quote_fetcher or NullQuoteFetcher()
+        self.engine = ENGINES[engine]() if isinstance(engine, str) else engine
+        self.base_currency = base_currency
+        self.fx_fetcher = fx_fetcher
         self.txns = transactions.copy()
-        quote_fetcher = quote_fetcher or NullQuoteFetcher()
-        self.eod_prices = reduce(
-            lambda x, y: pd.concat([x, y]),
-            (quote_fetcher.get_oed_prices(symbol,
-                                          date_from=self.txns['trade_date'].min().date(),
-                                          date_to=max(self.txns['trade_date'].max().date(), date.today()))
-             for symbol in self.txns['symbol'].unique()))
-
-    @pa.check_types
-    def daily_positions(self) -> DataFrame[DailyPositionsSchema]:
-        """Returns a DataFrame of daily positions for the portfolio."""
-        df = self.txns.copy().set_index('trade_date').sort_index()
-        df['position'] = (df.groupby('symbol')['quantity']
-                            .cumsum())
-        df['invested'] = (df.assign(invested=df['price'] * df['quantity'])
-                            .groupby('symbol')['invested']
-                            .cumsum())
-
-        # Convert datetime index to date
-        df.index = df.index.date
-
-        # Get end-of-day positions, price and total invested amount per symbol
-        daily_positions = (df[['symbol', 'price', 'position', 'invested']]
-                           .groupby([df.index, 'symbol'])
-                           .last()
-                           .reset_index(names=['date', 'symbol']))
-
-        # Merge the eod prices with the daily positions:
-        daily_positions = daily_positions.merge(self.eod_prices, how='outer', on=['date', 'symbol'])
-
-        # Create the cartesian product grid of all trade dates and symbols:
-        grid = pd.DataFrame(list(product(daily_positions['date'].unique(), daily_positions['symbol'].unique())),
-                            columns=['date', 'symbol'])
-        # Merge grid with positions data so that we can generate a position for each day and symbol
-        daily_positions = daily_positions.merge(grid, how='outer')
-
-        # On dates where we don't have a trade for all symbols, fill the position with the previous day's position
-        # for each symbol:
-        daily_positions['position'] = daily_positions.groupby('symbol')['position'].ffill()
-        daily_positions['invested'] = daily_positions.groupby('symbol')['invested'].ffill()
-        return daily_positions
-
-    @pa.check_types
-    def daily_valuations(self) -> DataFrame[DailyValuationSchema]:
-        """Returns a DataFrame with the day-to-day total value of the portfolio."""
-        daily_positions = self.daily_positions()
-
-        # Now that we have a position for each symbol on each day, we can calculate the total value of the portfolio
-        # by multiplying the position by "price", or "close":
-        daily_positions['value'] = (daily_positions['position'] *
-                                    daily_positions['price'].combine_first(daily_positions['close']))
-        daily_positions['pl'] = daily_positions['value'] - daily_positions['invested']
-
-        # For days when we can't calculate the value of a symbol's position due to lack of both a trade price and an
-        # EOD price, carry forward the previous day's value for that symbol:
-        daily_positions['value'] = daily_positions.groupby('symbol')['value'].ffill()
-        daily_positions['pl'] = daily_positions.groupby('symbol')['pl'].ffill()
-
-        return daily_positions.pipe(DataFrame[DailyValuationSchema])
-
-    @pa.check_types
-    def positions(self) -> DataFrame[PositionsSchema]:
+
+    @property
+    def txns(self) -> DataFrame[TransactionSchema]:
+        return self._txns
+
+    @txns.setter
+    def txns(self, transactions: DataFrame[TransactionSchema]):
+        self._txns = compact(transactions, self.dtypes, float32=())
+        self.invalidate(quotes=True)
+
+    def _compact(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Returns a frame in this instance's representation, with categories shared with the ledger's symbols."""
+        if self.dtypes == 'object':
+            return df
+        return compact(df, self.dtypes, self.txns['symbol'].cat.categories.union(df['symbol'].dropna().unique()))
+
+    @property
+    def converting(self) -> bool:
+        """Whether prices are converted to the base currency."""
+        return (self.base_currency is not None and 'currency' in self.txns.columns and
+                bool((self.txns['currency'].notna() & (self.txns['currency'] != self.base_currency)).any()))
+
+    @property
+    def fx_rates(self) -> DataFrame[FXRateSchema]:
+        """The exchange rates from the ledger's currencies to the base currency, fetched in one batch on first
+        access."""
+        if self._fx_rates is None:
+            if self.fx_fetcher is None:
+                raise ValueError(f'An fx_fetcher is needed to convert to {self.base_currency}')
+            with span('portfolio.fx_rates') as s:
+                self._fx_rates = self.fx_fetcher.get_rates(
+                    self.txns['currency'].dropna().unique(), self.base_currency,
+                    date_from=self.txns['trade_date'].min().date() - timedelta(days=7),
+                    date_to=max(self.txns['trade_date'].max().date(), date.today()))
+                s.rows = len(self._fx_rates)
+        return self._fx_rates
+
+    @property
+    def ledger(self) -> DataFrame[TransactionSchema]:
+        """The transactions with their prices in the base currency."""
+        if not self.converting:
+            return self.txns
+        if self._ledger is None:
+            rates = self.fx_rates
+            with span('fx.convert', frame='ledger') as s:
+                self._ledger = self.txns.assign(price=convert(self.txns['price'], self.txns['trade_date'],
+                                                              self.txns['currency'], self.base_currency, rates))
+                s.rows = len(self._ledger)
+        return self._ledger
+
+    def fetch_quotes(self, symbols, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        """Fetches the end-of-day prices of the given symbols in the base currency."""
+        with span('portfolio.fetch_quotes') as s:
+            quotes = self.quote_fetcher.get_eod_prices_many(symbols, date_from=date_from, date_to=date_to)
+            s.rows = len(quotes)
+        if not self.converting:
+            return self._compact(quotes)
+        currencies = self.txns.dropna(subset=['currency']).groupby('symbol', observed=True)['currency'].last()
+        rates = self.fx_rates
+        with span('fx.convert', frame='quotes') as s:
+            quotes = quotes.assign(close=convert(quotes['close'], quotes['date'], quotes['symbol'].map(currencies),
+                                                 self.base_currency, rates))
+            s.rows = len(quotes)
+        return self._compact(quotes)
+
+    @property
+    def eod_prices(self) -> DataFrame[EODPriceSchema]:
+        """The end-of-day prices of all symbols in the ledger (in the base currency), fetched in one batch on first
+        access."""
+        if self._eod_prices is None:
+            self._eod_prices = self.fetch_quotes(
+                self.txns['symbol'].unique(),
+                date_from=self.txns['trade_date'].min().date(),
+                date_to=max(self.txns['trade_date'].max().date(), date.today()))
+        return self._eod_prices
+
+    @eod_prices.setter
+    def eod_prices(self, prices: DataFrame[EODPriceSchema]):
+        self.invalidate()
+        self._eod_prices = self._compact(prices)
+
+    def invalidate(self, quotes: bool = False):
+        """Discards all memoized results.
+
+        Assigning to `txns` or `eod_prices` does this automatically. Call this after modifying either in place.
+
+        :param quotes:  also discard the end-of-day prices and exchange rates, so they are fetched again on next use
+        """
+        self._memo.clear()
+        if quotes:
+            self._eod_prices = None
+            self._fx_rates = None
+            self._ledger = None
+
+    def _run(self, method: str, freq: str = None) -> pd.DataFrame:
+        """Runs an engine method on the ledger and quotes, passing `freq` only when resampling so that engines
+        without that option keep working."""
+        return self._compact(getattr(self.engine, method)(self.ledger, self.eod_prices, *([freq] if freq else [])))
+
+    @memoized
+    @profiled('portfolio.daily_positions')
+    @check_types
+    def daily_positions(self, freq: str = None) -> DataFrame[DailyPositionsSchema]:
+        """Returns a DataFrame of daily positions for the portfolio.
+
+        :param freq:    a period alias like 'W' or 'M' to only return the positions at the end of every period, each
+                        labelled by its last date (see `ValuationEngine`), or None for every day
+        """
+        return self._run('daily_positions', freq)
+
+    @memoized
+    @profiled('portfolio.daily_valuations')
+    @check_types
+    def daily_valuations(self, freq: str = None) -> DataFrame[DailyValuationSchema]:
+        """Returns a DataFrame with the day-to-day total value of the portfolio.
+
+        :param freq:    a period alias like 'W' or 'M' to only return the valuations at the end of every period, or
+                        None for every day
+        """
+        return self._run('daily_valuations', freq)
+
+    def checkpoint(self, as_of: date = None) -> ValuationCheckpoint:
+        """Returns a checkpoint of the daily valuations up to and including `as_of`.
+
+        :param as_of:   the checkpoint date, defaults to the last valuation date before today, as today's quotes
+                        are still subject to change
+        """
+        valuations = self.daily_valuations()
+        if as_of is None:
+            dates = valuations.loc[valuations['date'] < as_day(date.today(), valuations['date']), 'date']
+            as_of = (dates if not dates.empty else valuations['date']).max()
+            as_of = as_of.date() if isinstance(as_of, pd.Timestamp) else as_of
+        history = self.txns[self.txns['trade_date'].dt.date <= as_of]
+        return ValuationCheckpoint(as_of,
+                                   valuations[valuations['date'] <= as_day(as_of, valuations['date'])]
+                                   .reset_index(drop=True),
+                                   len(history), ledger_digest(history))
+
+    def matches(self, checkpoint: ValuationCheckpoint) -> bool:
+        """Returns whether the checkpoint can be extended with the ledger: the transactions up to the checkpoint's date
+        are still those it was taken from, and no symbol was traded for the first time after it.
+
+        The valuations of a new symbol cover the dates of its quotes from the start of the ledger, which the
+        checkpoint does not have.
+        """
+        history = self.txns[self.txns['trade_date'].dt.date <= checkpoint.as_of]
+        return (len(history) == checkpoint.txn_count and ledger_digest(history) == checkpoint.txn_digest and
+                pd.Index(self.txns['symbol'].unique()).isin(checkpoint.valuations['symbol'].unique()).all())
+
+    @profiled('portfolio.resume_from')
+    @check_types
+    def resume_from(self, checkpoint: ValuationCheckpoint) -> DataFrame[DailyValuationSchema]:
+        """Returns the daily valuations by extending a checkpoint with the transactions and quotes after it.
+
+        Only the quotes after the checkpoint are fetched and the checkpoint's valuations are not recomputed, unless
+        the ledger no longer matches the checkpoint (a back-dated transaction was added, one was changed or removed,
+        or a new symbol was traded) in which case everything is recomputed. The result becomes this instance's
+        `daily_valuations()`.
+        """
+        if not self.matches(checkpoint):
+            return self.daily_valuations()
+
+        txns = self.ledger[self.ledger['trade_date'].dt.date > checkpoint.as_of]
+        symbols = checkpoint.valuations['symbol'].unique()
+        quotes = self.fetch_quotes(
+            symbols,
+            date_from=checkpoint.as_of + timedelta(days=1),
+            date_to=max(self.txns['trade_date'].max().date(), date.today()))
+        quotes = quotes[quotes['date'] > as_day(checkpoint.as_of, quotes['date'])]
+
+        valuations = self._compact(checkpoint.valuations)
+        if len(txns) or len(quotes):
+            tail = extend(valuations[valuations['date'] == as_day(checkpoint.as_of, valuations['date'])],
+                          self.engine.daily_valuations(txns, quotes), symbols)
+            valuations = self._compact(pd.concat([valuations, tail])).reset_index(drop=True)
+
+        self._memo[memo_key('daily_valuations')] = valuations
+        return valuations.copy()
+
+    @memoized
+    @profiled('portfolio.positions')
+    @check_types
+    def positions(self, freq: str = None) -> DataFrame[PositionsSchema]:
         """Returns the portfolio's current positions along with the current market value for each position.
 
-        :return:    a DataFrame adhering to the `positionsSchema` schema.
+        :param freq:    the frequency of the valuations to take the last one of, which does not change the result
+                        but can be cheaper than the daily valuations when those are not needed otherwise
+        :return:        a DataFrame adhering to the `positionsSchema` schema.
         """
         return (self
-                .daily_valuations()
-                .groupby('symbol')[['position', 'value', 'invested', 'pl']]
+                .daily_valuations(freq)
+                .groupby('symbol', observed=True)[['position', 'value', 'invested', 'pl']]
                 .last())
 
-    def get_irr(self):
-        """Returns the portfolio's xirr."""
-        trades = self.txns.assign(date=self.txns['trade_date'].dt.date)
+    @memoized
+    def _position_index(self) -> PositionIndex:
+        with span('portfolio.position_index') as s:
+            index = PositionIndex(self.ledger, self.eod_prices)
+            s.rows = len(index.trade_keys) + len(index.quote_keys)
+        return index
+
+    @profiled('portfolio.positions_as_of_many')
+    @check_types
+    def positions_as_of_many(self, dates) -> DataFrame[SnapshotSchema]:
+        """Returns the positions and their market value at the end of each of the given dates, without computing
+        the daily valuations.
+
+        The ledger's running totals and the quotes are indexed once (and kept until the instance is invalidated),
+        after which every date is a binary search per symbol. The rows are those of `daily_valuations()` on the last
+        date on or before each date, for the symbols traded by then.
+
+        :param dates:   the dates, in any order
+        :return:        a DataFrame adhering to the `SnapshotSchema` schema, in the order of the dates
+        """
+        dates = pd.Series(pd.to_datetime(pd.Series(list(dates), dtype=object)).dt.normalize())
+        snapshot = self._position_index().lookup(dates)
+        day = dates.iloc[snapshot.index].reset_index(drop=True)
+        snapshot = snapshot.reset_index(drop=True)
+        snapshot.insert(0, 'date', day.dt.date if self.dtypes == 'object' else day)
+        return self._compact(snapshot)
+
+    @profiled('portfolio.positions_as_of')
+    @check_types
+    def positions_as_of(self, as_of: date) -> DataFrame[PositionsSchema]:
+        """Returns the portfolio's positions along with their market value at the end of the given date, like
+        `positions()` would have returned then.
+
+        :param as_of:   the date
+        :return:        a DataFrame adhering to the `PositionsSchema` schema.
+        """
+        return (self
+                .positions_as_of_many([as_of])
+                .drop(columns='date')
+                .set_index('symbol'))
+
+    @memoized
+    @profiled('portfolio.cashflows')
+    def cashflows(self) -> pd.DataFrame:
+        """Returns the portfolio's net cashflow per date, with the current value of all positions as the final
+        inflow."""
+        trades = self.ledger.assign(date=to_days(self.ledger['trade_date'], self.dtypes != 'object'))
         cashflows = trades.assign(cf=trades['price'] * trades['quantity'] * -1)[['date', 'cf']]
 
         remaining_value = (self
                            .daily_valuations()
-                           .groupby('symbol')[['date', 'value']]
+                           .groupby('symbol', observed=True)[['date', 'value']]
                            .last()
                            .reset_index(drop=True)
                            .rename(columns={'value': 'cf'})
                            .pipe(lambda df: df.where(df['cf'] > 0)))
 
-        cashflows = pd.concat([cashflows, remaining_value]).groupby(['date']).sum()
+        return pd.concat([cashflows, remaining_value]).groupby(['date']).sum()
+
+    @memoized
+    @profiled('portfolio.get_irr')
+    def get_irr(self):
+        """Returns the portfolio's xirr."""
+        return xirr(self.cashflows().reset_index())
+
+    @memoized
+    @profiled('portfolio.returns')
+    def returns(self, per_symbol: bool = False, window: timedelta | str | None = None) -> pd.DataFrame:
+        """Returns the time-weighted (twr) and money-weighted (irr) return up to every date of the daily valuations.
+
+        :param per_symbol:  whether to compute the returns of every symbol separately
+        :param window:      the length of trailing windows (e.g. '365D'), or None for returns since inception
+        """
+        return return_series(self.daily_valuations(), per_symbol, window)
+
+
+def ledger_digest(txns: pd.DataFrame) -> int:
+    """Returns an order-independent content hash of a ledger."""
+    return int(pd.util.hash_pandas_object(txns[['trade_date', 'symbol', 'price', 'quantity']], index=False)
+               .sum())
+
+
+def extend(state: pd.DataFrame, tail: pd.DataFrame, symbols) -> pd.DataFrame:
+    """Continues the running positions, invested amounts and values of `state` (the last row of every symbol
+    before the tail) into `tail`, which was computed from the subsequent transactions and quotes only."""
+    tail = (tail
+            .set_index(['date', 'symbol'])
+            .reindex(pd.MultiIndex.from_product([tail['date'].unique(), sorted(symbols)], names=['date', 'symbol']))
+            .reset_index())
+    state = state.set_index('symbol').reindex(tail['symbol']).set_index(tail.index)
+
+    # The tail's running totals start at zero, so they're offset by the state:
+    for col in ('position', 'invested'):
+        tail[col] = tail[col].add(state[col], fill_value=0)
 
-        return xirr(cashflows.reset_index())
+    # Where the tail has no price yet, the state's value and pl are carried forward:
+    value = tail['position'] * tail['price'].combine_first(tail['close'])
+    pl = value - tail['invested']
+    tail['value'] = value.groupby(tail['symbol'], observed=True).ffill().fillna(state['value'])
+    tail['pl'] = pl.groupby(tail['symbol'], observed=True).ffill().fillna(state['pl'])
+    return tail
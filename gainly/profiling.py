@@ -0,0 +1,180 @@
+"""Lightweight, in-process profiling of the valuation pipeline with named spans.
+
+Instrumented code marks its stages with `span()` (or the `profiled` decorator). While a `Recorder` is active, every
+span records its wall time, the number of rows it produced, optionally the change in traced memory, and its parent
+span, so that time can be attributed to e.g. HTTP requests, validation, merges or forward fills. Without an active
+recorder spans do next to nothing.
+
+    with recording() as recorder:
+        portfolio.daily_valuations()
+    print(recorder.summary())
+
+The active recorder is held in a context variable, so concurrent Streamlit sessions each record their own spans.
+"""
+import json
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar, Token, copy_context
+from functools import wraps
+from time import perf_counter
+from typing import Any
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+
+class Span(object):
+    """A timed stage. Set `rows` to the size of what the stage produced, when that is not its return value."""
+    __slots__ = ('name', 'parent', 'depth', 'start', 'seconds', 'rows', 'memory', 'attrs')
+
+    def __init__(self, name: str, parent: int | None, depth: int, start: float, attrs: dict):
+        self.name = name
+        self.parent = parent        # the index of the enclosing span in the recorder
+        self.depth = depth
+        self.start = start
+        self.seconds: float | None = None
+        self.rows: int | None = None
+        self.memory: int | None = None  # the change in traced memory in bytes, when tracing
+        self.attrs = attrs
+
+    def to_dict(self) -> dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class NullSpan(object):
+    """Stands in for a Span when nothing is recorded, silently accepting `rows`."""
+    __slots__ = ('rows',)
+
+    def __init__(self):
+        self.rows = None
+
+
+class Recorder(object):
+    """Collects the spans of the code that runs while it is active."""
+
+    def __init__(self, memory: bool = False):
+        """
+        :param memory:  whether to record memory deltas with tracemalloc, which slows down allocations
+        """
+        self.memory = memory
+        self.spans: list[Span] = []
+        self.origin = perf_counter()
+        self._tracing = False
+        self._token: Token | None = None
+        self._lock = threading.Lock()   # spans can be recorded from worker threads, see `in_context`
+
+    def start(self) -> 'Recorder':
+        """Makes this the active recorder in the current context."""
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._token = _recorder.set(self)
+        return self
+
+    def stop(self):
+        """Restores the previously active recorder, if any."""
+        if self._token is not None:
+            _recorder.reset(self._token)
+            self._token = None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def __enter__(self) -> 'Recorder':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def summary(self) -> pd.DataFrame:
+        """Returns the spans in the order they started, with their self time: the time not spent in child spans."""
+        df = pd.DataFrame([span.to_dict() for span in self.spans],
+                          columns=['name', 'parent', 'depth', 'start', 'seconds', 'rows', 'memory', 'attrs'])
+        children = df.groupby('parent')['seconds'].sum()
+        return df.assign(start=df['start'] - self.origin,
+                         self_seconds=df['seconds'] - df.index.map(children).fillna(0.))
+
+    def totals(self) -> pd.DataFrame:
+        """Returns the number of calls, total and self time, rows and memory per span name, slowest first."""
+        return (self.summary()
+                .groupby('name')
+                .agg(calls=('seconds', 'size'), seconds=('seconds', 'sum'), self_seconds=('self_seconds', 'sum'),
+                     rows=('rows', 'sum'), memory=('memory', 'sum'))
+                .sort_values('self_seconds', ascending=False))
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps([{**span.to_dict(), 'start': span.start - self.origin} for span in self.spans],
+                          default=str, **kwargs)
+
+    def log(self, logger: logging.Logger = log, level: int = logging.INFO):
+        """Logs every span, indented by depth."""
+        for span in self.spans:
+            logger.log(level, '%s%s: %.3fs%s%s', '  ' * span.depth, span.name, span.seconds or 0.,
+                       f' {span.rows} rows' if span.rows is not None else '',
+                       f' {span.memory / 2**20:+.1f}MiB' if span.memory is not None else '')
+
+
+_recorder: ContextVar[Recorder | None] = ContextVar('recorder', default=None)
+_parent: ContextVar[tuple[int, int] | None] = ContextVar('parent', default=None)   # (index, depth)
+
+
+def recording(memory: bool = False) -> Recorder:
+    """Returns a new recorder, to be used as context manager."""
+    return Recorder(memory)
+
+
+def active() -> bool:
+    return _recorder.get() is not None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Records the enclosed code as a span named `name`, with any keyword arguments as its attributes.
+
+    Yields the Span, on which the number of rows produced can be set.
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        yield NullSpan()
+        return
+
+    parent = _parent.get()
+    record = Span(name, parent[0] if parent else None, parent[1] + 1 if parent else 0, perf_counter(), attrs)
+    with recorder._lock:
+        recorder.spans.append(record)
+        index = len(recorder.spans) - 1
+    token = _parent.set((index, record.depth))
+    memory = tracemalloc.get_traced_memory()[0] if recorder.memory and tracemalloc.is_tracing() else None
+    try:
+        yield record
+    finally:
+        record.seconds = perf_counter() - record.start
+        if memory is not None:
+            record.memory = tracemalloc.get_traced_memory()[0] - memory
+        _parent.reset(token)
+
+
+def in_context(fn):
+    """Returns a callable that runs `fn` in a copy of the current context, so that the spans recorded by e.g. pool
+    threads are attributed to the caller's recorder and span."""
+    context = copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def profiled(name: str):
+    """Decorates a function to record every call as a span, with the length of the returned frame as its rows."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _recorder.get() is None:
+                return fn(*args, **kwargs)
+            with span(name) as s:
+                result = fn(*args, **kwargs)
+                if s.rows is None and isinstance(result, (pd.DataFrame, pd.Series)):
+                    s.rows = len(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,162 @@
+"""Headless evaluation of many ledger databases at once.
+
+The parent process reads all ledgers, works out the quotes (and currency pairs) each of them needs and fetches every
+symbol once, from the earliest date any ledger needs it, through a single (caching) QuoteFetcher. The ledgers are then
+evaluated in a process pool, each with an in-memory fetcher holding just its own slice of the prefetched quotes, so
+that the workers neither hit the upstream nor contend for the quote cache.
+"""
+import logging
+import sqlite3
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import partial
+from datetime import date, timedelta
+from pathlib import Path
+from typing import NamedTuple, Literal
+
+import pandas as pd
+
+from gainly.engine import ValuationEngine
+from gainly.eod import QuoteFetcher, FrameQuoteFetcher, concat_prices, empty_prices
+from gainly.fx import QuoteFXFetcher
+from gainly.portfolio import PortfolioPerformance
+from gainly.profiling import span
+
+log = logging.getLogger(__name__)
+
+Format = Literal['csv', 'parquet']
+
+
+class LedgerReport(NamedTuple):
+    positions: pd.DataFrame
+    valuations: pd.DataFrame
+    irr: float
+
+
+def read_ledger(path: str | Path) -> pd.DataFrame:
+    """Returns the transactions of a ledger database."""
+    with closing(sqlite3.connect(path)) as conn:
+        txns = pd.read_sql('SELECT * FROM txn ORDER BY trade_date', conn)
+    txns['trade_date'] = pd.to_datetime(txns['trade_date'])
+    return txns
+
+
+def quote_requests(txns: pd.DataFrame, base_currency: str = None, no_eod: bool = False,
+                   fx_ticker: str = '{currency}{base}=X') -> dict[str, date]:
+    """Returns the symbols and currency pairs whose quotes a PortfolioPerformance of the ledger fetches, along with
+    the date it fetches them from."""
+    first = txns['trade_date'].min().date()
+    requests = {} if no_eod else dict.fromkeys(txns['symbol'].unique(), first)
+    if base_currency is not None and 'currency' in txns.columns:
+        for currency in txns['currency'].dropna().unique():
+            if currency != base_currency:
+                requests[fx_ticker.format(currency=currency, base=base_currency)] = first - timedelta(days=7)
+    return requests
+
+
+def prefetch(quote_fetcher: QuoteFetcher, requests: Iterable[dict[str, date]], date_to: date) -> pd.DataFrame:
+    """Fetches the quotes of all requests, every symbol once from the earliest date requested, in one batch per
+    distinct start date."""
+    earliest = {}
+    for request in requests:
+        for symbol, date_from in request.items():
+            earliest[symbol] = min(date_from, earliest.get(symbol, date_from))
+    batches = defaultdict(list)
+    for symbol, date_from in earliest.items():
+        batches[date_from].append(symbol)
+
+    frames = []
+    for date_from, symbols in sorted(batches.items()):
+        with span('report.prefetch', symbols=len(symbols), date_from=date_from) as s:
+            frames.append(quote_fetcher.get_eod_prices_many(symbols, date_from, date_to))
+            s.rows = len(frames[-1])
+    return concat_prices(frames)
+
+
+def evaluate(txns: pd.DataFrame, quotes: pd.DataFrame, engine: str | ValuationEngine = 'pandas',
+             base_currency: str = None, no_eod: bool = False) -> LedgerReport:
+    """Returns the positions, daily valuations and IRR of a ledger, valued with the given quotes only."""
+    quote_fetcher = FrameQuoteFetcher(quotes)
+    portfolio = PortfolioPerformance(txns, None if no_eod else quote_fetcher, engine,
+                                     base_currency=base_currency, fx_fetcher=QuoteFXFetcher(quote_fetcher))
+    return LedgerReport(portfolio.positions(), portfolio.daily_valuations(), portfolio.get_irr())
+
+
+def report(paths: list[str | Path], quote_fetcher: QuoteFetcher, engine: str = 'pandas', base_currency: str = None,
+           no_eod: bool = False, max_workers: int | None = None) -> dict[str, pd.DataFrame]:
+    """Evaluates the positions, daily valuations and IRR of many ledger databases.
+
+    A ledger that fails to read or evaluate is logged and reported with its error, without affecting the others.
+
+    :param paths:           the sqlite3 database files of the ledgers
+    :param quote_fetcher:   the source of all quotes, typically a CachingQuoteFetcher shared by all ledgers
+    :param engine:          the valuation engine: pandas or numpy
+    :param base_currency:   the currency to value the ledgers in
+    :param no_eod:          value positions at trade prices only
+    :param max_workers:     the number of processes to evaluate the ledgers in, or None to evaluate them in this
+                            process
+    :return:                the `positions`, `valuations` and `irr` (along with any `error`) of all ledgers, each
+                            with a `ledger` column holding the database file
+    """
+    ledgers = {str(path): outcome(partial(read_ledger, path), str(path)) for path in paths}
+    failed = {path: e for path, e in ledgers.items() if isinstance(e, Exception)}
+    ledgers = {path: txns for path, txns in ledgers.items() if path not in failed and not txns.empty}
+    requests = {path: quote_requests(txns, base_currency, no_eod) for path, txns in ledgers.items()}
+    date_to = max([date.today(), *(txns['trade_date'].max().date() for txns in ledgers.values())])
+    quotes = prefetch(quote_fetcher, requests.values(), date_to) if ledgers else empty_prices()
+
+    def job(path: str) -> tuple:
+        return ledgers[path], quotes[quotes['symbol'].isin(list(requests[path]))], engine, base_currency, no_eod
+
+    with span('report.evaluate', ledgers=len(ledgers), workers=max_workers):
+        if max_workers:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {path: executor.submit(evaluate, *job(path)) for path in ledgers}
+                results = {path: outcome(future.result, path) for path, future in futures.items()}
+        else:
+            results = {path: outcome(lambda: evaluate(*job(path)), path) for path in ledgers}
+    results |= failed
+
+    reports = {path: result for path, result in results.items() if isinstance(result, LedgerReport)}
+    irr = pd.DataFrame({'ledger': list(map(str, paths))})
+    irr['irr'] = [reports[path].irr if path in reports else float('nan') for path in irr['ledger']]
+    irr['error'] = [repr(results[path]) if isinstance(results.get(path), Exception) else None
+                    for path in irr['ledger']]
+    return {
+        'positions': concat(reports, lambda r: r.positions.reset_index()),
+        'valuations': concat(reports, lambda r: r.valuations),
+        'irr': irr,
+    }
+
+
+def outcome(result, path: str) -> LedgerReport | Exception:
+    """Returns the result of reading or evaluating a ledger, or the exception it raised."""
+    try:
+        return result()
+    except Exception as e:
+        log.exception('Failed to evaluate %s', path)
+        return e
+
+
+def concat(reports: dict[str, LedgerReport], frame) -> pd.DataFrame:
+    frames = [frame(r).assign(ledger=path) for path, r in reports.items()]
+    if not frames:
+        return pd.DataFrame({'ledger': []})
+    df = pd.concat(frames, ignore_index=True)
+    return df[['ledger', *df.columns.drop('ledger')]]
+
+
+def write(results: dict[str, pd.DataFrame], output: str | Path, fmt: Format = 'csv') -> list[Path]:
+    """Writes every result frame to a `<name>.csv` or `<name>.parquet` file in the output directory."""
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    files = []
+    for name, df in results.items():
+        files.append(output / f'{name}.{fmt}')
+        if fmt == 'parquet':
+            df.to_parquet(files[-1], index=False)
+        else:
+            df.to_csv(files[-1], index=False)
+    return files
@@ -0,0 +1,157 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+DAYS_PER_YEAR = 365     # the day count convention of pyxirr's xirr
+
+
+def flows(valuations: pd.DataFrame, per_symbol: bool = False) -> pd.DataFrame:
+    """Reduces daily valuations to the value and the net cash invested on every date.
+
+    :param valuations:  daily valuations, as returned by `PortfolioPerformance.daily_valuations()`
+    :param per_symbol:  whether to keep the symbols apart
+    :return:            a DataFrame with date (and symbol), value and flow columns, where flow is the amount invested
+                        that day (negative for sell proceeds)
+    """
+    df = valuations[['date', 'symbol', 'invested', 'value']].fillna({'invested': 0., 'value': 0.})
+    df = df.assign(flow=df.groupby('symbol', observed=True)['invested'].diff().fillna(df['invested']))
+    if per_symbol:
+        return df[['date', 'symbol', 'value', 'flow']].reset_index(drop=True)
+    return df.groupby('date')[['value', 'flow']].sum().reset_index()
+
+
+def window_start(dates: np.ndarray, window: timedelta | str | None) -> np.ndarray:
+    """Returns for every date the index of the last date at least `window` earlier (-1 where there is none), or all
+    zeros for since-inception windows."""
+    if window is None:
+        return np.zeros(len(dates), dtype=int)
+    days = dates.astype('datetime64[D]')
+    return np.searchsorted(days, days - pd.Timedelta(window).to_timedelta64().astype('timedelta64[D]'),
+                           side='right') - 1
+
+
+def time_weighted(dates: np.ndarray, value: np.ndarray, flow: np.ndarray,
+                  window: timedelta | str | None = None) -> np.ndarray:
+    """Returns the time-weighted return up to every date, by chaining the daily sub-period returns.
+
+    Flows are assumed to happen at the end of the day, so a day's return is (value - flow) / previous value. On days
+    that start without a position, the flow is taken to happen at the start of the day instead.
+
+    :param dates:   the ascending dates, as datetime64
+    :param value:   the value at the end of every date
+    :param flow:    the net amount invested on every date
+    :param window:  the length of trailing windows (e.g. '365D'), or None for returns since inception
+    """
+    value = np.asarray(value, dtype=float)
+    flow = np.asarray(flow, dtype=float)
+    previous = np.concatenate([[0.], value[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.where(previous > 0, (value - flow) / previous,
+                          np.where(flow > 0, value / flow, 1.))
+    cumulative = np.cumprod(np.nan_to_num(growth, nan=1., posinf=1., neginf=1.))
+    if window is None:
+        return cumulative - 1
+
+    start = window_start(dates, window)
+    result = np.full(len(value), np.nan)
+    valid = start >= 0
+    result[valid] = cumulative[valid] / cumulative[start[valid]] - 1
+    return result
+
+
+def money_weighted(dates: np.ndarray, value: np.ndarray, flow: np.ndarray, window: timedelta | str | None = None,
+                   guess: float = .1, chunksize: int = 256, tol: float = 1e-10, max_iter: int = 50) -> np.ndarray:
+    """Returns the money-weighted return (xirr) up to every date.
+
+    The cashflows are the amounts invested (as outflows) plus the final value on each date (as an inflow), or, for
+    trailing windows, the value at the start of the window as the initial outflow. Rather than solving once per date,
+    the IRRs of a chunk of dates are solved together with a vectorized Newton iteration, warm-started from the
+    result of the previous chunk.
+
+    :param dates:       the ascending dates, as datetime64
+    :param value:       the value at the end of every date
+    :param flow:        the net amount invested on every date
+    :param window:      the length of trailing windows (e.g. '365D'), or None for returns since inception
+    :param guess:       the initial guess for the first chunk
+    :param chunksize:   the number of dates solved together
+    :return:            the annualized rates, NaN where there is no solution
+    """
+    value = np.asarray(value, dtype=float)
+    cf = -np.asarray(flow, dtype=float)
+    years = (dates.astype('datetime64[D]') - dates.astype('datetime64[D]')[0]).astype(float) / DAYS_PER_YEAR
+    start = window_start(dates, window)
+    nonzero = np.flatnonzero(cf)
+    result = np.full(len(value), np.nan)
+
+    for a in range(0, len(value), chunksize):
+        t = np.arange(a, min(a + chunksize, len(value)))
+        idx = nonzero[:np.searchsorted(nonzero, t[-1], side='right')]
+        # Cashflow i counts towards date t when start < i <= t (since inception: start <= i <= t):
+        mask = idx <= t[:, None]
+        if window is not None:
+            mask &= idx > start[t, None]
+        amounts = np.where(mask, cf[idx], 0.)
+        elapsed = np.where(mask, years[t, None] - years[idx], 0.)
+        initial = -value[start[t]] if window is not None else np.zeros(len(t))
+        initial_elapsed = years[t] - years[start[t]]
+
+        rate = solve_rates(amounts, elapsed, value[t], initial, initial_elapsed, guess, tol, max_iter)
+        if window is not None:
+            rate[start[t] < 0] = np.nan
+        result[t] = rate
+        if np.isfinite(result[t[-1]]):
+            guess = result[t[-1]]
+    return result
+
+
+def solve_rates(amounts: np.ndarray, elapsed: np.ndarray, value: np.ndarray, initial: np.ndarray | float = 0.,
+                initial_elapsed: np.ndarray | float = 0., guess: np.ndarray | float = .1, tol: float = 1e-10,
+                max_iter: int = 50) -> np.ndarray:
+    """Solves the annualized rates at which the cashflows of many series grow to minus their final value, together,
+    with a vectorized Newton iteration.
+
+    :param amounts:         the cashflows of every series (one row each), zero-padded, broadcastable to `elapsed`
+    :param elapsed:         the years from every cashflow to the end of its series
+    :param value:           the final value of every series
+    :param initial:         an extra cashflow per series, like the value at the start of a trailing window
+    :param initial_elapsed: the years from the extra cashflow to the end of its series
+    :param guess:           the initial guess, for all series or per series
+    :return:                the rates, NaN where the iteration did not converge
+    """
+    rate = np.broadcast_to(np.asarray(guess, dtype=float), np.shape(value)).copy()
+    step = np.full(np.shape(value), np.nan)
+    for _ in range(max_iter):
+        # The future value at the end of every series of all its cashflows:
+        log_growth = np.log1p(rate)
+        growth = np.exp(elapsed * log_growth[:, None])
+        initial_growth = np.exp(initial_elapsed * log_growth)
+        fv = (amounts * growth).sum(axis=1) + initial * initial_growth + value
+        dfv = ((amounts * elapsed * growth).sum(axis=1) + initial * initial_elapsed * initial_growth) / (1 + rate)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(dfv != 0, fv / dfv, np.nan)
+        rate = np.maximum(rate - step, -.9999)
+        if not (np.abs(step) > tol).any():
+            break
+    return np.where(np.abs(step) <= tol, rate, np.nan)
+
+
+def return_series(valuations: pd.DataFrame, per_symbol: bool = False,
+                  window: timedelta | str | None = None) -> pd.DataFrame:
+    """Returns the time-weighted (twr) and money-weighted (irr) returns up to every date of daily valuations.
+
+    :param valuations:  daily valuations, as returned by `PortfolioPerformance.daily_valuations()`
+    :param per_symbol:  whether to compute the returns of every symbol separately
+    :param window:      the length of trailing windows (e.g. '365D'), or None for returns since inception
+    :return:            a DataFrame with date (and symbol), twr and irr columns
+    """
+    df = flows(valuations, per_symbol)
+    groups = df.groupby('symbol', sort=False, observed=True) if per_symbol else [(None, df)]
+    parts = []
+    for _, group in groups:
+        dates = pd.to_datetime(group['date']).to_numpy()
+        parts.append(group
+                     .drop(columns=['value', 'flow'])
+                     .assign(twr=time_weighted(dates, group['value'].to_numpy(), group['flow'].to_numpy(), window),
+                             irr=money_weighted(dates, group['value'].to_numpy(), group['flow'].to_numpy(), window)))
+    return pd.concat(parts).sort_index().reset_index(drop=True) if parts else df.assign(twr=[], irr=[])
@@ -0,0 +1,150 @@
+"""Revaluation of a ledger under many simulated price paths.
+
+Prices are given as a 3-D array of scenario x date x symbol. The ledger's positions and invested amounts at the end
+of every date are looked up once (see `PortfolioPerformance.positions_as_of_many`) and broadcast against the paths of
+a chunk of scenarios at a time, so that memory is bounded by the chunk size rather than the number of scenarios. The
+IRRs of all scenarios in a chunk are solved together, from the ledger's actual cashflows and each scenario's final
+value.
+"""
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from gainly.portfolio import PortfolioPerformance
+from gainly.profiling import span, profiled
+from gainly.returns import DAYS_PER_YEAR, solve_rates
+
+
+class ScenarioResult(NamedTuple):
+    """The distributions of a ledger's value, P/L and IRR across scenarios."""
+    dates: np.ndarray   # the dates, as datetime64[D]
+    value: np.ndarray   # scenario x date, the value of the positions at the end of every date
+    pl: np.ndarray      # scenario x date, the value minus the net amount invested
+    irr: np.ndarray     # per scenario, the money-weighted return up to the last date (NaN where there is none)
+
+    def quantiles(self, q: Sequence[float] = (.05, .5, .95)) -> pd.DataFrame:
+        """Returns the quantiles of the value and P/L on every date, with (value|pl, quantile) columns."""
+        index = pd.Index(self.dates.astype('datetime64[ns]'), name='date')
+        return pd.concat({name: pd.DataFrame(np.quantile(values, q, axis=0).T, index=index, columns=list(q))
+                          for name, values in (('value', self.value), ('pl', self.pl))}, axis=1)
+
+
+def exposures(portfolio: PortfolioPerformance, dates: np.ndarray,
+              symbols: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the position of every symbol at the end of every date as a date x symbol array, along with the net
+    amount invested in all symbols on every date.
+
+    :raises ValueError: if a symbol is held on any of the dates without being one of `symbols`
+    """
+    snapshot = portfolio.positions_as_of_many(dates)
+    rows = pd.Index(dates).get_indexer(pd.to_datetime(snapshot['date']).to_numpy(dtype='datetime64[D]'))
+    cols = pd.Index(symbols).get_indexer(snapshot['symbol'].astype(object))
+    missing = (cols < 0) & (snapshot['position'].to_numpy() != 0)
+    if missing.any():
+        raise ValueError(f'No prices for held symbols: {", ".join(sorted(set(snapshot["symbol"][missing])))}')
+
+    position = np.zeros((len(dates), len(symbols)))
+    priced = cols >= 0
+    position[rows[priced], cols[priced]] = snapshot['position'].to_numpy(dtype=float)[priced]
+    invested = np.bincount(rows, weights=snapshot['invested'].to_numpy(dtype=float), minlength=len(dates))
+    return position, invested
+
+
+def cashflows(portfolio: PortfolioPerformance, last: np.datetime64) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the ledger's cashflows up to and including the last date, along with the years from each one to the
+    last date."""
+    ledger = portfolio.ledger
+    days = pd.to_datetime(ledger['trade_date']).to_numpy(dtype='datetime64[D]')
+    traded = days <= last
+    amounts = -(ledger['price'] * ledger['quantity']).to_numpy(dtype=float)[traded]
+    return amounts, (last - days[traded]).astype(float) / DAYS_PER_YEAR
+
+
+def evaluate(prices: np.ndarray, position: np.ndarray, invested: np.ndarray, amounts: np.ndarray,
+             elapsed: np.ndarray, guess: float = .1) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the value, P/L and IRR of a chunk of scenarios (see `simulate`)."""
+    # Symbols that are not held don't need a price:
+    value = np.einsum('sdn,dn->sd', np.where(position != 0, prices, 0.), position)
+    return value, value - invested, solve_rates(amounts, elapsed, value[:, -1], guess=guess)
+
+
+@profiled('scenarios.simulate')
+def simulate(portfolio: PortfolioPerformance, prices: np.ndarray, dates, symbols: Sequence[str],
+             chunksize: int = 1000, max_workers: int | None = None, guess: float = .1) -> ScenarioResult:
+    """Revalues a portfolio's ledger under simulated prices.
+
+    :param portfolio:   the portfolio whose ledger is revalued
+    :param prices:      a scenario x date x symbol array of closes, in the base currency
+    :param dates:       the ascending dates of the prices' second axis
+    :param symbols:     the symbols of the prices' third axis, which must include all symbols held on the dates
+    :param chunksize:   the number of scenarios evaluated together, which bounds the memory used to a few arrays of
+                        chunksize x dates x symbols
+    :param max_workers: the number of processes to evaluate the chunks in parallel, or None to evaluate them in this
+                        process
+    :param guess:       the initial guess of the IRRs
+    """
+    dates = pd.to_datetime(pd.Index(dates)).to_numpy(dtype='datetime64[D]')
+    if np.shape(prices)[1:] != (len(dates), len(symbols)):
+        raise ValueError(f'Expected prices of shape (scenarios, {len(dates)}, {len(symbols)}), got {np.shape(prices)}')
+    if len(dates) == 0 or (np.diff(dates) <= np.timedelta64(0, 'D')).any():
+        raise ValueError('The dates must be ascending and unique')
+    if chunksize < 1:
+        raise ValueError(f'Invalid chunksize {chunksize}')
+
+    with span('scenarios.exposures', symbols=len(symbols)) as s:
+        position, invested = exposures(portfolio, dates, symbols)
+        amounts, elapsed = cashflows(portfolio, dates[-1])
+        s.rows = len(dates)
+
+    work = partial(evaluate, position=position, invested=invested, amounts=amounts, elapsed=elapsed, guess=guess)
+    chunks = (prices[start:start + chunksize] for start in range(0, len(prices), chunksize))
+    with span('scenarios.evaluate', scenarios=len(prices), chunksize=chunksize, workers=max_workers) as s:
+        if max_workers:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(work, chunks))
+        else:
+            results = [work(chunk) for chunk in chunks]
+        s.rows = len(prices)
+
+    if not results:
+        empty = np.empty((0, len(dates)))
+        return ScenarioResult(dates, empty, empty, np.empty(0))
+    value, pl, irr = (np.concatenate(parts) for parts in zip(*results))
+    return ScenarioResult(dates, value, pl, irr)
+
+
+def bootstrap(eod_prices: pd.DataFrame, dates, symbols: Sequence[str], scenarios: int,
+              seed: int = 0, dtype=np.float64) -> np.ndarray:
+    """Returns price paths that resample the historical daily returns of the quotes.
+
+    The closes are forward filled onto the dates. Every scenario then compounds, from the closes on the first date,
+    returns drawn with replacement from the day-to-day returns of all dates, where all symbols take the returns of the
+    same day, to keep their correlation. Symbols without a close on the first date start from their first close.
+
+    :param eod_prices:  the end-of-day prices, like `PortfolioPerformance.eod_prices`
+    :param dates:       the ascending dates of the paths
+    :param symbols:     the symbols of the paths
+    :param scenarios:   the number of paths
+    :return:            a scenario x date x symbol array of closes
+    """
+    dates = pd.to_datetime(pd.Index(dates))
+    closes = (eod_prices
+              .dropna(subset=['close'])
+              .assign(date=pd.to_datetime(eod_prices['date']), symbol=eod_prices['symbol'].astype(object))
+              .pivot_table(index='date', columns='symbol', values='close', aggfunc='last')
+              .reindex(columns=list(symbols)))
+    closes = closes.reindex(closes.index.union(dates)).ffill().loc[dates].bfill().to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.nan_to_num(np.diff(np.log(closes), axis=0), nan=0., posinf=0., neginf=0.)
+    rng = np.random.default_rng(seed)
+    paths = np.empty((scenarios, len(dates), len(symbols)), dtype=dtype)
+    paths[:, 0] = closes[0]
+    if len(returns):
+        drawn = returns[rng.integers(0, len(returns), (scenarios, len(returns)))]
+        paths[:, 1:] = closes[0] * np.exp(np.cumsum(drawn, axis=1))
+    return paths
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+class PositionIndex(object):
+    """Sorted per-symbol running totals of a ledger and the closes of its quotes, for point-in-time lookups.
+
+    Trades and quotes are sorted by symbol and day and keyed by `symbol code * span + day`, so that the last trade
+    and the last close of every symbol on or before any number of dates are found with a single `searchsorted` per
+    array, in O(dates * symbols * log n), without building the date x symbol grid.
+    """
+
+    def __init__(self, txns: pd.DataFrame, eod_prices: pd.DataFrame):
+        # Running totals in ledger order, like the engines compute them:
+        txns = txns.sort_values('trade_date', kind='stable')
+        position = txns.groupby('symbol', observed=True)['quantity'].cumsum().to_numpy(dtype=float)
+        invested = ((txns['price'] * txns['quantity'])
+                    .groupby(txns['symbol'], observed=True)
+                    .cumsum()
+                    .to_numpy(dtype=float))
+        trade_days = days(txns['trade_date'])
+
+        quotes = eod_prices[eod_prices['close'].notna()]
+        quote_days = days(quotes['date'])
+
+        self.symbols = np.sort(pd.unique(txns['symbol'].to_numpy(dtype=object)))
+        symbols = pd.Index(self.symbols)
+        all_days = np.concatenate([trade_days, quote_days])
+        self.first, self.last = (all_days.min(), all_days.max()) if len(all_days) else (0, 0)
+        self.span = self.last - self.first + 2
+
+        codes = symbols.get_indexer(txns['symbol'].to_numpy(dtype=object))
+        order = np.lexsort((trade_days, codes))     # stable, so the last trade of a day stays last
+        self.trade_keys = self._keys(codes[order], trade_days[order])
+        self.trade_days = trade_days[order]
+        self.price = txns['price'].to_numpy(dtype=float)[order]
+        self.position = position[order]
+        self.invested = invested[order]
+
+        codes = symbols.get_indexer(quotes['symbol'].to_numpy(dtype=object))
+        order = np.lexsort((quote_days, codes))
+        order = order[codes[order] >= 0]            # quotes of symbols outside the ledger
+        self.quote_keys = self._keys(codes[order], quote_days[order])
+        self.quote_days = quote_days[order]
+        self.close = quotes['close'].to_numpy(dtype=float)[order]
+
+    def _keys(self, codes: np.ndarray, days: np.ndarray) -> np.ndarray:
+        # Days outside the indexed range are clipped to the day before the first and to the last one:
+        return codes * self.span + (np.clip(days, self.first - 1, self.last) - self.first + 1)
+
+    def lookup(self, dates: np.ndarray) -> pd.DataFrame:
+        """Returns the position, invested amount, value and pl of every symbol traded on or before each date, at the
+        end of that date.
+
+        A position is valued at its last trade price or its last close, whichever is later (on the same day, the
+        trade price), which is the value the daily valuations carry on that date.
+
+        :param dates:   the dates, as anything that converts to datetime64
+        :return:        a frame with date index, symbol, position, value, invested and pl columns, in the order of
+                        the dates and then the symbols
+        """
+        query_days = days(pd.Series(pd.to_datetime(np.asarray(dates))))
+        rows = np.repeat(np.arange(len(query_days)), len(self.symbols))
+        codes = np.tile(np.arange(len(self.symbols)), len(query_days))
+        keys = self._keys(codes, query_days[rows])
+
+        # The last trade of every symbol on or before every date, skipping the symbols not traded yet:
+        i, traded = self._last(self.trade_keys, keys, codes)
+        rows, codes, keys, i = rows[traded], codes[traded], keys[traded], i[traded]
+
+        j, quoted = self._last(self.quote_keys, keys, codes)
+        later = quoted.copy()
+        later[quoted] = self.quote_days[j[quoted]] > self.trade_days[i[quoted]]
+        mark = self.price[i]
+        mark[later] = self.close[j[later]]
+
+        value = self.position[i] * mark
+        return pd.DataFrame({'symbol': self.symbols[codes],
+                             'position': self.position[i],
+                             'value': value,
+                             'invested': self.invested[i],
+                             'pl': value - self.invested[i]},
+                            index=rows)
+
+    def _last(self, sorted_keys: np.ndarray, keys: np.ndarray, codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the index of the last sorted key at or before every key, and whether it is of the same symbol."""
+        idx = np.searchsorted(sorted_keys, keys, side='right') - 1
+        found = idx >= 0
+        found[found] = sorted_keys[idx[found]] // self.span == codes[found]
+        return idx, found
+
+
+def days(dates: pd.Series) -> np.ndarray:
+    """Returns dates or timestamps as int64 day numbers."""
+    return pd.to_datetime(dates).to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
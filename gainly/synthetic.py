@@ -0,0 +1,101 @@
+import zlib
+from collections.abc import Iterable
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pandera.typing.pandas import DataFrame
+
+from gainly.eod import QuoteFetcher, EODPriceSchema, concat_prices
+from gainly.portfolio import TransactionSchema
+from gainly.validation import check_types
+
+
+class SyntheticQuoteFetcher(QuoteFetcher):
+    """Deterministic, offline QuoteFetcher that produces business day closes following a random walk.
+
+    Every symbol's walk starts at `origin` and is seeded by the symbol name, so a symbol's close on a given date
+    does not depend on the requested range.
+    """
+
+    def __init__(self, seed: int = 0, origin: date = date(2000, 1, 1), volatility: float = .015):
+        self.seed = seed
+        self.origin = origin
+        self.volatility = volatility
+
+    def closes(self, symbol: str, date_to: date) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the business days (as datetime64[D]) from the origin up to and including `date_to`, along with
+        the symbol's closes on those days."""
+        days = business_days(self.origin, date_to)
+        rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode())])
+        start = rng.uniform(10, 500)
+        returns = rng.normal(.0003, self.volatility, len(days))
+        return days, start * np.exp(np.cumsum(returns))
+
+    @check_types(boundary=True)
+    def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        days, closes = self.closes(symbol, date_to)
+        first = np.searchsorted(days, np.datetime64(date_from, 'D'))
+        return pd.DataFrame({'date': days[first:].astype(object), 'symbol': symbol, 'close': closes[first:]})
+
+    @check_types(boundary=True)
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        return concat_prices([self.get_oed_prices(symbol, date_from, date_to) for symbol in symbols])
+
+
+def synthetic_ledger(symbols: int = 10, years: float = 5, trades_per_day: float = 1, brokers: int = 1,
+                     start: date = date(2015, 1, 1), seed: int = 0,
+                     quote_fetcher: SyntheticQuoteFetcher = None) -> DataFrame[TransactionSchema]:
+    """Returns a deterministic ledger of buy and sell transactions.
+
+    Trades happen on business days during market hours at a price near the symbol's close. About a quarter of the
+    trades are sells of part of the position held at that broker, so that positions never go negative.
+
+    :param symbols:         the number of distinct symbols
+    :param years:           the length of the ledger's history
+    :param trades_per_day:  the average number of trades per business day
+    :param brokers:         the number of distinct brokers
+    :param quote_fetcher:   the SyntheticQuoteFetcher whose closes the trade prices follow
+    """
+    rng = np.random.default_rng(seed)
+    quote_fetcher = quote_fetcher or SyntheticQuoteFetcher(seed)
+    days = business_days(start, start + timedelta(days=round(years * 365)))
+    count = rng.poisson(trades_per_day * len(days))
+
+    names = np.array([f'SYM{i:04d}' for i in range(symbols)])
+    brokernames = np.array([f'broker{i}' for i in range(brokers)])
+    trade_dates = np.sort(rng.choice(days, count).astype('datetime64[ns]') +
+                          rng.integers(9 * 3600, 17 * 3600, count) * np.timedelta64(1, 's'))
+    df = pd.DataFrame({'trade_date': trade_dates,
+                       'symbol': names[rng.integers(0, symbols, count)],
+                       'broker': brokernames[rng.integers(0, brokers, count)]})
+
+    # Trade near the day's close:
+    price = np.empty(count)
+    trade_days = df['trade_date'].to_numpy().astype('datetime64[D]')
+    for symbol, idx in df.groupby('symbol').indices.items():
+        dates, closes = quote_fetcher.closes(symbol, days[-1].astype(date))
+        price[idx] = closes[np.searchsorted(dates, trade_days[idx]).clip(0, len(dates) - 1)]
+    df['price'] = (price * rng.uniform(.99, 1.01, count)).round(4)
+
+    # Buy a random amount, or sell a random fraction of what's held at the broker:
+    held = {}
+    sell = rng.random(count) < .25
+    fraction = rng.uniform(.1, 1, count)
+    amount = rng.integers(1, 100, count).astype(float)
+    quantity = np.empty(count)
+    for i, key in enumerate(zip(df['symbol'], df['broker'])):
+        position = held.get(key, 0.)
+        quantity[i] = -np.floor(position * fraction[i]) if sell[i] and position >= 1 else amount[i]
+        held[key] = position + quantity[i]
+    df['quantity'] = quantity
+
+    return df[['trade_date', 'symbol', 'price', 'quantity', 'broker']]
+
+
+@lru_cache(maxsize=16)
+def business_days(date_from: date, date_to: date) -> np.ndarray:
+    """Returns the weekdays from `date_from` up to and including `date_to` as datetime64[D] values."""
+    days = np.arange(np.datetime64(date_from, 'D'), np.datetime64(date_to, 'D') + 1)
+    return days[np.is_busday(days)]
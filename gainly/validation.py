@@ -0,0 +1,155 @@
+"""Configurable pandera validation of the DataFrames that go in and out of gainly's public methods.
+
+The validation mode is one of:
+
+- `full`:       validate and coerce every annotated argument and return value (the default)
+- `boundary`:   only validate (and coerce) the frames that enter the pipeline, once: the transactions passed to
+                `PortfolioPerformance` and the quotes returned by the `QuoteFetcher`s; internal frames are trusted
+- `sample`:     coerce every frame like `full` does, but only check a random subset of its rows
+- `off`:        no validation at all
+
+The mode is set globally with `set_validation_mode()` and can be overridden per instance through a `validation`
+attribute (or constructor argument) on the object whose methods are checked. Likewise, a `dtypes` attribute (or
+constructor argument) selects the variants of the schemas that accept compact frames (see `gainly.dtypes`).
+"""
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps, partial
+from typing import get_origin, get_args, Literal
+
+import pandas as pd
+import pandera.pandas as pa
+from pandera.typing.pandas import DataFrame
+
+from gainly.dtypes import DTypes, check_dtypes, compact_schema
+from gainly.profiling import span
+
+ValidationMode = Literal['full', 'boundary', 'sample', 'off']
+MODES = ('full', 'boundary', 'sample', 'off')
+
+_mode: ValidationMode = 'full'
+_sample_size = 1000
+_entered: ContextVar[bool] = ContextVar('validation_entered', default=False)   # see `in_context` for pool threads
+
+
+def set_validation_mode(mode: ValidationMode, sample_size: int = None):
+    """Sets the global validation mode.
+
+    :param mode:        one of `full`, `boundary`, `sample` or `off`
+    :param sample_size: the number of rows validated per frame in `sample` mode
+    """
+    global _mode, _sample_size
+    _mode = check_mode(mode)
+    _sample_size = sample_size or _sample_size
+
+
+def get_validation_mode() -> ValidationMode:
+    return _mode
+
+
+@contextmanager
+def validation_mode(mode: ValidationMode, sample_size: int = None):
+    """Temporarily sets the global validation mode."""
+    previous = _mode, _sample_size
+    set_validation_mode(mode, sample_size)
+    try:
+        yield
+    finally:
+        set_validation_mode(*previous)
+
+
+def check_mode(mode: ValidationMode | None) -> ValidationMode | None:
+    if mode is not None and mode not in MODES:
+        raise ValueError(f'Invalid validation mode {mode!r}, expected one of {", ".join(MODES)}')
+    return mode
+
+
+def check_types(wrapped=None, *, boundary: bool = False):
+    """Replacement for `pandera.check_types` that honours the validation mode.
+
+    :param boundary:    whether the decorated method is a pipeline entry point that is still validated in
+                        `boundary` mode
+    """
+    if wrapped is None:
+        return partial(check_types, boundary=boundary)
+
+    sig = inspect.signature(wrapped)
+    arg_schemas = {name: schema for name, param in sig.parameters.items()
+                   if (schema := schema_of(param.annotation)) is not None}
+    return_schema = schema_of(sig.return_annotation)
+    validated = pa.check_types(wrapped)
+    name = f'validate {wrapped.__qualname__}'
+
+    def checked(*args, **kwargs):
+        # The span includes the wrapped call, whose own spans are subtracted from its self time:
+        with span(name):
+            dtypes = resolve_dtypes(args, kwargs)
+            if dtypes == 'object':
+                return validated(*args, **kwargs)
+
+            bound = sig.bind(*args, **kwargs)
+            for arg, schema in arg_schemas.items():
+                if isinstance(bound.arguments.get(arg), pd.DataFrame):
+                    bound.arguments[arg] = compact_schema(schema, dtypes).validate(bound.arguments[arg])
+            result = wrapped(*bound.args, **bound.kwargs)
+            if return_schema is not None:
+                result = compact_schema(return_schema, dtypes).validate(result)
+            return result
+
+    @wraps(wrapped)
+    def wrapper(*args, **kwargs):
+        mode = resolve_mode(args, kwargs)
+        if mode == 'full':
+            return checked(*args, **kwargs)
+        if mode == 'boundary' and boundary and not _entered.get():
+            # Entry points called from within another entry point (like a batch fetch that fetches one symbol
+            # at a time, even from its pool threads) are covered by the outer validation:
+            token = _entered.set(True)
+            try:
+                return checked(*args, **kwargs)
+            finally:
+                _entered.reset(token)
+        if mode != 'sample':
+            return wrapped(*args, **kwargs)
+
+        bound = sig.bind(*args, **kwargs)
+        dtypes = resolve_dtypes(args, kwargs)
+        with span(name, sample=True):
+            for arg, schema in arg_schemas.items():
+                if isinstance(bound.arguments.get(arg), pd.DataFrame):
+                    bound.arguments[arg] = validate_sample(bound.arguments[arg], compact_schema(schema, dtypes))
+        result = wrapped(*bound.args, **bound.kwargs)
+        if return_schema is not None:
+            with span(name, sample=True):
+                result = validate_sample(result, compact_schema(return_schema, dtypes))
+        return result
+    return wrapper
+
+
+def resolve_mode(args: tuple, kwargs: dict) -> ValidationMode:
+    """Returns the mode passed as `validation` keyword argument, or set on the instance, or the global mode."""
+    return (check_mode(kwargs.get('validation')) or
+            (getattr(args[0], 'validation', None) if args else None) or
+            _mode)
+
+
+def resolve_dtypes(args: tuple, kwargs: dict) -> DTypes:
+    """Returns the dtypes passed as `dtypes` keyword argument, or set on the instance, or `object`."""
+    instance = getattr(args[0], 'dtypes', None) if args else None
+    return check_dtypes(kwargs.get('dtypes')) or (instance if isinstance(instance, str) else None) or 'object'
+
+
+def schema_of(annotation) -> type[pa.DataFrameModel] | None:
+    if get_origin(annotation) is DataFrame:
+        return get_args(annotation)[0]
+    return None
+
+
+def validate_sample(df: pd.DataFrame, schema: type[pa.DataFrameModel] | pa.DataFrameSchema) -> pd.DataFrame:
+    """Returns the frame coerced to the schema's dtypes, after checking a random subset of its rows."""
+    if not isinstance(schema, pa.DataFrameSchema):
+        schema = schema.to_schema()
+    df = schema.coerce_dtype(df.copy())     # which coerces in place
+    schema.validate(df.sample(_sample_size) if len(df) > _sample_size else df)
+    return df
@@ -1,43 +1,103 @@
+import threading
 import urllib
-from datetime import date, datetime, timezone, time, timedelta
-from functools import cache
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone, time
+from time import monotonic, sleep
 
+import numpy as np
 import pandas as pd
-import pandera.pandas as pa
 import requests
 from pandera.typing.pandas import DataFrame
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
-from gainly.eod import QuoteFetcher, EODPriceSchema
+from gainly.eod import QuoteFetcher, EODPriceSchema, concat_prices
+from gainly.profiling import span, profiled, in_context
+from gainly.validation import check_types
 
 
-@cache
-def make_request(url: str) -> dict:
-    res = requests.get(url, headers={'User-Agent': 'Prutser'})
-    res.raise_for_status()
-    return res.json()
+class RateLimiter(object):
+    """Thread-safe limiter that spaces calls to `wait()` at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float | None):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = 0.
+
+    def wait(self):
+        with self._lock:
+            now = monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            sleep(at - now)
+
+
+def make_request(url: str, session: requests.Session = None, limiter: RateLimiter = None) -> dict:
+    if limiter:
+        with span('yahoo.rate_limit'):
+            limiter.wait()
+    with span('yahoo.http', url=url):
+        res = (session or requests).get(url, headers={'User-Agent': 'Prutser'})
+        res.raise_for_status()
+        return res.json()
 
 
 class YahooFinance(QuoteFetcher):
-    def __init__(self):
-        pass
+    def __init__(self, max_workers: int = 8, rate: float | None = 10, retries: int = 3, backoff: float = .5,
+                 base_url: str = 'https://query1.finance.yahoo.com'):
+        """
+        :param max_workers: the maximum number of concurrent requests (and pooled connections)
+        :param rate:        the maximum number of requests per second, or None for no limit
+        :param retries:     the number of times a failed or throttled request is retried
+        :param backoff:     the backoff factor in seconds between retries (doubled on every attempt)
+        :param base_url:    the Yahoo Finance API endpoint
+        """
+        self.max_workers = max_workers
+        self.base_url = base_url
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers,
+                              max_retries=Retry(total=retries, backoff_factor=backoff,
+                                                status_forcelist=(429, 500, 502, 503, 504),
+                                                respect_retry_after_header=True))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
-    @pa.check_types
+    @profiled('yahoo.get_oed_prices')
+    @check_types(boundary=True)
     def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
         qs = urllib.parse.urlencode(
             {'interval': '1d',
              'period1': to_epoch(date_from),
              'period2': to_epoch(date_to),})
 
-        url = f'https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?' + qs
-        payload: dict = make_request(url)
+        url = f'{self.base_url}/v8/finance/chart/{symbol}?' + qs
+        payload: dict = make_request(url, self.session, self.limiter)
+
+        with span('yahoo.decode') as s:
+            df = self._decode(payload, symbol)
+            s.rows = len(df)
+        return df
+
+    @staticmethod
+    def _decode(payload: dict, symbol: str) -> pd.DataFrame:
+        result = payload['chart']['result'][0]
+        # Bars are stamped in epoch seconds, which are shifted to the exchange's time zone and truncated to days in
+        # one go (a chart without bars has no timestamps at all):
+        days = (np.asarray(result.get('timestamp', []), dtype=np.int64) + result['meta']['gmtoffset']) // 86400
+        closes = np.asarray(result['indicators']['quote'][0].get('close', []), dtype=float)     # None is NaN
 
-        tz = timezone(timedelta(seconds=payload['chart']['result'][0]['meta']['gmtoffset']))
-        timestamps = [datetime.fromtimestamp(ts, tz).date() for ts in payload['chart']['result'][0]['timestamp']]
-        closes = payload['chart']['result'][0]['indicators']['quote'][0]['close']
+        return pd.DataFrame({'date': days.astype('datetime64[D]').astype(object), 'close': closes, 'symbol': symbol})
 
-        return (pd.DataFrame({'date': timestamps, 'close': closes})
-                .assign(symbol=symbol)
-                .pipe(DataFrame[EODPriceSchema]))
+    @profiled('yahoo.get_eod_prices_many')
+    @check_types(boundary=True)
+    def get_eod_prices_many(self, symbols: Iterable[str], date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            frames = list(executor.map(in_context(lambda symbol: self.get_oed_prices(symbol, date_from, date_to)),
+                                       symbols))
+        return concat_prices(frames)
 
 
 def to_epoch(dt: datetime|date) -> int:
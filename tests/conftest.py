@@ -0,0 +1,38 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+from pandera.typing.pandas import DataFrame
+
+from gainly.eod import QuoteFetcher, EODPriceSchema, concat_prices
+from gainly.synthetic import SyntheticQuoteFetcher
+
+
+class CountingQuoteFetcher(QuoteFetcher):
+    """Records the symbols and date ranges it was asked for, and returns the quotes of an upstream QuoteFetcher or
+    else a close of 1.0 for every day."""
+    def __init__(self, upstream: QuoteFetcher = None):
+        self.upstream = upstream
+        self.requests: list[tuple[str, date, date]] = []
+
+    @property
+    def symbols(self) -> list[str]:
+        return [symbol for symbol, _, _ in self.requests]
+
+    def get_oed_prices(self, symbol: str, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        return self.get_eod_prices_many([symbol], date_from, date_to)
+
+    def get_eod_prices_many(self, symbols, date_from: date, date_to: date) -> DataFrame[EODPriceSchema]:
+        symbols = list(symbols)
+        self.requests.extend((symbol, date_from, date_to) for symbol in symbols)
+        if self.upstream is not None:
+            return self.upstream.get_eod_prices_many(symbols, date_from, date_to)
+        return concat_prices([pd.DataFrame({'date': pd.date_range(date_from, date_to).date, 'symbol': symbol,
+                                            'close': 1.0})
+                              for symbol in symbols])
+
+
+@pytest.fixture
+def counting_fetcher() -> CountingQuoteFetcher:
+    """A CountingQuoteFetcher of synthetic quotes."""
+    return CountingQuoteFetcher(SyntheticQuoteFetcher())
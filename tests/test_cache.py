@@ -0,0 +1,184 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from gainly.cache import CachingQuoteFetcher, CoalescingQuoteFetcher, Span, missing, compact
+from tests.conftest import CountingQuoteFetcher
+
+
+class TestCachingQuoteFetcher:
+    @pytest.fixture
+    def upstream(self):
+        return CountingQuoteFetcher()
+
+    @pytest.fixture
+    def fetcher(self, upstream, tmp_path):
+        return CachingQuoteFetcher(upstream, str(tmp_path / 'quotes.db'), refresh_days=5)
+
+    def test_cold_and_warm(self, fetcher, upstream):
+        first = fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        second = fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+
+        assert upstream.requests == [('IWDA', date(2024, 12, 31), date(2025, 1, 31))]
+        assert len(first) == 31
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_fetches_missing_tail_and_head(self, fetcher, upstream):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 10), date(2025, 1, 20))
+        result = fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+
+        assert upstream.requests[1:] == [('IWDA', date(2024, 12, 31), date(2025, 1, 9)),
+                                         ('IWDA', date(2025, 1, 20), date(2025, 1, 31))]
+        assert list(result['date']) == list(pd.date_range(date(2025, 1, 1), date(2025, 1, 31)).date)
+
+    def test_refetches_stale_tail(self, fetcher, upstream):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        with fetcher._connect() as conn:
+            conn.execute("UPDATE quote_span SET fetched_at = '2025-01-31 18:00:00'")
+
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        assert upstream.requests[1:] == [('IWDA', date(2025, 1, 26), date(2025, 1, 31))]
+
+        # The refreshed tail was merged with the settled part of the original span:
+        with fetcher._connect() as conn:
+            assert len(fetcher._spans(conn, 'IWDA')) == 1
+
+    def test_get_eod_prices_many(self, fetcher, upstream):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        result = fetcher.get_eod_prices_many(['IWDA', 'EUNA.DE'], date(2025, 1, 1), date(2025, 1, 31))
+
+        assert upstream.requests[1:] == [('EUNA.DE', date(2024, 12, 31), date(2025, 1, 31))]
+        assert result.groupby('symbol').size().to_dict() == {'IWDA': 31, 'EUNA.DE': 31}
+
+    def test_evict(self, fetcher):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        assert fetcher.evict(unused_for=timedelta(days=1)) == 0
+        assert fetcher.evict(unused_for=timedelta(0)) == 1
+        with fetcher._connect() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM quote').fetchone() == (0,)
+
+    def test_compact(self, fetcher, upstream, tmp_path):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        fetcher.get_oed_prices('EUNA.DE', date(2000, 1, 1), date(2024, 12, 31))
+        with fetcher._connect() as conn:
+            # Spans as fragmented as those stored by earlier versions:
+            fetched_at = datetime(2025, 3, 1)
+            fetcher._write_spans(conn, 'IWDA', [Span(date(2025, 1, 1), date(2025, 1, 15), fetched_at),
+                                                Span(date(2025, 1, 16), date(2025, 1, 31), fetched_at)])
+            conn.execute("UPDATE quote_symbol SET accessed_at = '2025-01-01' WHERE symbol = 'EUNA.DE'")
+        size = (tmp_path / 'quotes.db').stat().st_size
+
+        assert fetcher.evict(unused_for=timedelta(days=1)) == 1
+        fetcher.compact()
+        assert (tmp_path / 'quotes.db').stat().st_size < size
+        with fetcher._connect() as conn:
+            assert fetcher._spans(conn, 'IWDA') == [Span(date(2025, 1, 1), date(2025, 1, 31), fetched_at)]
+        assert len(fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))) == 31
+        assert len(upstream.requests) == 2
+
+
+class BatchQuoteFetcher(CountingQuoteFetcher):
+    """Also records every batch it was asked for, and can be made to fail or to hold requests until released."""
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.failures = 0
+        self.requested = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_eod_prices_many(self, symbols, date_from, date_to):
+        self.batches.append((sorted(symbols), date_from, date_to))
+        self.requested.set()
+        self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            raise IOError('upstream failure')
+        return super().get_eod_prices_many(symbols, date_from, date_to)
+
+
+class TestCoalescingQuoteFetcher:
+    @pytest.fixture
+    def upstream(self):
+        return BatchQuoteFetcher()
+
+    @pytest.fixture
+    def fetcher(self, upstream):
+        return CoalescingQuoteFetcher(upstream)
+
+    def test_overlapping(self, fetcher, upstream):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 10), date(2025, 1, 20))
+        result = fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        assert upstream.batches == [(['IWDA'], date(2025, 1, 9), date(2025, 1, 20)),
+                                    (['IWDA'], date(2024, 12, 31), date(2025, 1, 9)),
+                                    (['IWDA'], date(2025, 1, 20), date(2025, 1, 31))]
+        assert list(result['date']) == list(pd.date_range(date(2025, 1, 1), date(2025, 1, 31)).date)
+
+        # Ranges within and adjacent to what was fetched are sliced from it:
+        for date_from, date_to in [(date(2025, 1, 5), date(2025, 1, 25)), (date(2025, 1, 31), date(2025, 1, 31))]:
+            result = fetcher.get_oed_prices('IWDA', date_from, date_to)
+            assert list(result['date']) == list(pd.date_range(date_from, date_to).date)
+        assert len(upstream.batches) == 3
+
+    def test_get_eod_prices_many(self, fetcher, upstream):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 15))
+        result = fetcher.get_eod_prices_many(['IWDA', 'EUNA.DE', 'VWRL'], date(2025, 1, 1), date(2025, 1, 31))
+
+        # The symbols missing the same range are fetched together:
+        assert upstream.batches[1:] == [(['IWDA'], date(2025, 1, 15), date(2025, 1, 31)),
+                                        (['EUNA.DE', 'VWRL'], date(2024, 12, 31), date(2025, 1, 31))]
+        assert list(result['symbol'].unique()) == ['IWDA', 'EUNA.DE', 'VWRL']
+        assert result.groupby('symbol').size().to_dict() == {'IWDA': 31, 'EUNA.DE': 31, 'VWRL': 31}
+
+    def test_concurrent(self, fetcher, upstream):
+        upstream.release.clear()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = [executor.submit(fetcher.get_oed_prices, 'IWDA', date(2025, 1, 1), date(2025, 1, 31))
+                       for _ in range(8)]
+            upstream.requested.wait()
+            upstream.release.set()
+            results = [future.result() for future in results]
+
+        assert len(upstream.batches) == 1
+        for result in results[1:]:
+            pd.testing.assert_frame_equal(result, results[0])
+
+    def test_failure(self, fetcher, upstream):
+        upstream.failures = 1
+        with pytest.raises(IOError):
+            fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        assert len(fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))) == 31
+        assert len(upstream.batches) == 2
+
+    def test_refetches_stale_tail(self, fetcher, upstream):
+        fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        (span, future), = fetcher._fetches['IWDA']
+        fetcher._fetches['IWDA'] = [(span._replace(fetched_at=datetime(2025, 1, 31, 18)), future)]
+
+        result = fetcher.get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+        assert upstream.batches[1:] == [(['IWDA'], date(2025, 1, 26), date(2025, 1, 31))]
+        assert len(result) == 31
+
+
+def test_missing():
+    now = datetime(2025, 2, 1)
+    spans = [Span(date(2025, 1, 5), date(2025, 1, 10), now),
+             Span(date(2025, 1, 8), date(2025, 1, 15), now),
+             Span(date(2025, 1, 20), date(2025, 1, 25), datetime(2025, 1, 25))]
+    assert missing(spans, date(2025, 1, 1), date(2025, 1, 31), now, 2, timedelta(hours=1)) == [
+        (date(2025, 1, 1), date(2025, 1, 4)),
+        (date(2025, 1, 16), date(2025, 1, 19)),
+        (date(2025, 1, 24), date(2025, 1, 31))]
+
+
+def test_compact():
+    old, new = datetime(2025, 1, 10), datetime(2025, 2, 1)
+    assert compact([Span(date(2025, 1, 1), date(2025, 1, 10), old),
+                    Span(date(2025, 1, 6), date(2025, 2, 1), new)], 5) == [
+        Span(date(2025, 1, 1), date(2025, 2, 1), new)]
+    # A span starting after the earlier span's settled part can't absorb the provisional days:
+    assert len(compact([Span(date(2025, 1, 1), date(2025, 1, 10), old),
+                        Span(date(2025, 1, 8), date(2025, 2, 1), new)], 5)) == 2
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from gainly.downsample import lttb, minmax, downsample
+
+
+@pytest.fixture
+def series():
+    x = np.arange(10_000, dtype=float)
+    return x, np.sin(x / 300) + np.random.default_rng(0).normal(0, .05, len(x))
+
+
+def test_lttb(series):
+    x, y = series
+    idx = lttb(x, y, 500)
+
+    assert len(idx) == 500
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert (np.diff(idx) > 0).all()
+    # the shape survives:
+    assert y[idx].max() > .95 and y[idx].min() < -.95
+    assert (lttb(x[:100], y[:100], 500) == np.arange(100)).all()
+
+
+def test_minmax(series):
+    _, y = series
+    idx = minmax(y, 500)
+
+    assert len(idx) <= 502
+    assert y[idx].max() == y.max() and y[idx].min() == y.min()
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_downsample(series, method):
+    x, y = series
+    df = pd.DataFrame({'date': pd.date_range('2000-01-01', periods=len(x)).date, 'a': y, 'b': -y})
+
+    small = downsample(df, 'date', ['a', 'b'], threshold=1000, method=method)
+    assert 500 <= len(small) <= 1004
+    assert small['date'].is_monotonic_increasing
+    assert small.iloc[0].equals(df.iloc[0]) and small.iloc[-1].equals(df.iloc[-1])
+    assert downsample(df.iloc[:10], 'date', ['a', 'b']).equals(df.iloc[:10])
@@ -0,0 +1,82 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gainly.dtypes import compact, compact_schema
+from gainly.eod import EODPriceSchema
+from gainly.portfolio import PortfolioPerformance, DailyValuationSchema
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+from gainly.validation import validation_mode
+
+
+@pytest.fixture(scope='module')
+def fetcher():
+    return SyntheticQuoteFetcher()
+
+
+@pytest.fixture(scope='module')
+def txns(fetcher):
+    return synthetic_ledger(symbols=5, years=2, brokers=2, start=date(2021, 1, 1), quote_fetcher=fetcher)
+
+
+def objects(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts a compact frame back to the default representation."""
+    return df.assign(date=df['date'].dt.date, symbol=df['symbol'].astype(object))
+
+
+def test_compact():
+    df = pd.DataFrame({'date': [date(2025, 1, 2), date(2025, 1, 3)], 'symbol': ['B', 'A'], 'close': [1., 2.]})
+
+    assert compact(df, 'object') is df
+    df = compact(df, 'compact32', categories=pd.Index(['A', 'B', 'C']))
+    assert list(df['symbol'].cat.categories) == ['A', 'B', 'C']
+    assert df['date'].dtype == 'datetime64[ns]'
+    assert df['close'].dtype == 'float32'
+
+    EODPriceSchema.validate(objects(df))
+    compact_schema(EODPriceSchema, 'compact32').validate(df)
+    assert compact_schema(EODPriceSchema, 'compact').validate(df)['close'].dtype == 'float64'
+
+
+@pytest.mark.parametrize('validation', ['full', 'boundary', 'sample', 'off'])
+@pytest.mark.parametrize('engine', ['pandas', 'numpy'])
+def test_identical(txns, fetcher, engine, validation):
+    with validation_mode(validation):
+        expected = PortfolioPerformance(txns, fetcher, engine)
+        portfolio = PortfolioPerformance(txns, fetcher, engine, dtypes='compact')
+
+        valuations = portfolio.daily_valuations()
+        assert isinstance(valuations['symbol'].dtype, pd.CategoricalDtype)
+        assert valuations['date'].dtype == 'datetime64[ns]'
+        assert valuations.memory_usage(deep=True).sum() < expected.daily_valuations().memory_usage(deep=True).sum() / 2
+        pd.testing.assert_frame_equal(objects(valuations), expected.daily_valuations())
+
+        positions = portfolio.positions()
+        positions.index = positions.index.astype(object)
+        pd.testing.assert_frame_equal(positions, expected.positions())
+        assert portfolio.get_irr() == expected.get_irr()
+        np.testing.assert_array_equal(portfolio.returns(per_symbol=True)['irr'],
+                                      expected.returns(per_symbol=True)['irr'])
+
+
+def test_float32(txns, fetcher):
+    expected = PortfolioPerformance(txns, fetcher).daily_valuations()
+    valuations = PortfolioPerformance(txns, fetcher, dtypes='compact32').daily_valuations()
+
+    DailyValuationSchema.validate(objects(valuations))
+    assert (valuations[['price', 'position', 'invested', 'close', 'value', 'pl']].dtypes == 'float32').all()
+    np.testing.assert_allclose(valuations['value'].fillna(0), expected['value'].fillna(0), rtol=1e-6)
+
+
+@pytest.mark.parametrize('dtypes', ['object', 'compact'])
+def test_resume(txns, fetcher, dtypes):
+    """Checkpoints in either representation can be resumed in compact mode."""
+    checkpoint = PortfolioPerformance(txns[txns['trade_date'] < '2022-06-01'], fetcher, dtypes=dtypes) \
+        .checkpoint(date(2022, 5, 31))
+    assert checkpoint.as_of == date(2022, 5, 31)
+
+    portfolio = PortfolioPerformance(txns, fetcher, dtypes='compact')
+    pd.testing.assert_frame_equal(portfolio.resume_from(checkpoint),
+                                  PortfolioPerformance(txns, fetcher, dtypes='compact').daily_valuations())
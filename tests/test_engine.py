@@ -0,0 +1,118 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gainly.engine import ffill, scatter_last, ENGINES
+from gainly.eod import NullQuoteFetcher, EODPriceSchema
+from gainly.portfolio import PortfolioPerformance
+from tests.test_portfolio import (MockQuoteFetcher, daily_positions_scenarios, daily_valuations_scenarios,
+                                  positions_scenarios)
+
+
+@pytest.fixture
+def transactions():
+    return pd.DataFrame({
+        'trade_date': [datetime(2025, 1, 1, hour=12),
+                       datetime(2025, 3, 1, hour=13),
+                       datetime(2025, 3, 1, hour=13),
+                       datetime(2025, 2, 1),
+                       datetime(2025, 3, 1, hour=13)],
+        'symbol': ['IWDA', 'EUNA.DE', 'IWDA', 'EUNA.DE', 'IWDA'],
+        'price': [1, 1, 1, 2, 3],
+        'quantity': [1, -1, 1, 2, 3],
+        'broker': ['broker1', 'broker2', 'broker1', 'broker2', 'broker1']
+    })
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('eod_fetcher,expected', daily_positions_scenarios)
+def test_daily_positions(transactions, engine, eod_fetcher, expected):
+    result = PortfolioPerformance(transactions, eod_fetcher, engine=engine).daily_positions()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('eod_fetcher,expected', daily_valuations_scenarios)
+def test_daily_valuations(transactions, engine, eod_fetcher, expected):
+    result = PortfolioPerformance(transactions, eod_fetcher, engine=engine).daily_valuations()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('eod_fetcher,expected', positions_scenarios)
+def test_positions(transactions, engine, eod_fetcher, expected):
+    result = PortfolioPerformance(transactions, eod_fetcher, engine=engine).positions()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def random_inputs() -> tuple[pd.DataFrame, MockQuoteFetcher]:
+    """Returns a ledger with trades on any day of the week and business day quotes of which 5% are missing."""
+    rng = np.random.default_rng(42)
+    symbols = [f'SYM{i}' for i in range(10)]
+    txns = pd.DataFrame({
+        'trade_date': [datetime(2020, 1, 1) + timedelta(hours=int(h)) for h in rng.integers(0, 24 * 700, 300)],
+        'symbol': rng.choice(symbols, 300),
+        'price': rng.uniform(1, 100, 300).round(2),
+        'quantity': rng.integers(1, 10, 300).astype(float),
+        'broker': 'broker'})
+    dates = pd.date_range('2019-12-01', '2022-01-01', freq='B').date
+    quotes = MockQuoteFetcher()
+    quotes.prices = EODPriceSchema.validate(pd.DataFrame({
+        'date': np.repeat(dates, len(symbols)),
+        'symbol': np.tile(symbols, len(dates)),
+        'close': np.where(rng.random(len(dates) * len(symbols)) < .05, np.nan,
+                          rng.uniform(1, 100, len(dates) * len(symbols)))}))
+    return txns, quotes
+
+
+def test_engines_agree():
+    txns, quotes = random_inputs()
+    for fetcher in (NullQuoteFetcher(), quotes):
+        expected = PortfolioPerformance(txns, fetcher, engine='pandas')
+        result = PortfolioPerformance(txns, fetcher, engine='numpy')
+        pd.testing.assert_frame_equal(result.daily_valuations(), expected.daily_valuations())
+        assert result.get_irr() == pytest.approx(expected.get_irr())
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('freq', ['W', 'M', 'Q'])
+@pytest.mark.parametrize('dtypes', ['object', 'compact'])
+def test_resampled(engine, freq, dtypes):
+    txns, quotes = random_inputs()
+    for fetcher in (NullQuoteFetcher(), quotes):
+        portfolio = PortfolioPerformance(txns, fetcher, engine=engine, dtypes=dtypes)
+        daily = portfolio.daily_valuations()
+        result = portfolio.daily_valuations(freq)
+
+        # Every period's last date is in the daily grid, with the same positions and values:
+        dates = pd.Series(pd.to_datetime(daily['date'].unique()))
+        assert list(pd.to_datetime(result['date'].unique())) == list(dates.groupby(dates.dt.to_period(freq)).max())
+        columns = ['date', 'symbol', 'position', 'invested', 'value', 'pl']
+        pd.testing.assert_frame_equal(result[columns],
+                                      daily.loc[daily['date'].isin(result['date']), columns].reset_index(drop=True))
+
+        # Along with the last trade price and close of the period:
+        periods = pd.to_datetime(daily['date']).dt.to_period(freq)
+        last = daily.groupby([periods, daily['symbol']], observed=True)[['price', 'close']].last().reset_index()
+        np.testing.assert_array_equal(result[['price', 'close']], last[['price', 'close']])
+
+        pd.testing.assert_frame_equal(result, PortfolioPerformance(txns, fetcher, engine='pandas', dtypes=dtypes)
+                                      .daily_positions(freq).assign(value=result['value'], pl=result['pl']))
+        pd.testing.assert_frame_equal(portfolio.positions(freq), portfolio.positions())
+
+
+def test_invalid_freq(transactions):
+    with pytest.raises(ValueError):
+        PortfolioPerformance(transactions).daily_valuations('fortnight')
+
+
+def test_scatter_last():
+    arr = scatter_last((2, 2), np.array([0, 1, 1]), np.array([1, 0, 0]), np.array([1., 2., 3.]))
+    np.testing.assert_array_equal(arr, [[np.nan, 1.], [3., np.nan]])
+
+
+def test_ffill():
+    arr = np.array([[np.nan, 1.], [2., np.nan], [np.nan, 3.]])
+    np.testing.assert_array_equal(ffill(arr), [[np.nan, 1.], [2., 1.], [2., 3.]])
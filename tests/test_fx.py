@@ -0,0 +1,74 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from gainly.eod import FrameQuoteFetcher
+from gainly.fx import FXFetcher, QuoteFXFetcher, convert
+from gainly.portfolio import PortfolioPerformance
+
+
+class MockFXFetcher(FXFetcher):
+    def __init__(self, rates: pd.DataFrame):
+        self.rates = rates
+        self.calls = 0
+
+    def get_rates(self, currencies, base, date_from, date_to) -> pd.DataFrame:
+        self.calls += 1
+        return self.rates[self.rates['currency'].isin(list(currencies))]
+
+
+rates = pd.DataFrame({'date': [date(2025, 1, 1), date(2025, 1, 3), date(2025, 1, 1)],
+                      'currency': ['USD', 'USD', 'GBP'],
+                      'rate': [.5, .25, 2.]})
+
+
+def test_convert():
+    amounts = pd.Series([1., 1., 1., 1., 1., 1.])
+    dates = pd.Series([date(2024, 12, 31), date(2025, 1, 1), date(2025, 1, 2), date(2025, 1, 3), date(2025, 1, 2),
+                       date(2025, 1, 2)])
+    currencies = pd.Series(['USD', 'USD', 'USD', 'USD', 'GBP', None])
+
+    assert convert(amounts, dates, currencies, 'EUR', rates).tolist() == [.5, .5, .5, .25, 2., 1.]
+    assert convert(amounts, dates, currencies.replace('GBP', 'EUR'), 'EUR', rates)[4] == 1.
+    with pytest.raises(ValueError, match='No exchange rates from CHF to EUR'):
+        convert(amounts, dates, currencies.replace('GBP', 'CHF'), 'EUR', rates)
+
+
+def test_quote_fx_fetcher():
+    quotes = pd.DataFrame({'date': [date(2025, 1, 1), date(2025, 1, 1)],
+                           'symbol': ['USDEUR=X', 'GBPEUR=X'],
+                           'close': [.9, 1.2]})
+    df = QuoteFXFetcher(FrameQuoteFetcher(quotes)).get_rates(['USD', 'GBP', 'EUR'], 'EUR',
+                                                            date(2025, 1, 1), date(2025, 1, 1))
+    assert df.sort_values('currency').to_dict('list') == {'date': [date(2025, 1, 1)] * 2,
+                                                         'currency': ['GBP', 'USD'],
+                                                         'rate': [1.2, .9]}
+
+
+def test_portfolio():
+    txns = pd.DataFrame({'trade_date': [datetime(2025, 1, 1, 10), datetime(2025, 1, 2, 10)],
+                         'symbol': ['AAPL', 'IWDA'],
+                         'price': [10., 10.],
+                         'quantity': [1., 1.],
+                         'broker': 'broker1',
+                         'currency': ['USD', 'EUR']})
+    quotes = pd.DataFrame({'date': [date(2025, 1, 2), date(2025, 1, 3), date(2025, 1, 3)],
+                           'symbol': ['AAPL', 'AAPL', 'IWDA'],
+                           'close': [12., 12., 11.]})
+    fx = MockFXFetcher(rates)
+    portfolio = PortfolioPerformance(txns, FrameQuoteFetcher(quotes), base_currency='EUR', fx_fetcher=fx)
+
+    positions = portfolio.positions()
+    assert positions.loc['AAPL', 'invested'] == 5.
+    assert positions.loc['AAPL', 'value'] == 3.
+    assert positions.loc['IWDA', 'value'] == 11.
+    valuations = portfolio.daily_valuations().set_index(['date', 'symbol'])
+    assert valuations.loc[(date(2025, 1, 2), 'AAPL'), 'value'] == 6.
+    assert portfolio.txns['price'].tolist() == [10., 10.]
+    assert fx.calls == 1
+
+    # without a base currency, nothing is converted:
+    assert PortfolioPerformance(txns, FrameQuoteFetcher(quotes)).positions().loc['AAPL', 'value'] == 12.
+    with pytest.raises(ValueError):
+        PortfolioPerformance(txns, FrameQuoteFetcher(quotes), base_currency='EUR').positions()
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from gainly.grouped import GroupedPortfolioPerformance
+from gainly.portfolio import PortfolioPerformance
+from gainly.synthetic import synthetic_ledger
+
+
+@pytest.fixture
+def fetcher(counting_fetcher):
+    return counting_fetcher
+
+
+@pytest.fixture
+def txns(fetcher):
+    return synthetic_ledger(symbols=4, years=1, trades_per_day=2, brokers=3, quote_fetcher=fetcher.upstream)
+
+
+def test_shared_quotes(txns, fetcher):
+    GroupedPortfolioPerformance(txns, fetcher).daily_valuations()
+    assert sorted(fetcher.symbols) == sorted(txns['symbol'].unique())
+
+
+@pytest.mark.parametrize('broker', [None, 'broker1'])
+@pytest.mark.parametrize('symbol', [None, 'SYM0002'])
+def test_select(txns, fetcher, broker, symbol):
+    grouped = GroupedPortfolioPerformance(txns, fetcher)
+    selection = grouped.select(broker=broker, symbol=symbol)
+
+    subset = txns[txns['broker'].isin([broker] if broker else txns['broker']) &
+                  txns['symbol'].isin([symbol] if symbol else txns['symbol'])]
+    portfolio = PortfolioPerformance(subset, fetcher)
+
+    pd.testing.assert_frame_equal(selection.positions(), portfolio.positions()[['position', 'value', 'invested', 'pl']])
+    assert selection.get_irr() == pytest.approx(portfolio.get_irr())
+    if broker:
+        # across brokers, each broker's holding is valued at its own trade price on the days it trades
+        pd.testing.assert_frame_equal(selection.daily_valuations().groupby('date')[['invested', 'value']].sum(),
+                                      portfolio.daily_valuations().groupby('date')[['invested', 'value']].sum())
+
+
+@pytest.mark.parametrize('symbol', [None, 'SYM0002'])
+def test_select_without_quotes(txns, symbol):
+    # Every group's holding is valued at the last trade price of the symbol in any group, like it is by a
+    # PortfolioPerformance of the whole ledger:
+    grouped = GroupedPortfolioPerformance(txns)
+    portfolio = PortfolioPerformance(txns[txns['symbol'].isin([symbol] if symbol else txns['symbol'])])
+    selection = grouped.select(symbol=symbol)
+
+    pd.testing.assert_frame_equal(selection.positions(), portfolio.positions()[['position', 'value', 'invested', 'pl']])
+    assert selection.get_irr() == pytest.approx(portfolio.get_irr())
+    if symbol is None:
+        pd.testing.assert_frame_equal(selection.daily_valuations().groupby('date')[['invested', 'value']].sum(),
+                                      portfolio.daily_valuations().groupby('date')[['invested', 'value']].sum())
+
+    marks = portfolio.positions().eval('value / position')
+    positions = grouped.select(broker='broker1', symbol=symbol).positions()
+    assert positions['value'].tolist() == pytest.approx((positions['position'] * marks[positions.index]).tolist())
+
+
+def test_groups(txns, fetcher):
+    grouped = GroupedPortfolioPerformance(txns, fetcher, by=['broker'])
+
+    assert list(grouped.daily_valuations().columns) == [
+        'date', 'broker', 'symbol', 'price', 'position', 'invested', 'close', 'value', 'pl']
+    assert grouped.positions().index.names == ['broker', 'symbol']
+    irr = grouped.get_irr()
+    assert list(irr.index) == ['broker0', 'broker1', 'broker2']
+    for broker, value in irr.items():
+        assert value == pytest.approx(PortfolioPerformance(txns[txns['broker'] == broker], fetcher).get_irr())
+
+
+def test_by_symbol_and_broker(txns, fetcher):
+    irr = GroupedPortfolioPerformance(txns, fetcher, by=['symbol', 'broker']).get_irr()
+
+    assert irr.index.names == ['symbol', 'broker']
+    subset = txns[(txns['symbol'] == 'SYM0001') & (txns['broker'] == 'broker2')]
+    assert irr.loc[('SYM0001', 'broker2')] == pytest.approx(PortfolioPerformance(subset, fetcher).get_irr())
@@ -0,0 +1,164 @@
+import sqlite3
+from textwrap import dedent
+
+import pandas as pd
+import pytest
+
+from gainly.db import init_db, ledger_version, bump_version
+from gainly.loader import load_csv_files, LoadStats
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'transactions.db')
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def csv(tmp_path):
+    def write(name: str, content: str) -> str:
+        path = tmp_path / name
+        path.write_text(dedent(content))
+        return str(path)
+    return write
+
+
+def test_load(conn, csv):
+    first = csv('first.csv', """\
+        trade_date,symbol,price,quantity,broker,name
+        2025-01-01 12:00:00,IWDA,1.0,1.0,broker1,iShares
+        2025-02-01 00:00:00,EUNA.DE,2.0,2.0,broker2,
+        """)
+    second = csv('second.csv', """\
+        trade_date,symbol,price,quantity,broker
+        2025-02-01 00:00:00,EUNA.DE,2.5,2.0,broker2
+        2025-03-01 13:00:00,IWDA,-3.0,3.0,broker1
+        yesterday,IWDA,3.0,3.0,broker1
+        2025-03-01 13:00:00,IWDA,3.0,3.0,broker1
+        """)
+
+    assert load_csv_files([first, second], conn, chunksize=2) == LoadStats(inserted=3, skipped=1, rejected=2)
+    assert load_csv_files([first], conn) == LoadStats(skipped=2)
+
+    txns = pd.read_sql('SELECT * FROM txn ORDER BY trade_date', conn)
+    assert list(txns['trade_date']) == ['2025-01-01 12:00:00', '2025-02-01 00:00:00', '2025-03-01 13:00:00']
+    assert list(txns['price']) == [1., 2., 3.]
+    assert list(txns['name'].fillna('')) == ['iShares', '', '']
+    assert conn.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+
+
+def test_update(conn, csv):
+    path = csv('ledger.csv', """\
+        trade_date,symbol,price,quantity,broker
+        2025-02-01 00:00:00,EUNA.DE,2.0,2.0,broker2
+        """)
+    load_csv_files([path], conn)
+    path = csv('ledger.csv', """\
+        trade_date,symbol,price,quantity,broker
+        2025-02-01 00:00:00,EUNA.DE,2.5,2.0,broker2
+        """)
+    assert load_csv_files([path], conn, on_conflict='update') == LoadStats(inserted=1)
+    assert conn.execute('SELECT price FROM txn').fetchall() == [(2.5,)]
+
+
+def test_missing_column(conn, csv):
+    path = csv('ledger.csv', """\
+        trade_date,symbol,quantity,broker
+        2025-02-01 00:00:00,EUNA.DE,2.0,broker2
+        """)
+    assert load_csv_files([path], conn) == LoadStats(rejected=1)
+
+
+def test_migrate(conn, csv):
+    conn.execute('CREATE TABLE txn (trade_date TIMESTAMP NOT NULL, symbol VARCHAR NOT NULL, quantity FLOAT NOT NULL, '
+                 'price FLOAT NOT NULL, broker VARCHAR, PRIMARY KEY (trade_date, symbol, broker))')
+    path = csv('usd.csv', """\
+        trade_date,symbol,price,quantity,broker,currency
+        2025-01-01 12:00:00,AAPL,1.0,1.0,broker1,USD
+        """)
+
+    assert load_csv_files([path], conn) == LoadStats(inserted=1)
+    assert conn.execute('SELECT currency FROM txn').fetchall() == [('USD',)]
+
+
+def test_ledger_version(conn, csv):
+    path = csv('first.csv', """\
+        trade_date,symbol,price,quantity,broker
+        2025-01-01 12:00:00,IWDA,1.0,1.0,broker1
+        """)
+    init_db(conn)
+    versions = [ledger_version(conn)]
+    load_csv_files([path], conn)
+    versions.append(ledger_version(conn))
+    load_csv_files([path], conn)
+    assert ledger_version(conn) == versions[-1]
+
+    with conn:
+        conn.execute('UPDATE txn SET price = 2.0')
+        bump_version(conn)
+    versions.append(ledger_version(conn))
+    assert len(set(versions)) == 3
+
+    with conn:
+        conn.execute('DELETE FROM txn')
+    assert ledger_version(conn) not in versions
+
+
+def test_reimport_without_broker(conn, csv):
+    path = csv('ledger.csv', """\
+        trade_date,symbol,price,quantity,broker
+        2025-01-01 12:00:00,IWDA,1.0,1.0,
+        2025-02-01 00:00:00,EUNA.DE,2.0,2.0,broker2
+        """)
+    assert load_csv_files([path], conn) == LoadStats(inserted=2)
+    assert load_csv_files([path], conn) == LoadStats(skipped=2)
+    assert conn.execute('SELECT COUNT(*) FROM txn').fetchone() == (2,)
+
+
+def test_dedupe_on_migrate(conn):
+    """Databases that hold broker-less duplicates from before the unique index lose the identical copies only."""
+    conn.execute('CREATE TABLE txn (trade_date TIMESTAMP NOT NULL, symbol VARCHAR NOT NULL, quantity FLOAT NOT NULL, '
+                 'price FLOAT NOT NULL, broker VARCHAR, PRIMARY KEY (trade_date, symbol, broker))')
+    conn.executemany('INSERT INTO txn VALUES (?, ?, ?, ?, NULL)',
+                     [('2025-01-01 12:00:00', 'IWDA', 1., 1.), ('2025-01-01 12:00:00', 'IWDA', 1., 1.),
+                      ('2025-01-02 12:00:00', 'IWDA', 1., 1.)])
+    init_db(conn)
+    assert conn.execute('SELECT trade_date FROM txn ORDER BY trade_date').fetchall() == [
+        ('2025-01-01 12:00:00',), ('2025-01-02 12:00:00',)]
+
+
+def test_conflicts_on_migrate(conn):
+    """Distinct broker-less transactions with the same key are reported rather than dropped."""
+    conn.execute('CREATE TABLE txn (trade_date TIMESTAMP NOT NULL, symbol VARCHAR NOT NULL, quantity FLOAT NOT NULL, '
+                 'price FLOAT NOT NULL, broker VARCHAR, PRIMARY KEY (trade_date, symbol, broker))')
+    conn.executemany('INSERT INTO txn VALUES (?, ?, ?, ?, NULL)',
+                     [('2025-01-01 12:00:00', 'IWDA', 1., 1.), ('2025-01-01 12:00:00', 'IWDA', 1., 2.)])
+    conn.commit()
+    with pytest.raises(ValueError, match='IWDA on 2025-01-01 12:00:00'):
+        init_db(conn)
+    conn.rollback()
+    assert conn.execute('SELECT count(*) FROM txn').fetchone() == (2,)
+
+
+@pytest.mark.parametrize('column, value', [('price', '2.5'), ('quantity', '2.0'), ('currency', 'EUR')])
+def test_ledger_version_in_place(conn, csv, column, value):
+    """Updates that keep the count and the rowids still change the version."""
+    row = {'trade_date': '2025-01-01 12:00:00', 'symbol': 'IWDA', 'price': '2.0', 'quantity': '1.0',
+           'broker': 'broker1', 'currency': 'USD'}
+    load_csv_files([csv('first.csv', ','.join(row) + '\n' + ','.join(row.values()) + '\n')], conn)
+    before = ledger_version(conn)
+    row[column] = value
+    load_csv_files([csv('second.csv', ','.join(row) + '\n' + ','.join(row.values()) + '\n')], conn,
+                   on_conflict='update')
+    assert str(conn.execute(f'SELECT {column} FROM txn').fetchone()[0]) == value
+    assert ledger_version(conn) != before
+
+
+def test_no_triggers(conn):
+    """Databases with the per-row triggers of earlier versions lose them."""
+    init_db(conn)
+    conn.execute('CREATE TRIGGER txn_insert AFTER INSERT ON txn '
+                 'BEGIN UPDATE txn_version SET version = version + 1; END')
+    init_db(conn)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall() == []
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from gainly.lots import LotTracker
+from gainly.synthetic import synthetic_ledger
+
+
+def ledger(*trades) -> pd.DataFrame:
+    return pd.DataFrame([(datetime(2025, 1, day), symbol, price, quantity, 'broker1')
+                         for day, symbol, price, quantity in trades],
+                        columns=['trade_date', 'symbol', 'price', 'quantity', 'broker'])
+
+
+txns = ledger((1, 'IWDA', 10., 10.),
+              (2, 'IWDA', 20., 10.),
+              (3, 'EUNA.DE', 5., 4.),
+              (4, 'IWDA', 30., -15.),
+              (5, 'IWDA', 40., -2.))
+
+
+@pytest.mark.parametrize('method, costs, position, cost', [
+    ('fifo', [10 * 10 + 5 * 20, 2 * 20], 3, 3 * 20),
+    ('lifo', [10 * 20 + 5 * 10, 2 * 10], 3, 3 * 10),
+    ('average', [15 * 15, 2 * 15], 3, 3 * 15),
+])
+def test_methods(method, costs, position, cost):
+    tracker = LotTracker(txns, method)
+
+    gains = tracker.realized_gains()
+    assert gains['cost'].tolist() == pytest.approx(costs)
+    assert gains['proceeds'].tolist() == pytest.approx([15 * 30, 2 * 40])
+    assert gains['gain'].tolist() == pytest.approx([15 * 30 - costs[0], 2 * 40 - costs[1]])
+
+    basis = tracker.cost_basis().set_index('symbol')
+    assert basis.loc['IWDA', 'position'] == position
+    assert basis.loc['IWDA', 'cost'] == pytest.approx(cost)
+    assert basis.loc['EUNA.DE', 'cost'] == pytest.approx(20)
+
+
+def test_oversell():
+    with pytest.raises(ValueError, match='more than the open position'):
+        LotTracker(ledger((1, 'IWDA', 10., 1.), (2, 'IWDA', 10., -2.)))
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        LotTracker(txns, 'hifo')
+
+
+@pytest.mark.parametrize('method', ['fifo', 'lifo', 'average'])
+def test_incremental(method):
+    df = synthetic_ledger(symbols=5, years=2, trades_per_day=3, brokers=2)
+    full = LotTracker(df, method, by=['symbol', 'broker'])
+
+    tracker = LotTracker(df.iloc[:1000], method, by=['symbol', 'broker'])
+    tracker.append(df.iloc[1000:2000])
+    tracker.append(df.iloc[2000:])
+    pd.testing.assert_frame_equal(tracker.realized_gains(), full.realized_gains())
+    pd.testing.assert_frame_equal(tracker.cost_basis(), full.cost_basis())
+
+    # a back-dated trade rebuilds the lots:
+    backdated = df.iloc[:1].assign(trade_date=datetime(2014, 12, 31), price=1.)
+    tracker.append(backdated)
+    full = LotTracker(pd.concat([backdated, df]), method, by=['symbol', 'broker'])
+    pd.testing.assert_frame_equal(tracker.realized_gains(), full.realized_gains())
+    pd.testing.assert_frame_equal(tracker.cost_basis(), full.cost_basis())
+
+
+def test_transfer():
+    # shares bought at one broker and sold at another:
+    transfer = ledger((1, 'IWDA', 10., 10.), (2, 'IWDA', 20., -4.)).assign(broker=['broker1', 'broker2'])
+    with pytest.raises(ValueError, match='broker2'):
+        LotTracker(transfer, by=['symbol', 'broker'])
+
+    tracker = LotTracker(transfer, by='symbol')
+    assert tracker.realized_gains()['gain'].tolist() == pytest.approx([4 * 20 - 4 * 10])
+    assert tracker.cost_basis()[['symbol', 'position', 'cost']].values.tolist() == [['IWDA', 6., 60.]]
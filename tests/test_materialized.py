@@ -0,0 +1,85 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from gainly.db import init_db
+from gainly.materialized import refresh_valuations, read_valuations, read_positions, read_checkpoint
+from gainly.portfolio import PortfolioPerformance
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+
+
+@pytest.fixture
+def fetcher():
+    return SyntheticQuoteFetcher()
+
+
+@pytest.fixture
+def conn(tmp_path, fetcher):
+    conn = sqlite3.connect(tmp_path / 'transactions.db')
+    init_db(conn)
+    insert(conn, synthetic_ledger(symbols=3, years=.5, start=date.today() - timedelta(days=200),
+                                  quote_fetcher=fetcher))
+    yield conn
+    conn.close()
+
+
+def insert(conn: sqlite3.Connection, txns: pd.DataFrame):
+    with conn:
+        txns.assign(trade_date=txns['trade_date'].dt.strftime('%Y-%m-%d %H:%M:%S')).to_sql(
+            'txn', conn, if_exists='append', index=False)
+
+
+def expected(conn: sqlite3.Connection, fetcher) -> PortfolioPerformance:
+    txns = pd.read_sql('SELECT * FROM txn ORDER BY trade_date', conn)
+    return PortfolioPerformance(txns.assign(trade_date=pd.to_datetime(txns['trade_date'])), fetcher)
+
+
+def test_refresh(conn, fetcher):
+    stats = refresh_valuations(conn, fetcher)
+    assert stats.full
+    portfolio = expected(conn, fetcher)
+    pd.testing.assert_frame_equal(read_valuations(conn), portfolio.daily_valuations())
+    pd.testing.assert_frame_equal(read_positions(conn), portfolio.positions())
+    assert read_checkpoint(conn).as_of == stats.as_of
+
+    # Nothing changed:
+    assert not refresh_valuations(conn, fetcher).full
+
+    # New trades extend the table:
+    today = datetime.combine(date.today(), datetime.min.time())
+    insert(conn, pd.DataFrame({'trade_date': [today + timedelta(hours=10)], 'symbol': ['SYM0001'], 'price': [10.],
+                               'quantity': [1.], 'broker': 'broker0'}))
+    assert not refresh_valuations(conn, fetcher).full
+    pd.testing.assert_frame_equal(read_valuations(conn), expected(conn, fetcher).daily_valuations())
+
+    # A new symbol rebuilds it, as its quotes from before the checkpoint add to the history:
+    insert(conn, pd.DataFrame({'trade_date': [today + timedelta(hours=11)], 'symbol': ['NEW'], 'price': [20.],
+                               'quantity': [2.], 'broker': 'broker0'}))
+    assert refresh_valuations(conn, fetcher).full
+    pd.testing.assert_frame_equal(read_valuations(conn), expected(conn, fetcher).daily_valuations())
+
+    # A back-dated trade rebuilds it:
+    insert(conn, pd.DataFrame({'trade_date': [today - timedelta(days=100)], 'symbol': ['SYM0002'], 'price': [1.],
+                               'quantity': [1.], 'broker': 'broker0'}))
+    assert refresh_valuations(conn, fetcher).full
+    pd.testing.assert_frame_equal(read_valuations(conn), expected(conn, fetcher).daily_valuations())
+
+
+def test_quote_source(conn, fetcher):
+    # Switching between trade prices only and quotes rebuilds the table, either way:
+    for quotes in [None, fetcher, None]:
+        assert refresh_valuations(conn, quotes).full
+        pd.testing.assert_frame_equal(read_valuations(conn), expected(conn, quotes).daily_valuations())
+        assert not refresh_valuations(conn, quotes).full
+
+
+def test_range(conn, fetcher):
+    refresh_valuations(conn, fetcher)
+    date_from, date_to = date.today() - timedelta(days=30), date.today() - timedelta(days=10)
+
+    df = read_valuations(conn, date_from, date_to, symbol='SYM0001')
+    assert set(df['symbol']) == {'SYM0001'}
+    assert df['date'].between(date_from, date_to).all()
+    assert len(df) == len(pd.bdate_range(date_from, date_to))
@@ -2,6 +2,7 @@ from collections import namedtuple
 from datetime import datetime, date
 from io import StringIO
 from textwrap import dedent
+from unittest.mock import Mock
 
 import pandas as pd
 import pandera.pandas as pa
@@ -161,6 +162,32 @@ class TestPortfolioPerformance:
         result = portfolio.positions()
         pd.testing.assert_frame_equal(result, expected)
 
+    def test_lazy_quotes(self, transactions):
+        fetcher = MockQuoteFetcher()
+        fetcher.get_eod_prices_many = Mock(wraps=fetcher.get_eod_prices_many)
+
+        portfolio = PortfolioPerformance(transactions, fetcher)
+        fetcher.get_eod_prices_many.assert_not_called()
+
+        portfolio.daily_valuations()
+        portfolio.daily_positions()
+        fetcher.get_eod_prices_many.assert_called_once()
+
+    def test_memoization(self, transactions):
+        portfolio = PortfolioPerformance(transactions, MockQuoteFetcher())
+        valuations = portfolio.daily_valuations()
+        valuations['value'] = 0.
+
+        # Callers get copies of the memoized frames:
+        assert portfolio.daily_valuations()['value'].max() == 20.
+        assert portfolio.positions()['value'].sum() == 22.
+        assert portfolio.daily_valuations() is not portfolio.daily_valuations()
+
+        # Assigning new transactions invalidates everything:
+        portfolio.txns = transactions[transactions['symbol'] == 'IWDA']
+        assert list(portfolio.positions().index) == ['IWDA']
+        assert list(portfolio.eod_prices['symbol'].unique()) == ['IWDA']
+
 
 Trade = namedtuple('Trade', ['trade_date', 'price', 'quantity'])
 
@@ -204,3 +231,63 @@ class TestIRR:
                         .pipe(DataFrame[TransactionSchema]))
         portfolio = PortfolioPerformance(transactions)
         assert portfolio.get_irr() == pytest.approx(expected)
+
+
+class TestIncremental:
+    @pytest.fixture
+    def transactions(self):
+        return pd.DataFrame({
+            'trade_date': [datetime(2025, 1, 1, hour=12),
+                           datetime(2025, 2, 1),
+                           datetime(2025, 3, 1, hour=13),
+                           datetime(2025, 3, 1, hour=13),
+                           datetime(2025, 3, 1, hour=13)],
+            'symbol': ['IWDA', 'IWDA', 'EUNA.DE', 'IWDA', 'IWDA'],
+            'price': [1, 2, 1, 1, 3],
+            'quantity': [1, 2, 1, 1, 3],
+            'broker': ['broker1', 'broker2', 'broker2', 'broker1', 'broker1']
+        })
+
+    @pytest.mark.parametrize('engine', ['pandas', 'numpy'])
+    @pytest.mark.parametrize('as_of', [date(2025, 1, 1), date(2025, 1, 15), date(2025, 2, 1)])
+    def test_resume(self, transactions, engine, as_of):
+        # Every symbol is known at the checkpoint:
+        transactions.loc[5] = [datetime(2025, 1, 1, hour=9), 'EUNA.DE', 1, 1, 'broker2']
+        transactions = transactions.sort_values('trade_date', kind='stable').reset_index(drop=True)
+        fetcher = MockQuoteFetcher()
+        old = PortfolioPerformance(transactions[transactions['trade_date'].dt.date <= as_of], fetcher, engine=engine)
+        checkpoint = old.checkpoint(as_of)
+
+        fetcher.get_eod_prices_many = Mock(wraps=fetcher.get_eod_prices_many)
+        portfolio = PortfolioPerformance(transactions, fetcher, engine=engine)
+        result = portfolio.resume_from(checkpoint)
+
+        # Only the quotes after the checkpoint were requested:
+        assert fetcher.get_eod_prices_many.call_args.kwargs['date_from'] > as_of
+        expected = PortfolioPerformance(transactions, MockQuoteFetcher(), engine=engine).daily_valuations()
+        pd.testing.assert_frame_equal(result, expected)
+        pd.testing.assert_frame_equal(portfolio.positions(),
+                                      expected.groupby('symbol')[['position', 'value', 'invested', 'pl']].last())
+
+    @pytest.mark.parametrize('engine', ['pandas', 'numpy'])
+    def test_new_symbol(self, transactions, engine):
+        """The quotes of a symbol first traded after the checkpoint add to the history, which is recomputed."""
+        fetcher = MockQuoteFetcher()
+        fetcher.prices = pd.concat([fetcher.prices, pd.DataFrame({'date': [date(2025, 1, 20)], 'symbol': ['EUNA.DE'],
+                                                                  'close': [1.5]})], ignore_index=True)
+        checkpoint = PortfolioPerformance(transactions.iloc[:2], fetcher, engine=engine).checkpoint(date(2025, 2, 1))
+
+        portfolio = PortfolioPerformance(transactions, fetcher, engine=engine)
+        assert not portfolio.matches(checkpoint)
+        expected = PortfolioPerformance(transactions, fetcher, engine=engine).daily_valuations()
+        pd.testing.assert_frame_equal(portfolio.resume_from(checkpoint), expected)
+        assert expected.loc[expected['date'] == date(2025, 1, 20), 'close'].fillna(-1).tolist() == [1.5, -1]
+
+    def test_back_dated(self, transactions):
+        fetcher = MockQuoteFetcher()
+        checkpoint = PortfolioPerformance(transactions.iloc[:2], fetcher).checkpoint(date(2025, 2, 1))
+        transactions.loc[5] = [datetime(2025, 1, 2), 'EUNA.DE', 1, 1, 'broker1']
+
+        result = PortfolioPerformance(transactions, fetcher).resume_from(checkpoint)
+        pd.testing.assert_frame_equal(result, PortfolioPerformance(transactions, fetcher).daily_valuations())
+        assert result[result['symbol'] == 'EUNA.DE']['position'].iloc[-1] == 2
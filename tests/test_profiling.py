@@ -0,0 +1,100 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+
+from gainly.portfolio import PortfolioPerformance
+from gainly.profiling import Recorder, recording, span, profiled, in_context, active
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+from gainly.validation import validation_mode
+
+
+@pytest.fixture
+def portfolio():
+    fetcher = SyntheticQuoteFetcher()
+    return PortfolioPerformance(synthetic_ledger(symbols=3, years=1, start=date(2020, 1, 1), quote_fetcher=fetcher),
+                                fetcher)
+
+
+def test_nested_spans():
+    with recording() as recorder:
+        assert active()
+        with span('outer', kind='test'):
+            with span('inner') as s:
+                s.rows = 42
+            with span('inner'):
+                pass
+    assert not active()
+
+    summary = recorder.summary()
+    assert list(summary['name']) == ['outer', 'inner', 'inner']
+    assert list(summary['parent'].fillna(-1)) == [-1, 0, 0]
+    assert list(summary['depth']) == [0, 1, 1]
+    assert summary.loc[1, 'rows'] == 42
+    assert summary.loc[0, 'attrs'] == {'kind': 'test'}
+    assert summary.loc[0, 'self_seconds'] == pytest.approx(
+        summary.loc[0, 'seconds'] - summary.loc[1:, 'seconds'].sum())
+
+    totals = recorder.totals()
+    assert totals.loc['inner', 'calls'] == 2
+    assert totals.loc['inner', 'rows'] == 42
+
+
+def test_disabled():
+    @profiled('noop')
+    def fn():
+        with span('inner') as s:
+            s.rows = 1
+        return 'result'
+
+    assert fn() == 'result'
+    recorder = Recorder()
+    assert recorder.spans == []
+    with recorder:
+        assert fn() == 'result'
+    assert fn() == 'result'
+    assert [s.name for s in recorder.spans] == ['noop', 'inner']
+
+
+def test_threads():
+    def work(i: int) -> int:
+        with span('task', i=i):
+            return i
+
+    with recording() as recorder, span('pool'):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            assert list(executor.map(in_context(work), range(8))) == list(range(8))
+
+    tasks = [s for s in recorder.spans if s.name == 'task']
+    assert len(tasks) == 8
+    assert all(s.parent == 0 and s.depth == 1 for s in tasks)
+
+
+def test_to_json():
+    with recording(memory=True) as recorder, span('allocate', day=date(2025, 1, 1)) as s:
+        s.rows = len([0] * 100_000)
+
+    spans = json.loads(recorder.to_json())
+    assert spans[0]['name'] == 'allocate'
+    assert spans[0]['rows'] == 100_000
+    assert spans[0]['attrs'] == {'day': '2025-01-01'}
+    assert spans[0]['memory'] is not None
+
+
+def test_portfolio(portfolio):
+    with validation_mode('full'), recording() as recorder:
+        portfolio.positions()
+        portfolio.get_irr()
+
+    summary = recorder.summary()
+    names = set(summary['name'])
+    assert {'portfolio.positions', 'portfolio.daily_valuations', 'portfolio.fetch_quotes', 'portfolio.cashflows',
+            'portfolio.get_irr', 'pandas.merge_quotes', 'pandas.ffill',
+            'validate PortfolioPerformance.daily_valuations'} <= names
+
+    # Memoized results are not recorded again:
+    valuations = summary[summary['name'] == 'portfolio.daily_valuations']
+    assert len(valuations) == 1
+    assert valuations['rows'].iloc[0] == len(portfolio.daily_valuations())
+    assert (summary['self_seconds'] >= -1e-6).all()
@@ -0,0 +1,81 @@
+import sqlite3
+from collections import Counter
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+import gainly.__main__
+from gainly.db import init_db
+from gainly.portfolio import PortfolioPerformance
+from gainly.report import report
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+
+
+@pytest.fixture
+def ledgers(tmp_path) -> dict[str, pd.DataFrame]:
+    """Three ledgers with overlapping symbols, an empty one and one that is not a ledger at all."""
+    fetcher = SyntheticQuoteFetcher()
+    ledgers = {}
+    for i, symbols in enumerate([2, 3, 4]):
+        txns = synthetic_ledger(symbols=symbols, years=.5, start=date.today() - timedelta(days=300 - 50 * i),
+                                seed=i, quote_fetcher=fetcher)
+        ledgers[str(tmp_path / f'ledger{i}.db')] = txns
+    ledgers[str(tmp_path / 'empty.db')] = None
+    ledgers[str(tmp_path / 'broken.db')] = None
+
+    for path, txns in ledgers.items():
+        with sqlite3.connect(path) as conn:
+            if txns is not None:
+                init_db(conn)
+                txns.assign(trade_date=txns['trade_date'].dt.strftime('%Y-%m-%d %H:%M:%S')).to_sql(
+                    'txn', conn, if_exists='append', index=False)
+            elif 'empty' in path:
+                init_db(conn)
+    return ledgers
+
+
+@pytest.mark.parametrize('max_workers', [None, 2])
+def test_report(ledgers, counting_fetcher, max_workers):
+    results = report(list(ledgers), counting_fetcher, max_workers=max_workers)
+
+    # Every symbol is fetched once, for all ledgers:
+    requests = Counter(counting_fetcher.symbols)
+    assert set(requests.values()) == {1}
+    assert set(requests) == {'SYM0000', 'SYM0001', 'SYM0002', 'SYM0003'}
+
+    irr = results['irr'].set_index('ledger')
+    assert list(irr.index) == list(ledgers)
+    assert irr['error'].notna().tolist() == [False, False, False, False, True]
+
+    for path, txns in ledgers.items():
+        if txns is None:
+            assert pd.isna(irr.loc[path, 'irr'])
+            continue
+        expected = PortfolioPerformance(txns.assign(trade_date=txns['trade_date'].dt.floor('s')),
+                                        SyntheticQuoteFetcher())
+        valuations = results['valuations']
+        pd.testing.assert_frame_equal(valuations[valuations['ledger'] == path].drop(columns='ledger')
+                                      .reset_index(drop=True), expected.daily_valuations())
+        positions = results['positions']
+        pd.testing.assert_frame_equal(positions[positions['ledger'] == path].drop(columns='ledger')
+                                      .set_index('symbol'), expected.positions())
+        assert irr.loc[path, 'irr'] == pytest.approx(expected.get_irr())
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_cli(ledgers, tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(gainly.__main__, 'YahooFinance', SyntheticQuoteFetcher)
+    paths = [path for path, txns in ledgers.items() if txns is not None]
+    output = tmp_path / 'out'
+
+    assert gainly.__main__.main(['report', *paths, '--output', str(output), '--format', fmt, '--workers', '0',
+                                 '--quotes', str(tmp_path / 'quotes.db')]) == 0
+    read = pd.read_parquet if fmt == 'parquet' else pd.read_csv
+    assert read(output / f'irr.{fmt}')['ledger'].tolist() == paths
+    assert set(read(output / f'valuations.{fmt}')['ledger']) == set(paths)
+    assert set(read(output / f'positions.{fmt}').columns) == {'ledger', 'symbol', 'position', 'value', 'invested',
+                                                               'pl'}
+
+    assert gainly.__main__.main(['report', *ledgers, '--output', str(output), '--workers', '0',
+                                 '--quotes', str(tmp_path / 'quotes.db')]) == 1
@@ -0,0 +1,82 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+from pyxirr import xirr
+
+from gainly.portfolio import PortfolioPerformance
+from gainly.returns import flows, time_weighted, money_weighted
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+
+
+def days(*dates) -> np.ndarray:
+    return np.array(dates, dtype='datetime64[D]')
+
+
+def test_time_weighted():
+    dates = days('2025-01-01', '2025-01-02', '2025-01-03', '2025-01-04')
+    # buy 100, grows 10%, add 110, grows 10%:
+    value = np.array([100., 110., 220., 242.])
+    flow = np.array([100., 0., 110., 0.])
+
+    assert time_weighted(dates, value, flow) == pytest.approx([0., .1, .1, .21])
+    assert time_weighted(dates, value, flow, window='2D') == pytest.approx([np.nan, np.nan, .1, .1], nan_ok=True)
+
+
+def test_money_weighted():
+    dates = days('2024-01-01', '2024-07-01', '2025-01-01')
+    value = np.array([100., 150., 240.])
+    flow = np.array([100., 50., 0.])
+
+    irr = money_weighted(dates, value, flow)
+    assert np.isnan(irr[0])
+    for i in (1, 2):
+        cashflows = pd.DataFrame({'date': dates[:i + 1], 'cf': -flow[:i + 1]})
+        cashflows.loc[i, 'cf'] += value[i]
+        assert irr[i] == pytest.approx(xirr(cashflows))
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    fetcher = SyntheticQuoteFetcher()
+    return PortfolioPerformance(synthetic_ledger(symbols=5, years=3, start=date(2020, 1, 1), quote_fetcher=fetcher),
+                                fetcher)
+
+
+@pytest.mark.parametrize('chunksize', [1, 100, 10_000])
+def test_since_inception(portfolio, chunksize):
+    df = flows(portfolio.daily_valuations())
+    dates = pd.to_datetime(df['date']).to_numpy()
+    irr = money_weighted(dates, df['value'].to_numpy(), df['flow'].to_numpy(), chunksize=chunksize)
+
+    assert irr[-1] == pytest.approx(portfolio.get_irr())
+    for i in (50, 400, 700):
+        cashflows = pd.DataFrame({'date': df['date'][:i + 1], 'cf': -df['flow'][:i + 1]})
+        cashflows.loc[i, 'cf'] += df['value'][i]
+        assert irr[i] == pytest.approx(xirr(cashflows[cashflows['cf'] != 0]))
+
+
+def test_rolling(portfolio):
+    df = flows(portfolio.daily_valuations())
+    returns = portfolio.returns(window='365D')
+
+    i = 600
+    start = df.index[pd.to_datetime(df['date']) <= pd.Timestamp(df['date'][i]) - pd.Timedelta('365D')][-1]
+    cashflows = pd.DataFrame({'date': df['date'][start:i + 1], 'cf': -df['flow'][start:i + 1]})
+    cashflows.loc[start, 'cf'] = -df['value'][start]
+    cashflows.loc[i, 'cf'] += df['value'][i]
+    assert returns['irr'][i] == pytest.approx(xirr(cashflows))
+    first_year = pd.to_datetime(df['date']) < pd.Timestamp(df['date'][0]) + pd.Timedelta('365D')
+    assert returns[first_year][['twr', 'irr']].isna().all().all()
+    assert returns['twr'][i] == pytest.approx(
+        (1 + portfolio.returns()['twr'][i]) / (1 + portfolio.returns()['twr'][start]) - 1)
+
+
+def test_per_symbol(portfolio):
+    returns = portfolio.returns(per_symbol=True)
+    txns = portfolio.txns
+
+    for symbol in ('SYM0000', 'SYM0003'):
+        expected = PortfolioPerformance(txns[txns['symbol'] == symbol], portfolio.quote_fetcher).get_irr()
+        assert returns[returns['symbol'] == symbol]['irr'].iloc[-1] == pytest.approx(expected)
@@ -0,0 +1,81 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gainly.portfolio import PortfolioPerformance
+from gainly.scenarios import simulate, bootstrap
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+
+
+@pytest.fixture(scope='module')
+def portfolio():
+    fetcher = SyntheticQuoteFetcher()
+    return PortfolioPerformance(synthetic_ledger(symbols=4, years=1, start=date(2021, 1, 1), quote_fetcher=fetcher),
+                                fetcher)
+
+
+@pytest.fixture(scope='module')
+def axes(portfolio):
+    dates = pd.bdate_range('2021-06-01', '2022-06-30')
+    return dates, sorted(portfolio.txns['symbol'].unique())
+
+
+def test_actual_prices(portfolio, axes):
+    """The scenario of the prices the valuations are marked at reproduces the valuations and the IRR."""
+    dates, symbols = axes
+    valuations = portfolio.daily_valuations()
+    valuations = valuations[pd.to_datetime(valuations['date']).isin(dates)]
+    position = valuations.pivot(index='date', columns='symbol', values='position').fillna(0)
+    mark = valuations.pivot(index='date', columns='symbol', values='value') / position.where(position != 0)
+    prices = np.repeat(mark.fillna(1.).to_numpy()[None], 3, axis=0)
+
+    result = simulate(portfolio, prices, dates, symbols, chunksize=2)
+    assert result.value.shape == result.pl.shape == (3, len(dates))
+    np.testing.assert_allclose(result.value[1], valuations.groupby('date')['value'].sum())
+    np.testing.assert_allclose(result.pl[2], valuations.groupby('date')['pl'].sum())
+
+    current = PortfolioPerformance(portfolio.txns, portfolio.quote_fetcher)
+    current.eod_prices = current.eod_prices[pd.to_datetime(current.eod_prices['date']) <= dates[-1]]
+    np.testing.assert_allclose(result.irr, current.get_irr())
+
+
+def test_bootstrap(portfolio, axes):
+    dates, symbols = axes
+    paths = bootstrap(portfolio.eod_prices, dates, symbols, scenarios=50, seed=1)
+    assert paths.shape == (50, len(dates), len(symbols))
+    assert np.isfinite(paths).all() and (paths > 0).all()
+
+    closes = portfolio.eod_prices.assign(date=pd.to_datetime(portfolio.eod_prices['date']))
+    first = closes[closes['date'] == dates[0]].set_index('symbol')['close'].reindex(symbols)
+    np.testing.assert_allclose(paths[:, 0], np.tile(first, (50, 1)))
+    np.testing.assert_array_equal(paths, bootstrap(portfolio.eod_prices, dates, symbols, scenarios=50, seed=1))
+    assert not np.array_equal(paths[0], paths[1])
+
+
+def test_chunks(portfolio, axes):
+    dates, symbols = axes
+    paths = bootstrap(portfolio.eod_prices, dates, symbols, scenarios=20)
+
+    expected = simulate(portfolio, paths, dates, symbols)
+    for result in (simulate(portfolio, paths, dates, symbols, chunksize=3),
+                   simulate(portfolio, paths, dates, symbols, chunksize=7, max_workers=2)):
+        np.testing.assert_allclose(result.value, expected.value)
+        np.testing.assert_allclose(result.pl, expected.pl)
+        np.testing.assert_allclose(result.irr, expected.irr)
+
+    quantiles = expected.quantiles([.1, .9])
+    assert list(quantiles.columns) == [('value', .1), ('value', .9), ('pl', .1), ('pl', .9)]
+    assert (quantiles[('value', .1)] <= quantiles[('value', .9)]).all()
+
+
+def test_invalid(portfolio, axes):
+    dates, symbols = axes
+    paths = bootstrap(portfolio.eod_prices, dates, symbols, scenarios=2)
+    with pytest.raises(ValueError, match='shape'):
+        simulate(portfolio, paths[:, 1:], dates, symbols)
+    with pytest.raises(ValueError, match='ascending'):
+        simulate(portfolio, paths, dates[::-1], symbols)
+    with pytest.raises(ValueError, match='held symbols'):
+        simulate(portfolio, paths[:, :, 1:], dates, symbols[1:])
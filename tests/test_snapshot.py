@@ -0,0 +1,79 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gainly.engine import ENGINES
+from gainly.eod import NullQuoteFetcher
+from gainly.portfolio import PortfolioPerformance
+from gainly.profiling import recording
+from tests.test_engine import random_inputs
+
+DATES = [date(2019, 6, 1),      # before the first trade
+         date(2020, 1, 6),      # the first trade
+         date(2020, 3, 7),      # a Saturday
+         date(2020, 3, 9),
+         date(2021, 2, 28),
+         date(2021, 12, 31),    # the last quote
+         date(2030, 1, 1)]      # after the grid
+
+
+def expected(valuations: pd.DataFrame, as_of: date) -> pd.DataFrame:
+    """The positions of the last daily valuation on or before a date, of the symbols traded by then."""
+    df = valuations[(valuations['date'] <= as_of) & valuations['position'].notna()]
+    return df.groupby('symbol')[['position', 'value', 'invested', 'pl']].last()
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('quotes', [False, True])
+def test_as_of(engine, quotes):
+    txns, fetcher = random_inputs()
+    portfolio = PortfolioPerformance(txns, fetcher if quotes else NullQuoteFetcher(), engine)
+    valuations = portfolio.daily_valuations()
+
+    for as_of in DATES:
+        pd.testing.assert_frame_equal(portfolio.positions_as_of(as_of), expected(valuations, as_of),
+                                      check_index_type=False)
+    pd.testing.assert_frame_equal(portfolio.positions_as_of(date.today()), portfolio.positions())
+
+
+def test_many():
+    txns, fetcher = random_inputs()
+    portfolio = PortfolioPerformance(txns, fetcher)
+    dates = DATES[::-1]
+
+    with recording() as recorder:
+        snapshot = portfolio.positions_as_of_many(dates)
+    assert 'portfolio.daily_valuations' not in set(recorder.summary()['name'])
+
+    assert list(pd.unique(snapshot['date'])) == [date(2030, 1, 1), date(2021, 12, 31), date(2021, 2, 28),
+                                                 date(2020, 3, 9), date(2020, 3, 7), date(2020, 1, 6)]
+    for as_of, df in snapshot.groupby('date'):
+        pd.testing.assert_frame_equal(df.drop(columns='date').set_index('symbol'), portfolio.positions_as_of(as_of))
+
+    # Timestamps are truncated to their date:
+    pd.testing.assert_frame_equal(portfolio.positions_as_of_many([datetime(2020, 3, 9, 15, 30)]),
+                                  portfolio.positions_as_of_many([date(2020, 3, 9)]))
+
+
+def test_compact():
+    txns, fetcher = random_inputs()
+    expected = PortfolioPerformance(txns, fetcher).positions_as_of_many(DATES)
+    snapshot = PortfolioPerformance(txns, fetcher, dtypes='compact').positions_as_of_many(DATES)
+
+    assert isinstance(snapshot['symbol'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(snapshot.assign(date=snapshot['date'].dt.date,
+                                                  symbol=snapshot['symbol'].astype(object)), expected)
+
+
+def test_invalidate():
+    txns, fetcher = random_inputs()
+    portfolio = PortfolioPerformance(txns, fetcher)
+    before = portfolio.positions_as_of(date(2021, 6, 1))
+
+    portfolio.eod_prices = portfolio.eod_prices.assign(close=portfolio.eod_prices['close'] * 2)
+    after = portfolio.positions_as_of(date(2021, 6, 1))
+    np.testing.assert_array_equal(after['position'], before['position'])
+    assert (after['value'] != before['value']).any()
+
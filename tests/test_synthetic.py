@@ -0,0 +1,29 @@
+from datetime import date
+
+import pandas as pd
+
+from gainly.portfolio import PortfolioPerformance, TransactionSchema
+from gainly.synthetic import SyntheticQuoteFetcher, synthetic_ledger
+
+
+def test_synthetic_ledger():
+    txns = synthetic_ledger(symbols=20, years=2, trades_per_day=5, brokers=3, seed=1)
+
+    TransactionSchema.validate(txns)
+    pd.testing.assert_frame_equal(txns, synthetic_ledger(symbols=20, years=2, trades_per_day=5, brokers=3, seed=1))
+    assert txns['symbol'].nunique() == 20
+    assert txns['broker'].nunique() == 3
+    assert (txns['quantity'] < 0).any()
+    assert (txns.groupby(['symbol', 'broker'])['quantity'].cumsum() >= 0).all()
+    assert PortfolioPerformance(txns, SyntheticQuoteFetcher(seed=1)).positions()['position'].min() >= 0
+
+
+def test_synthetic_quotes():
+    fetcher = SyntheticQuoteFetcher()
+    long = fetcher.get_oed_prices('IWDA', date(2020, 1, 1), date(2020, 3, 31))
+    short = fetcher.get_oed_prices('IWDA', date(2020, 2, 3), date(2020, 2, 7))
+
+    assert list(short['date']) == [date(2020, 2, d) for d in range(3, 8)]
+    pd.testing.assert_frame_equal(short, long[long['date'].between(date(2020, 2, 3), date(2020, 2, 7))]
+                                  .reset_index(drop=True))
+    assert not fetcher.get_oed_prices('EUNA.DE', date(2020, 1, 1), date(2020, 3, 31))['close'].equals(long['close'])
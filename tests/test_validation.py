@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import pandera.errors
+import pytest
+
+from gainly.engine import PandasEngine
+from gainly.portfolio import PortfolioPerformance
+from gainly.validation import validation_mode, MODES, set_validation_mode
+from tests.test_portfolio import MockQuoteFetcher
+
+
+def ledger(symbols: int, trades: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'trade_date': [datetime(2020, 1, 1) + timedelta(hours=int(h)) for h in rng.integers(0, 24 * 1500, trades)],
+        'symbol': rng.choice([f'SYM{i}' for i in range(symbols)], trades),
+        'price': rng.uniform(1, 100, trades),
+        'quantity': rng.integers(1, 10, trades).astype(float),
+        'broker': 'broker'})
+
+
+@pytest.fixture
+def transactions():
+    return ledger(symbols=5, trades=50)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_modes_agree(transactions, mode):
+    expected = PortfolioPerformance(transactions, MockQuoteFetcher()).daily_valuations()
+    with validation_mode(mode):
+        result = PortfolioPerformance(transactions, MockQuoteFetcher()).daily_valuations()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_boundary(transactions, monkeypatch):
+    invalid = transactions.assign(price=-1.)
+    with validation_mode('boundary'), pytest.raises(pandera.errors.SchemaError):
+        PortfolioPerformance(invalid)
+
+    # Internal frames are trusted:
+    engine = PandasEngine()
+    monkeypatch.setattr(engine, 'daily_positions', lambda txns, eod: txns)
+    PortfolioPerformance(transactions, engine=engine, validation='boundary').daily_positions()
+    with pytest.raises(pandera.errors.SchemaError):
+        PortfolioPerformance(transactions, engine=engine, validation='full').daily_positions()
+
+
+def test_sample(transactions):
+    with validation_mode('sample', sample_size=10), pytest.raises(pandera.errors.SchemaError):
+        PortfolioPerformance(transactions.assign(price=-1.))
+
+
+@pytest.mark.parametrize('mode', ['full', 'sample'])
+def test_coerce(transactions, mode):
+    # Sample mode checks only some rows, but coerces all of them:
+    mistyped = transactions.assign(quantity=transactions['quantity'].astype(int),
+                                   price=transactions['price'].astype(str))
+    expected = PortfolioPerformance(transactions, MockQuoteFetcher()).daily_valuations()
+    with validation_mode(mode, sample_size=10):
+        portfolio = PortfolioPerformance(mistyped, MockQuoteFetcher())
+        assert portfolio.txns['quantity'].dtype == float
+        pd.testing.assert_frame_equal(portfolio.daily_valuations(), expected)
+
+
+def test_off(transactions):
+    PortfolioPerformance(transactions.assign(price=-1.), validation='off')
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        set_validation_mode('sometimes')
+
+
+def test_overhead():
+    """Measures the overhead of each validation mode on a large ledger (run with -s to see the numbers)."""
+    transactions = ledger(symbols=200, trades=5000)
+    timings = {}
+    for mode in MODES:
+        with validation_mode(mode):
+            start = perf_counter()
+            portfolio = PortfolioPerformance(transactions)
+            portfolio.daily_positions()
+            portfolio.daily_valuations()
+            portfolio.positions()
+            timings[mode] = perf_counter() - start
+
+    print()
+    for mode, seconds in timings.items():
+        print(f'{mode:>8}: {seconds:.3f}s ({seconds / timings["off"]:.1f}x)')
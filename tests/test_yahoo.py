@@ -0,0 +1,132 @@
+import json
+import threading
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+
+from gainly.profiling import recording
+from gainly.validation import validation_mode
+from gainly.yahoo import YahooFinance, to_epoch
+
+
+class StubChartHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server: StubYahooServer = self.server
+        symbol = urlparse(self.path).path.rsplit('/', 1)[-1]
+        with server.lock:
+            server.requests.append((symbol, self.client_address))
+            fail = server.failures.get(symbol, 0)
+            server.failures[symbol] = max(fail - 1, 0)
+
+        if fail:
+            body, status = b'{}', 503
+        else:
+            body, status = json.dumps(server.payload(symbol)).encode(), 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubYahooServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubChartHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.failures = {}
+
+    @staticmethod
+    def payload(symbol: str) -> dict:
+        # Bars are stamped at the market open, 09:00 in UTC+1:
+        timestamps = [int(datetime(2025, 1, d, 8, tzinfo=timezone.utc).timestamp()) for d in (2, 3, 6)]
+        return {'chart': {'result': [{
+            'meta': {'gmtoffset': 3600},
+            'timestamp': timestamps,
+            'indicators': {'quote': [{'close': [1., None, float(len(symbol))]}]}}]}}
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+@pytest.fixture
+def server():
+    server = StubYahooServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': .05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_oed_prices(server):
+    df = YahooFinance(base_url=server.url).get_oed_prices('IWDA', date(2025, 1, 1), date(2025, 1, 31))
+    assert list(df['date']) == [date(2025, 1, 2), date(2025, 1, 3), date(2025, 1, 6)]
+    assert list(df['close'].fillna(-1)) == [1., -1, 4.]
+
+
+def test_get_eod_prices_many(server):
+    symbols = [f'SYM{i}' for i in range(20)]
+    yahoo = YahooFinance(max_workers=4, rate=None, backoff=0, base_url=server.url)
+    df = yahoo.get_eod_prices_many(symbols, date(2025, 1, 1), date(2025, 1, 31))
+
+    assert sorted(df['symbol'].unique()) == sorted(symbols)
+    assert len(df) == 3 * len(symbols)
+    # Connections are kept alive and pooled:
+    assert len({addr for _, addr in server.requests}) <= 4
+
+
+def test_boundary_validation(server):
+    # The batch is validated once, not again by the pool threads fetching its symbols:
+    yahoo = YahooFinance(max_workers=4, rate=None, base_url=server.url)
+    with validation_mode('boundary'), recording() as recorder:
+        yahoo.get_eod_prices_many([f'SYM{i}' for i in range(8)], date(2025, 1, 1), date(2025, 1, 31))
+    assert [name for name in recorder.summary()['name'] if name.startswith('validate')] == \
+           ['validate YahooFinance.get_eod_prices_many']
+
+
+def test_retry(server):
+    server.failures['IWDA'] = 2
+    df = YahooFinance(rate=None, backoff=0, base_url=server.url).get_eod_prices_many(
+        ['IWDA'], date(2025, 1, 1), date(2025, 1, 31))
+
+    assert len(df) == 3
+    assert [symbol for symbol, _ in server.requests] == ['IWDA'] * 3
+
+
+def test_rate_limit(server):
+    yahoo = YahooFinance(rate=50, base_url=server.url)
+    start = datetime.now()
+    yahoo.get_eod_prices_many([f'SYM{i}' for i in range(6)], date(2025, 1, 1), date(2025, 1, 31))
+    assert (datetime.now() - start).total_seconds() >= 5 / 50
+
+
+def test_to_epoch():
+    assert to_epoch(date(2025, 1, 1)) == int(datetime(2025, 1, 1, 23, 59, 59, tzinfo=timezone.utc).timestamp())
+
+
+def test_decode():
+    # A bar stamped 23:30 UTC falls on the next day in UTC+1, and on the same day in UTC-5:
+    timestamps = [int(datetime(2025, 1, d, 23, 30, tzinfo=timezone.utc).timestamp()) for d in (2, 3)]
+    for gmtoffset, days in [(3600, [3, 4]), (-18000, [2, 3])]:
+        df = YahooFinance._decode({'chart': {'result': [{
+            'meta': {'gmtoffset': gmtoffset},
+            'timestamp': timestamps,
+            'indicators': {'quote': [{'close': [None, 2.]}]}}]}}, 'IWDA')
+        assert list(df['date']) == [date(2025, 1, d) for d in days]
+        assert df['close'].isna().tolist() == [True, False]
+        assert (df['symbol'] == 'IWDA').all()
+
+    # A range without any bars:
+    assert YahooFinance._decode({'chart': {'result': [{
+        'meta': {'gmtoffset': 0}, 'indicators': {'quote': [{}]}}]}}, 'IWDA').empty